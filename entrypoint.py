@@ -1,21 +1,24 @@
 import argparse
 import os
-from metadata_utils import tag_features, link_schema_features
-from evaluation.execution_evaluate import (
-    evaluate_execution, convert_dataset_to_dicts, output_results_to_csv
-)
-from other_utils.deserialize_db_model import deserialize_db_schema_model
-from metadata_utils.fetch_schema_features import analyze_directory
-from evaluation.plot.plot_exec_accuracies import plot as plot_exec
-from evaluation.plot.plot_partial_accuracies import plot as plot_partial
-from evaluation.structural_evaluate import evaluate_dataset
-from evaluation.average_partial_accuracies import aggregate_results_by_clause
+
+# Each pipeline imports its own dependencies when it runs, so `exec` never loads the structural parser and
+# `component` never loads the execution/postgres stack; the plotting stack is only loaded for the plot step.
+# Modules that must not be loaded yet at CLI startup and once each pipeline's evaluation modules are imported
+# (checked by unittests/test_entrypoint.py)
+IMPORT_BUDGET = {
+    'startup': ('pandas', 'numpy', 'sqlglot', 'nltk', 'psycopg2', 'matplotlib', 'seaborn', 'sql_metadata'),
+    'exec': ('matplotlib', 'seaborn', 'sqlglot', 'nltk'),
+    'component': ('psycopg2', 'matplotlib', 'seaborn', 'nltk', 'sql_metadata'),
+}
 
 
 def handle_execution_accuracy(args):
-    samples = convert_dataset_to_dicts(args.input_dataset)
-    accuracy, results = evaluate_execution(samples, args.db_dir, args.engine, True if args.log_resultsets else False)
-    print(f"Accuracy: {accuracy}")
+    from evaluation.execution_evaluate import (
+        evaluate_execution, evaluate_models, convert_dataset_to_dicts, output_results_to_csv, iter_dataset_samples,
+        load_model_samples
+    )
+    from evaluation.stream_execution_eval import evaluate_execution_streaming
+
     try:
         os.makedirs(args.output_dir, exist_ok=True)
     except OSError as e:
@@ -24,23 +27,89 @@ def handle_execution_accuracy(args):
     exec_results_file = os.path.join(args.output_dir, "exec_evaluation_results.csv")
     metadata_file = os.path.join(args.output_dir, "dataset_with_metadata.csv")
     schema_stats_file = os.path.join(args.output_dir, "schema_stats.json")
-    output_results_to_csv(exec_results_file, results)
+    exec_options = dict(workers=args.workers, gold_cache_path=args.gold_cache, timeout=args.timeout,
+                        max_rows=args.max_rows, result_format=args.result_format)
+    if args.pred_columns or args.pred_files:
+        # comparison mode: every gold query runs once and all models are scored against it
+        if args.stream or args.resume:
+            raise Exception("--stream/--resume can't be combined with --pred_columns/--pred_files!")
+        models, samples = load_model_samples(args.input_dataset, args.pred_columns, args.pred_files)
+        accuracies, results = evaluate_models(samples, models, args.db_dir, args.engine,
+                                              True if args.log_resultsets else False, **exec_options)
+        for model, accuracy in accuracies.items():
+            print(f"Accuracy ({model}): {accuracy}")
+        output_results_to_csv(exec_results_file, results)
+        return
+    if args.stream or args.resume:
+        samples = iter_dataset_samples(args.input_dataset)
+        accuracy = evaluate_execution_streaming(samples, exec_results_file, args.db_dir, args.engine,
+                                                True if args.log_resultsets else False, resume=args.resume,
+                                                **exec_options)
+        print(f"Accuracy: {accuracy}")
+    else:
+        samples = convert_dataset_to_dicts(args.input_dataset)
+        accuracy, results = evaluate_execution(samples, args.db_dir, args.engine,
+                                               True if args.log_resultsets else False, **exec_options)
+        print(f"Accuracy: {accuracy}")
+        output_results_to_csv(exec_results_file, results)
+    if args.confidence:
+        import pandas as pd
+        from evaluation.strat_execution_eval import accuracy_interval
+        correct = pd.read_csv(exec_results_file, usecols=['correct'])['correct']
+        low, high = accuracy_interval(correct, args.confidence, args.resamples)
+        print(f"{args.confidence:.0%} bootstrap CI: [{low:.4f}, {high:.4f}]")
+
+    from metadata_utils import tag_features, link_schema_features
+    from metadata_utils.fetch_schema_features import analyze_directory
     tag_features.main(args.input_dataset, metadata_file, True)
-    analyze_directory(args.db_dir, schema_stats_file)
+    analyze_directory(args.db_dir, schema_stats_file, cache_path=args.schema_stats_cache)
     link_schema_features.main(schema_stats_file, metadata_file, metadata_file)
-    plot_exec(accuracy, args.output_dir, metadata_file, exec_results_file)
+
+    from evaluation.strat_execution_eval import load_strata
+    strata = load_strata(args.strata_config) if args.strata_config else None
+    from evaluation.plot.plot_exec_accuracies import plot as plot_exec
+    plot_exec(accuracy, args.output_dir, metadata_file, exec_results_file, strata, args.confidence, args.resamples)
 
 
 def handle_partial_component_accuracy(args):
+    from other_utils.deserialize_db_model import deserialize_db_schema_model
+    from evaluation.structural_evaluate import evaluate_dataset
+    from evaluation.average_partial_accuracies import aggregate_results_by_clause, aggregate_score_file
+
     try:
         os.makedirs(args.output_dir, exist_ok=True)
     except OSError as e:
         print(f"Error creating directory '{args.output_dir}': {e}")
+    metadata_file = None
+    if args.group_by:
+        # group columns such as hardness come from the tagged features, checked before any pair is scored
+        from evaluation.average_partial_accuracies import load_group_metadata
+        metadata_file = args.metadata_file
+        if metadata_file is None and any(name not in ('row', 'db_id') for name in args.group_by):
+            from metadata_utils import tag_features
+            metadata_file = os.path.join(args.output_dir, "dataset_with_metadata.csv")
+            tag_features.main(args.input_dataset, metadata_file, True)
+        load_group_metadata(metadata_file, args.group_by)
+
     schemas = deserialize_db_schema_model('/Users/anikaraghavan/Downloads/text2sql-eval/data/spider/interim_db_schemas_object')
-    scores_out_file = os.path.join(args.output_dir, 'partial_scores.csv')
+    scores_out_file = os.path.join(args.output_dir, f'partial_scores.{args.score_format}')
     parsing_errors_log_file = os.path.join(args.output_dir, 'parse_errors.csv')
-    all_scores = evaluate_dataset(args.input_dataset, scores_out_file, parsing_errors_log_file, schemas)
-    aggregate_scores = aggregate_results_by_clause(all_scores)
+    all_scores = evaluate_dataset(args.input_dataset, scores_out_file, parsing_errors_log_file, schemas,
+                                  workers=args.workers, parse_cache_path=args.parse_cache,
+                                  matching=args.matching, score_format=args.score_format,
+                                  strict_columns=args.strict_columns)
+    if args.score_format == 'parquet':
+        aggregate_scores = aggregate_score_file(scores_out_file)
+    else:
+        aggregate_scores = aggregate_results_by_clause(all_scores)
+
+    if args.group_by:
+        from evaluation.average_partial_accuracies import aggregate_score_file_by_group, group_averages_to_frame
+        grouped = aggregate_score_file_by_group(scores_out_file, args.group_by, metadata_file)
+        for name, groups in grouped.items():
+            group_averages_to_frame(groups).to_csv(os.path.join(args.output_dir, f'partial_accuracies_by_{name}.csv'))
+
+    from evaluation.plot.plot_partial_accuracies import plot as plot_partial
     plot_partial(*aggregate_scores, args.output_dir)
 
 if __name__ == '__main__':
@@ -57,6 +126,44 @@ if __name__ == '__main__':
     parser.add_argument("--engine", type=str,
                         help="Indicates whether to use sqlite or postgres", required=False)
     parser.add_argument("--log_resultsets", action="store_true", help="Logs result sets", required=False)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (exec: sharded by db_id, component: chunks of query pairs)", required=False)
+    parser.add_argument("--gold_cache", type=str,
+                        help="File to persist gold query result sets across exec runs", required=False)
+    parser.add_argument("--schema_stats_cache", type=str,
+                        help="File to persist database schema statistics across exec runs", required=False)
+    parser.add_argument("--parse_cache", type=str,
+                        help="File to persist parsed gold queries across component runs", required=False)
+    parser.add_argument("--matching", type=str, default='greedy', choices=['greedy', 'optimal'],
+                        help="How unordered clause elements are matched in component-based evaluation", required=False)
+    parser.add_argument("--score_format", type=str, default='csv', choices=['csv', 'parquet'],
+                        help="Format of the partial scores file written by component-based evaluation", required=False)
+    parser.add_argument("--group_by", type=str, nargs='+',
+                        help="Also average component scores per db_id and/or per input dataset column (e.g. hardness)", required=False)
+    parser.add_argument("--metadata_file", type=str,
+                        help="Tagged features csv (tag_features output) to read --group_by columns from; tagged from the input dataset if omitted", required=False)
+    parser.add_argument("--strict_columns", action="store_true",
+                        help="Count queries with ambiguous unqualified columns as parse errors in component-based evaluation", required=False)
+    parser.add_argument("--timeout", type=float,
+                        help="Per-query wall-clock limit in seconds for execution-based evaluation", required=False)
+    parser.add_argument("--max_rows", type=int,
+                        help="Maximum number of rows fetched per query for execution-based evaluation", required=False)
+    parser.add_argument("--result_format", type=str, default='dataframe', choices=['dataframe', 'rows', 'records'],
+                        help="Result set representation for execution-based evaluation", required=False)
+    parser.add_argument("--pred_columns", type=str, nargs='+',
+                        help="Compare several models: prediction columns of the input dataset", required=False)
+    parser.add_argument("--pred_files", type=str, nargs='+',
+                        help="Compare several models: csvs with a pred_query column aligned with the input dataset", required=False)
+    parser.add_argument("--strata_config", type=str,
+                        help="JSON file defining the strata of the stratified exec evaluation", required=False)
+    parser.add_argument("--confidence", type=float,
+                        help="Report bootstrap confidence intervals at this level (e.g. 0.95) for exec accuracies", required=False)
+    parser.add_argument("--resamples", type=int, default=10000,
+                        help="Number of bootstrap resamples for --confidence", required=False)
+    parser.add_argument("--stream", action="store_true",
+                        help="Write execution results row by row with checkpoints instead of holding them in memory", required=False)
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume an interrupted streaming exec run from its checkpoint (implies --stream)", required=False)
 
     args = parser.parse_args()
     if args.eval_type == 'exec':
@@ -1,116 +1,100 @@
-from collections import defaultdict
 from evaluation.process_query import *
 from evaluation.structural_evaluate import *
 
-def aggregate_results_by_clause(all_scores):
-    aggregate_f1_scores = defaultdict(int)
-    aggregate_prec_scores = defaultdict(int)
-    aggregate_recall_scores = defaultdict(int)
-    clause_counts = {key: 0 for key in score_keys}
-
-    for scores in all_scores:
-        # special case: all zero scores (e.g., set-op mismatch)
-        if all(val == 0 for val in scores.values()):
-            for key in clause_counts:
-                clause_counts[key] += 1
-            continue
-
-        # --- FROM ---
-        aggregate_f1_scores['from-full'] += scores['from']['from']['f1']
-        aggregate_f1_scores['from-table_only'] += scores['from']['table_only']['f1']
-        aggregate_prec_scores['from-full'] += scores['from']['from']['precision']
-        aggregate_prec_scores['from-table_only'] += scores['from']['table_only']['precision']
-        aggregate_recall_scores['from-full'] += scores['from']['from']['recall']
-        aggregate_recall_scores['from-table_only'] += scores['from']['table_only']['recall']
-        clause_counts['from'] += 1
-
-        # --- explicit join conditions ---
-        if scores['explicit_join_conds'] is not None:
-            clause_counts['explicit_join_conds'] += 1
-            aggregate_f1_scores['explicit_join_conds-col_only'] += scores['explicit_join_conds']['col_only']['f1']
-            aggregate_f1_scores['explicit_join_conds-conditions'] += scores['explicit_join_conds']['conditions']['f1']
-            aggregate_prec_scores['explicit_join_conds-col_only'] += scores['explicit_join_conds']['col_only']['precision']
-            aggregate_prec_scores['explicit_join_conds-conditions'] += scores['explicit_join_conds']['conditions']['precision']
-            aggregate_recall_scores['explicit_join_conds-col_only'] += scores['explicit_join_conds']['col_only']['recall']
-            aggregate_recall_scores['explicit_join_conds-conditions'] += scores['explicit_join_conds']['conditions']['recall']
-
-        # --- GROUP ---
-        if scores['group'] is not None:
-            clause_counts['group'] += 1
-            aggregate_f1_scores['group'] += scores['group']['f1']
-            aggregate_prec_scores['group'] += scores['group']['precision']
-            aggregate_recall_scores['group'] += scores['group']['recall']
-
-        # --- GROUP BY / HAVING ---
-        if scores['group_by_having'] is not None:
-            clause_counts['group_by_having'] += 1
-            aggregate_f1_scores['group_by_having'] += scores['group_by_having']['f1']
-            aggregate_prec_scores['group_by_having'] += scores['group_by_having']['precision']
-            aggregate_recall_scores['group_by_having'] += scores['group_by_having']['recall']
-
-        # --- LIMIT ---
-        if scores['limit'] is not None:
-            clause_counts['limit'] += 1
-            aggregate_f1_scores['limit'] += scores['limit']['f1']
-            aggregate_prec_scores['limit'] += scores['limit']['precision']
-            aggregate_recall_scores['limit'] += scores['limit']['recall']
+import numpy as np
+from evaluation.score_table import ID_COLUMNS, METRICS, SCORE_COLUMNS, flatten_scores, flatten_scored, read_score_table
+
+def _averages_to_dicts(means: pd.Series, reported: pd.Series):
+    """Splits one row of per-(key, metric) means into the f1/precision/recall dicts, skipping unreported keys"""
+    averaged = tuple({} for _ in METRICS)
+    for key in SCORE_COLUMNS:
+        if reported[(key, METRICS[0])]:
+            for metric_avgs, metric in zip(averaged, METRICS):
+                metric_avgs[key] = float(means[(key, metric)])
+    return averaged
+
+def _split_flat(flat: pd.DataFrame):
+    non_scores = ['set_op_mismatch'] + [col for col in ID_COLUMNS if col in flat.columns.get_level_values(0)]
+    scored = flat.drop(columns=non_scores, level=0)
+    # a key is reported once some pair (other than a set-op mismatch) has the clause
+    reported = scored.notna() & ~flat['set_op_mismatch'].to_numpy()[:, None]
+    return scored, reported
 
-        # --- ORDER BY ---
-        if scores['order'] is not None:
-            clause_counts['order'] += 1
-            aggregate_f1_scores['order-order_by'] += scores['order']['order_by']['f1']
-            aggregate_f1_scores['order-expressions_no_direction'] += scores['order']['expressions_no_direction']['f1']
-            aggregate_prec_scores['order-order_by'] += scores['order']['order_by']['precision']
-            aggregate_prec_scores['order-expressions_no_direction'] += scores['order']['expressions_no_direction']['precision']
-            aggregate_recall_scores['order-order_by'] += scores['order']['order_by']['recall']
-            aggregate_recall_scores['order-expressions_no_direction'] += scores['order']['expressions_no_direction']['recall']
-
-        # --- SELECT (always not None) ---
-        clause_counts['select'] += 1
-        for subkey, metrics in scores['select'].items():
-            key_name = f'select-{subkey}'
-            aggregate_f1_scores[key_name] += metrics['f1']
-            aggregate_prec_scores[key_name] += metrics['precision']
-            aggregate_recall_scores[key_name] += metrics['recall']
-
-        # --- WHERE ---
-        if scores['where'] is not None:
-            clause_counts['where'] += 1
-            for subkey, metrics in scores['where'].items():
-                key_name = f'where-{subkey}'
-                aggregate_f1_scores[key_name] += metrics['f1']
-                aggregate_prec_scores[key_name] += metrics['precision']
-                aggregate_recall_scores[key_name] += metrics['recall']
-
-    # --- compute averages ---
-    averaged_f1 = {}
-    averaged_prec = {}
-    averaged_recall = {}
-
-    key_to_clause = {
-        'from-full': 'from',
-        'from-table_only': 'from',
-        'explicit_join_conds-col_only': 'explicit_join_conds',
-        'explicit_join_conds-conditions': 'explicit_join_conds',
-        'group': 'group',
-        'group_by_having': 'group_by_having',
-        'limit': 'limit',
-        'order-order_by': 'order',
-        'order-expressions_no_direction': 'order',
-        # select subkeys
-        **{f'select-{k}': 'select' for k in ['col_no_agg', 'col_no_distinct', 'distinct', 'select']},
-        # where subkeys
-        **{f'where-{k}': 'where' for k in ['col_only', 'conditions']}
-    }
-
-    for key, total in aggregate_f1_scores.items():
-        parent = key_to_clause[key]
-        count = clause_counts[parent] if clause_counts[parent] > 0 else 1
-        averaged_f1[key] = total / count
-        averaged_prec[key] = aggregate_prec_scores[key] / count
-        averaged_recall[key] = aggregate_recall_scores[key] / count
-
-    return averaged_f1, averaged_prec, averaged_recall
+def aggregate_results_by_clause(all_scores):
+    """Averages precision/recall/f1 per score key over the pairs that have its clause (plus set-op mismatches).
+    Returns the (f1, precision, recall) dicts keyed like SCORE_COLUMNS."""
+    flat = all_scores if isinstance(all_scores, pd.DataFrame) else flatten_scores(all_scores)
+    scored, reported = _split_flat(flat)
+    return _averages_to_dicts(scored.mean(), reported.any())
+
+def aggregate_results_by_group(all_scores, by, metadata: pd.DataFrame = None):
+    """
+    Like aggregate_results_by_clause, but per group for each column in `by`, in one pass over the scores.
+    all_scores is a flatten_scores/read_score_table table with 'row' and 'db_id' columns (or a list of
+    ScoredPairs). 'db_id' groups come from the scores themselves; any other column (e.g. 'hardness') is looked
+    up in metadata, a table with one row per dataset sample in input order (e.g. the tag_features output),
+    at each scored pair's row. If metadata has a db_id column, it must agree with the scores' db_ids.
+    Returns {column: {label: (f1, precision, recall)}}.
+    """
+    flat = all_scores if isinstance(all_scores, pd.DataFrame) else flatten_scored(all_scores)
+    if 'row' not in flat.columns.get_level_values(0):
+        raise ValueError("Grouping needs scores with their dataset rows (see score_table.ID_COLUMNS)!")
+    rows = flat['row'].to_numpy(dtype=np.int64)
+    if metadata is not None:
+        _check_metadata_rows(flat, rows, metadata)
+    scored, reported = _split_flat(flat)
+    results = {}
+    for name in by:
+        if name in ID_COLUMNS:
+            labels = flat[name].to_numpy()
+        elif metadata is not None and name in metadata.columns:
+            labels = metadata[name].to_numpy()[rows]
+        else:
+            raise KeyError(f"No {name} column to group the scores by!")
+        means = scored.groupby(labels).mean()
+        any_reported = reported.groupby(labels).any()
+        results[name] = {label: _averages_to_dicts(means.loc[label], any_reported.loc[label]) for label in means.index}
+    return results
+
+def _check_metadata_rows(flat: pd.DataFrame, rows: np.ndarray, metadata: pd.DataFrame):
+    if len(rows) and rows.max() >= len(metadata):
+        raise ValueError(f"Scores reach dataset row {rows.max()} but the metadata only has {len(metadata)} rows!")
+    if 'db_id' in metadata.columns and 'db_id' in flat.columns.get_level_values(0):
+        if not (metadata['db_id'].astype(str).to_numpy()[rows] == flat['db_id'].astype(str).to_numpy()).all():
+            raise ValueError("Metadata and scores disagree on db_id; the files are misaligned!")
+
+def load_group_metadata(metadata_csv: str, by) -> pd.DataFrame:
+    """
+    Reads the db_id column and the non-id columns of `by` from metadata_csv, a csv with one row per dataset
+    sample in input order (e.g. dataset_with_metadata.csv written by tag_features). Returns None if `by` only
+    has id columns; raises KeyError if metadata_csv lacks any of the group columns.
+    """
+    metadata_cols = [name for name in by if name not in ID_COLUMNS]
+    if not metadata_cols:
+        return None
+    if metadata_csv is None:
+        raise KeyError(f"Grouping by {', '.join(metadata_cols)} needs a metadata file!")
+    columns = set(pd.read_csv(metadata_csv, nrows=0).columns)
+    missing = [name for name in metadata_cols if name not in columns]
+    if missing:
+        raise KeyError(f"{metadata_csv} is missing group column(s): {', '.join(missing)}")
+    return pd.read_csv(metadata_csv, usecols=lambda col: col == 'db_id' or col in metadata_cols)
+
+def group_averages_to_frame(groups: dict) -> pd.DataFrame:
+    """One row per group label of aggregate_results_by_group with a '<score key>.<metric>' column per average"""
+    records = {label: {f"{key}.{metric}": avg for metric, metric_avgs in zip(METRICS, averages)
+                       for key, avg in metric_avgs.items()}
+               for label, averages in groups.items()}
+    return pd.DataFrame.from_dict(records, orient='index')
+
+def aggregate_score_file(scores_file: str):
+    """aggregate_results_by_clause over a partial scores file written by evaluate_dataset (.parquet or .csv)"""
+    return aggregate_results_by_clause(read_score_table(scores_file))
+
+def aggregate_score_file_by_group(scores_file: str, by, metadata_csv: str = None):
+    """aggregate_results_by_group over a partial scores file, joining the non-id columns of `by` from metadata_csv
+    (see load_group_metadata)"""
+    return aggregate_results_by_group(read_score_table(scores_file), by, load_group_metadata(metadata_csv, by))
 
 
 if __name__ == '__main__':
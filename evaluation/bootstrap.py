@@ -0,0 +1,105 @@
+import numpy as np
+
+"""Vectorized bootstrap confidence intervals and paired significance tests over per-sample outcomes"""
+
+DEFAULT_RESAMPLES = 10000
+DEFAULT_SEED = 0
+# Upper bound on the array elements materialized per batch of resamples
+BATCH_ELEMENTS = 2 ** 24
+# Outcomes with at most this many distinct values are resampled as value counts instead of indices
+MAX_DISCRETE_VALUES = 16
+
+
+def _prepare(outcomes, codes, n_levels):
+    """Returns (outcomes, level codes, n_levels) without the samples left out by a -1 code or a NaN outcome"""
+    outcomes = np.asarray(outcomes, dtype=float)
+    codes = np.zeros(len(outcomes), dtype=np.int64) if codes is None else np.asarray(codes, dtype=np.int64)
+    if len(codes) != len(outcomes):
+        raise ValueError(f"Got {len(codes)} level codes for {len(outcomes)} outcomes!")
+    if n_levels is None:
+        n_levels = int(codes.max()) + 1 if len(codes) else 1
+    keep = (codes >= 0) & ~np.isnan(outcomes)
+    return outcomes[keep], codes[keep], n_levels
+
+def level_means(outcomes, codes=None, n_levels=None) -> np.ndarray:
+    """Mean outcome per level (NaN for levels without samples)"""
+    outcomes, codes, n_levels = _prepare(outcomes, codes, n_levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (np.bincount(codes, weights=outcomes, minlength=n_levels) /
+                np.bincount(codes, minlength=n_levels))
+
+def bootstrap_means(outcomes, codes=None, n_levels=None, resamples: int = DEFAULT_RESAMPLES,
+                    seed: int = DEFAULT_SEED, batch_elements: int = BATCH_ELEMENTS) -> np.ndarray:
+    """
+    Returns a (resamples, n_levels) matrix of bootstrap means. Each resample redraws every level's samples with
+    replacement, so levels keep their size; codes gives each outcome's level (-1 leaves it out) and None puts
+    all outcomes in one level. Levels without samples are NaN.
+
+    All levels are resampled together in batches. Outcomes with few distinct values (0/1 correctness, paired
+    differences) are drawn as multinomial counts of each level's values, which has the same distribution as
+    resampling indices but costs O(levels) instead of O(samples) per resample; other outcomes are resampled
+    through index matrices.
+    """
+    outcomes, codes, n_levels = _prepare(outcomes, codes, n_levels)
+    rng = np.random.default_rng(seed)
+    if not len(outcomes):
+        return np.full((resamples, n_levels), np.nan)
+    sizes = np.bincount(codes, minlength=n_levels)
+    sums = np.empty((resamples, n_levels))
+    values, inverse = np.unique(outcomes, return_inverse=True)
+
+    if len(values) <= MAX_DISCRETE_VALUES:
+        value_counts = np.bincount(codes * len(values) + inverse.ravel(),
+                                   minlength=n_levels * len(values)).reshape(n_levels, len(values))
+        # empty levels draw 0 samples from any valid distribution
+        pvals = np.full(value_counts.shape, 1 / max(len(values), 1))
+        nonempty = sizes > 0
+        pvals[nonempty] = value_counts[nonempty] / sizes[nonempty, None]
+        batch = max(1, batch_elements // max(n_levels * len(values), 1))
+        for start in range(0, resamples, batch):
+            stop = min(start + batch, resamples)
+            draws = rng.multinomial(sizes, pvals, size=(stop - start, n_levels))
+            sums[start:stop] = draws @ values
+    else:
+        order = np.argsort(codes, kind='stable')
+        sorted_outcomes, sorted_codes = outcomes[order], codes[order]
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        nonempty = np.flatnonzero(sizes)
+        sample_starts, sample_sizes = starts[sorted_codes], sizes[sorted_codes]
+        sums[:] = 0
+        batch = max(1, batch_elements // max(len(sorted_outcomes), 1))
+        for start in range(0, resamples, batch):
+            stop = min(start + batch, resamples)
+            # position j of a level is redrawn uniformly from that level's samples
+            idx = sample_starts + (rng.random((stop - start, len(sorted_outcomes))) * sample_sizes).astype(np.int64)
+            if len(nonempty):
+                sums[start:stop, nonempty] = np.add.reduceat(sorted_outcomes[idx], starts[nonempty], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sums / sizes
+
+def bootstrap_interval(outcomes, codes=None, n_levels=None, confidence: float = 0.95, **kwargs):
+    """Percentile bootstrap interval of the mean outcome per level; returns (low, high) arrays"""
+    means = bootstrap_means(outcomes, codes, n_levels, **kwargs)
+    low, high = np.full(means.shape[1], np.nan), np.full(means.shape[1], np.nan)
+    scored = ~np.isnan(means[0]) if len(means) else np.zeros(means.shape[1], dtype=bool)
+    if scored.any():
+        alpha = (1 - confidence) / 2
+        low[scored], high[scored] = np.quantile(means[:, scored], [alpha, 1 - alpha], axis=0)
+    return low, high
+
+def paired_bootstrap_test(outcomes_a, outcomes_b, codes=None, n_levels=None, **kwargs):
+    """
+    Paired bootstrap test of mean(a) - mean(b) per level: both systems are resampled on the same samples.
+    Returns (observed differences, two-sided p-values), where p is the share of resampled differences at
+    least as far from the observed difference as that is from 0.
+    """
+    outcomes_a, outcomes_b = np.asarray(outcomes_a, dtype=float), np.asarray(outcomes_b, dtype=float)
+    if outcomes_a.shape != outcomes_b.shape:
+        raise ValueError(f"Paired outcomes differ in length: {len(outcomes_a)} vs {len(outcomes_b)}!")
+    diffs = outcomes_a - outcomes_b
+    observed = level_means(diffs, codes, n_levels)
+    resampled = bootstrap_means(diffs, codes, n_levels, **kwargs)
+    with np.errstate(invalid='ignore'):
+        p_values = np.mean(np.abs(resampled - observed) >= np.abs(observed), axis=0)
+    p_values[np.isnan(observed)] = np.nan
+    return observed, p_values
@@ -0,0 +1,109 @@
+import sqlite3
+import time
+from collections import OrderedDict
+
+DEFAULT_POOL_SIZE = 32
+DEFAULT_HEALTH_CHECK_INTERVAL = 30.0
+
+"""***Assumes sqlite or postgres"""
+def connect(db_path, engine):
+    """Open a new connection to a sqlite file or a postgres database given its credentials."""
+    if engine == 'sqlite':
+        return sqlite3.connect(db_path)
+    # imported here so sqlite-only runs never load the postgres driver
+    import psycopg2
+    host, port, dbname, user, password = db_path
+    return psycopg2.connect(
+        host=host,
+        port=port,
+        dbname=dbname,
+        user=user,
+        password=password
+    )
+
+
+class ConnectionPool:
+    """
+    Keeps connections open across queries, keyed by the sqlite db path (or the postgres credential tuple).
+
+    At most max_size connections are held; the least recently used one is closed once the bound is hit.
+    A connection that has been idle for longer than health_check_interval seconds is pinged before reuse
+    and transparently reopened if the ping fails.
+    """
+    def __init__(self, engine: str, max_size: int = DEFAULT_POOL_SIZE,
+                 health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL):
+        if max_size < 1:
+            raise ValueError("Connection pool size must be at least 1!")
+        self.engine = engine
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        # key -> (connection, time of last use), ordered from least to most recently used
+        self._connections = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_all()
+
+    def __len__(self):
+        return len(self._connections)
+
+    @staticmethod
+    def _key(db_path):
+        return db_path if isinstance(db_path, str) else tuple(db_path)
+
+    def acquire(self, db_path):
+        """Returns an open connection for db_path, reusing a pooled one when it is still healthy"""
+        key = self._key(db_path)
+        conn, last_used = self._connections.pop(key, (None, None))
+        if conn is not None and time.monotonic() - last_used > self.health_check_interval:
+            if not self._is_healthy(conn):
+                self._close(conn)
+                conn = None
+        if conn is None:
+            self._evict(self.max_size - 1)
+            conn = connect(db_path, self.engine)
+        self._connections[key] = (conn, time.monotonic())
+        return conn
+
+    def release(self, db_path, conn):
+        """Ends the connection's current transaction so no state (or writes) leak into the next query"""
+        try:
+            conn.rollback()
+        except Exception:
+            self.discard(db_path)
+
+    def discard(self, db_path):
+        """Closes and forgets the connection for db_path, if one is pooled"""
+        conn, _ = self._connections.pop(self._key(db_path), (None, None))
+        if conn is not None:
+            self._close(conn)
+
+    def close_all(self):
+        self._evict(0)
+
+    def _evict(self, keep: int):
+        while len(self._connections) > keep:
+            _, (conn, _) = self._connections.popitem(last=False)
+            self._close(conn)
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            if getattr(conn, 'closed', 0):
+                return False
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
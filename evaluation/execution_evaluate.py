@@ -1,31 +1,105 @@
-import sqlite3
 import pandas as pd
-import psycopg2
 import numpy as np
 import argparse
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from itertools import islice
+from evaluation.connection_pool import ConnectionPool, connect, DEFAULT_POOL_SIZE
+from evaluation.result_cache import GoldResultCache, normalize_sql, DEFAULT_MEMO_SIZE
+from evaluation.result_sets import match_result_sets, fetch_result, result_shape, result_to_list, RESULT_FORMATS
 
-execution_errors = ['Syntax Error', 'Missing Table', 'Missing Column', 'Ambiguous Column', 'Datatype Mismatch', 'Other Error']
+execution_errors = ['Syntax Error', 'Missing Table', 'Missing Column', 'Ambiguous Column', 'Datatype Mismatch',
+                    'Timeout', 'Result Too Large', 'Other Error']
+
+# Position of a sample in the input dataset, carried from the loaded samples into every result row so
+# results can be joined to the tagged metadata (see strat_execution_eval.load_joined_results)
+SAMPLE_ID = 'sample_id'
+
+# How many sqlite VM instructions run between two checks of the query deadline
+SQLITE_PROGRESS_STEPS = 1000
+
+class QueryTimeout(Exception):
+    """Raised when a query runs past its wall-clock budget"""
+
+class ResultTooLarge(Exception):
+    """Raised when a query returns more rows than the configured cap"""
 
 """***Assumes sqlite or postgres"""
-def execute_query(db_path, query, engine):
-    """Execute SQL query and return results (or error)."""
+def execute_query(db_path, query, engine, pool: ConnectionPool = None, timeout: float = None, max_rows: int = None,
+                  result_format: str = 'dataframe'):
+    """Execute SQL query and return results (or error). Reuses a pooled connection when a pool is given.
+
+    timeout (seconds) and max_rows bound the work a single (possibly runaway) query may do.
+    result_format picks the result representation: a DataFrame, or (skipping pandas) a RowResult of cursor
+    tuples ('rows') or a NumPy record array ('records').
+    """
+    conn = None
+    deadline = time.monotonic() + timeout if timeout else None
     try:
-        if engine == 'sqlite':
-            conn = sqlite3.connect(db_path)
+        conn = pool.acquire(db_path) if pool is not None else connect(db_path, engine)
+        set_query_deadline(conn, engine, deadline)
+        if result_format == 'dataframe':
+            df = read_limited(query, conn, max_rows)
         else:
-            host, port, dbname, user, password = db_path
-            conn = psycopg2.connect(
-                host=host,
-                port=port,
-                dbname=dbname,
-                user=user,
-                password=password
-            )
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+            df = read_raw(query, conn, result_format, max_rows)
         return df, None
     except Exception as e:
+        if deadline is not None and time.monotonic() >= deadline and "interrupted" in str(e).lower():
+            e = QueryTimeout(f"query timeout: exceeded {timeout} seconds")
         return None, str(e)
+    finally:
+        if conn is not None:
+            if deadline is not None:
+                clear_query_deadline(conn, engine)
+            if pool is not None:
+                pool.release(db_path, conn)
+            else:
+                conn.close()
+
+def set_query_deadline(conn, engine, deadline):
+    """Makes the connection abort the next statement once the monotonic deadline has passed"""
+    if deadline is None:
+        return
+    if engine == 'sqlite':
+        conn.set_progress_handler(lambda: time.monotonic() >= deadline, SQLITE_PROGRESS_STEPS)
+    else:
+        # SET LOCAL only lasts for the current transaction, which is rolled back after every query
+        remaining_ms = max(1, int((deadline - time.monotonic()) * 1000))
+        cursor = conn.cursor()
+        cursor.execute("SET LOCAL statement_timeout = %s", (remaining_ms,))
+        cursor.close()
+
+def clear_query_deadline(conn, engine):
+    if engine == 'sqlite':
+        conn.set_progress_handler(None, SQLITE_PROGRESS_STEPS)
+
+def read_limited(query, conn, max_rows: int = None):
+    """Reads the query's result set, fetching at most max_rows + 1 rows before giving up"""
+    if max_rows is None:
+        return pd.read_sql_query(query, conn)
+    chunks = pd.read_sql_query(query, conn, chunksize=max_rows + 1)
+    try:
+        df = next(chunks)
+    finally:
+        chunks.close()
+    if len(df) > max_rows:
+        raise ResultTooLarge(f"result too large: more than {max_rows} rows")
+    return df
+
+def read_raw(query, conn, result_format: str, max_rows: int = None):
+    """Reads the query's result set straight from the cursor, fetching at most max_rows + 1 rows"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query)
+        result = fetch_result(cursor, result_format, max_rows)
+    finally:
+        cursor.close()
+    if result is None:
+        raise ResultTooLarge(f"result too large: more than {max_rows} rows")
+    return result
 
 def categorize_error(error_msg):
     """Map raw SQLite error messages into helpful categories."""
@@ -42,95 +116,253 @@ def categorize_error(error_msg):
         return "Ambiguous Column"
     if "datatype mismatch" in msg:
         return "Datatype Mismatch"
+    if "query timeout" in msg or "statement timeout" in msg:
+        return "Timeout"
+    if "result too large" in msg:
+        return "Result Too Large"
     return "Other Error"
 
+def is_limit_error(error_msg) -> bool:
+    """True for errors caused by the run's timeout/row cap rather than by the query itself"""
+    return categorize_error(error_msg) in ('Timeout', 'Result Too Large')
 
-def match_result_sets(gold_df, pred_df, order_sensitive=False):
-    """Compare two DataFrames ignoring column order, enforcing row order only if needed."""
-    if gold_df.shape != pred_df.shape:
-        return False
-
-    gold_cols = list(gold_df.columns)
-
-    used_pred = set()
-    for gcol in gold_cols:
-        gseries = gold_df[gcol]
-        matched = False
-        for pcol in pred_df.columns:
-            if pcol in used_pred:
-                continue
-            pseries = pred_df[pcol]
-
-            if order_sensitive:
-                # row-by-row match
-                if gseries.equals(pseries):
-                    used_pred.add(pcol)
-                    matched = True
-                    break
-            else:
-                # compare as multisets (ignore row order)
-                if set(gseries) == set(pseries) and gseries.value_counts().equals(pseries.value_counts()):
-                    used_pred.add(pcol)
-                    matched = True
-                    break
-        if not matched:
-            return False
 
-    return True
+@dataclass
+class ExecutionSettings:
+    """Options shared by every sample of an execution run (also shipped to worker processes)"""
+    db_dir:             str
+    engine:             str
+    log_resultsets:     bool = False
+    pool_size:          int = DEFAULT_POOL_SIZE
+    gold_cache_path:    str = None
+    timeout:            float = None
+    max_rows:           int = None
+    result_format:      str = 'dataframe'
+    gold_memo_size:     int = DEFAULT_MEMO_SIZE
+
+def evaluate_sample(s, settings: ExecutionSettings, pool: ConnectionPool = None,
+                    gold_cache: GoldResultCache = None) -> dict:
+    """Executes the gold and predicted query of one sample and compares their result sets"""
+    db_path = f"{settings.db_dir}/{s['db_id']}/{s['db_id']}.sqlite"
+    run = _query_runner(db_path, settings, pool)
+    gold_df, gold_err = _execute_gold(s["gold"], db_path, settings, run, gold_cache)
+    correct, pred_df, pred_err = _score_prediction(s["gold"], gold_df, gold_err, s["pred"], run)
+
+    result = {
+        **_result_ids(s),
+        "correct": correct,
+        "gold_error": categorize_error(gold_err),
+        "pred_error": categorize_error(pred_err)
+    }
 
-def evaluate_execution(samples, db_dir, engine: str, log_resultsets: bool):
+    if settings.log_resultsets:
+        result["gold_rs"] = result_to_list(gold_df) if gold_df is not None else None
+        result["pred_rs"] = result_to_list(pred_df) if pred_df is not None else None
+
+    return result
+
+def evaluate_models_sample(s, settings: ExecutionSettings, pool: ConnectionPool = None,
+                           gold_cache: GoldResultCache = None) -> dict:
     """
-    samples: list of dicts like
-        {"db_id": "database_name", "gold": "SELECT ...", "pred": "SELECT ..."}
+    Executes the gold query of one sample once and compares every model's prediction (s["preds"] maps model
+    name to query) against it over the same warm connection. Predictions that normalize to the same SQL are
+    executed once. Result columns are sample_id (if the sample has one), db_id, gold_error and
+    '<model>_correct'/'<model>_pred_error' per model.
     """
-    results = []
-    correct_count = 0
+    db_path = f"{settings.db_dir}/{s['db_id']}/{s['db_id']}.sqlite"
+    run = _query_runner(db_path, settings, pool)
+    gold_df, gold_err = _execute_gold(s["gold"], db_path, settings, run, gold_cache)
+    result = {**_result_ids(s), "gold_error": categorize_error(gold_err)}
+    if settings.log_resultsets:
+        result["gold_rs"] = result_to_list(gold_df) if gold_df is not None else None
 
-    for s in samples:
-        db_path = f"{db_dir}/{s['db_id']}/{s['db_id']}.sqlite"
+    scored = {}
+    for model, pred_query in s["preds"].items():
+        key = normalize_sql(pred_query)
+        if key not in scored:
+            scored[key] = _score_prediction(s["gold"], gold_df, gold_err, pred_query, run)
+        correct, pred_df, pred_err = scored[key]
+        result[f"{model}_correct"] = correct
+        result[f"{model}_pred_error"] = categorize_error(pred_err)
+        if settings.log_resultsets:
+            result[f"{model}_pred_rs"] = result_to_list(pred_df) if pred_df is not None else None
+    return result
 
-        gold_query, pred_query = s["gold"], s["pred"]
-        gold_df, gold_err = execute_query(db_path, gold_query, engine)
-        pred_df, pred_err = execute_query(db_path, pred_query, engine)
+def _result_ids(s) -> dict:
+    """Leading columns of a sample's result row: its SAMPLE_ID (if it has one) and db_id"""
+    ids = {SAMPLE_ID: s[SAMPLE_ID]} if SAMPLE_ID in s else {}
+    ids["db_id"] = s["db_id"]
+    return ids
 
-        gold_cat = categorize_error(gold_err)
-        pred_cat = categorize_error(pred_err)
+def _query_runner(db_path, settings: ExecutionSettings, pool: ConnectionPool = None):
+    def run(query):
+        return execute_query(db_path, query, settings.engine, pool, settings.timeout, settings.max_rows,
+                             settings.result_format)
+    return run
 
-        correct = False
-        order_sensitive = "order by" in gold_query.lower()
-        if gold_err is None and pred_err is None:
-            correct = match_result_sets(gold_df, pred_df, order_sensitive)
+def _execute_gold(gold_query, db_path, settings: ExecutionSettings, run, gold_cache: GoldResultCache = None):
+    if gold_cache is None:
+        return run(gold_query)
+    gold_df, gold_err = gold_cache.get_or_execute(db_path, gold_query, lambda: run(gold_query),
+                                                  cacheable=lambda value: not is_limit_error(value[1]))
+    if gold_df is not None and settings.max_rows is not None and result_shape(gold_df)[0] > settings.max_rows:
+        # cached under a looser row cap by an earlier run
+        gold_df, gold_err = None, str(ResultTooLarge(f"result too large: more than {settings.max_rows} rows"))
+    return gold_df, gold_err
 
-        result = {
-            "db_id": s["db_id"],
-            "correct": correct,
-            "gold_error": gold_cat,
-            "pred_error": pred_cat
-        }
+def _score_prediction(gold_query, gold_df, gold_err, pred_query, run):
+    """Executes the prediction (reusing the gold result for the same SQL); returns (correct, pred_df, pred_err)"""
+    if normalize_sql(pred_query) == normalize_sql(gold_query):
+        pred_df, pred_err = gold_df, gold_err
+    else:
+        pred_df, pred_err = run(pred_query)
 
-        if log_resultsets:
-            result["gold_rs"] = gold_df.values.tolist() if gold_df is not None else None
-            result["pred_rs"] = pred_df.values.tolist() if pred_df is not None else None
+    correct = False
+    order_sensitive = "order by" in gold_query.lower()
+    if gold_err is None and pred_err is None:
+        correct = match_result_sets(gold_df, pred_df, order_sensitive)
+    return correct, pred_df, pred_err
 
-        results.append(result)
-        if correct:
-            correct_count += 1
+def _evaluate(s, settings: ExecutionSettings, pool: ConnectionPool = None, gold_cache: GoldResultCache = None) -> dict:
+    if "preds" in s:
+        return evaluate_models_sample(s, settings, pool, gold_cache)
+    return evaluate_sample(s, settings, pool, gold_cache)
 
+def evaluate_execution(samples, db_dir, engine: str, log_resultsets: bool,
+                       pool_size: int = DEFAULT_POOL_SIZE, workers: int = 1, gold_cache_path: str = None,
+                       timeout: float = None, max_rows: int = None, result_format: str = 'dataframe'):
+    """
+    samples: list of dicts like
+        {"db_id": "database_name", "gold": "SELECT ...", "pred": "SELECT ..."}
+    plus an optional "sample_id" that is copied to the sample's result (set by the dataset loaders below).
+    Connections are pooled per database for the duration of the run (at most pool_size open at once).
+    With workers > 1, samples are sharded by db_id across a process pool; results keep the input order.
+    Identical gold queries are executed once per run; gold_cache_path additionally persists gold results across runs.
+    Each query is aborted after timeout seconds or once it returns more than max_rows rows (None disables either).
+    result_format ('dataframe', 'rows' or 'records') selects how result sets are materialized and compared.
+    """
+    settings = make_settings(db_dir, engine, log_resultsets, pool_size, gold_cache_path, timeout, max_rows, result_format)
+    results = list(iter_results(samples, settings, workers))
+
+    correct_count = sum(1 for result in results if result["correct"])
     accuracy = correct_count / len(samples)
     return accuracy, results
 
+def evaluate_models(samples, models: list[str], db_dir, engine: str, log_resultsets: bool,
+                    pool_size: int = DEFAULT_POOL_SIZE, workers: int = 1, gold_cache_path: str = None,
+                    timeout: float = None, max_rows: int = None, result_format: str = 'dataframe'):
+    """
+    Like evaluate_execution, but scores several models at once. samples are dicts like
+        {"db_id": "database_name", "gold": "SELECT ...", "preds": {"model_a": "SELECT ...", "model_b": "SELECT ..."}}
+    Each gold query is executed once per sample and all predictions are compared against its result.
+    Returns ({model: accuracy}, one combined result dict per sample), see evaluate_models_sample.
+    """
+    settings = make_settings(db_dir, engine, log_resultsets, pool_size, gold_cache_path, timeout, max_rows, result_format)
+    results = list(iter_results(samples, settings, workers))
+    accuracies = {model: sum(1 for result in results if result[f"{model}_correct"]) / len(samples) for model in models}
+    return accuracies, results
+
+def make_settings(db_dir, engine: str, log_resultsets: bool, pool_size: int = DEFAULT_POOL_SIZE,
+                  gold_cache_path: str = None, timeout: float = None, max_rows: int = None,
+                  result_format: str = 'dataframe', gold_memo_size: int = DEFAULT_MEMO_SIZE) -> ExecutionSettings:
+    if result_format not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result format {result_format}!")
+    return ExecutionSettings(db_dir, engine, log_resultsets, pool_size, gold_cache_path, timeout, max_rows,
+                             result_format, gold_memo_size)
+
+def iter_results(samples, settings: ExecutionSettings, workers: int = 1, window: int = None):
+    """
+    Yields one result dict per sample, in input order, without holding more than needed in memory.
+    samples may be any iterable; with workers > 1 it is consumed in windows of `window` samples
+    (all at once if None) that are sharded by db_id across the process pool.
+    """
+    if workers <= 1:
+        with ConnectionPool(settings.engine, settings.pool_size) as pool, \
+                GoldResultCache(settings.gold_cache_path, settings.result_format, settings.gold_memo_size) as gold_cache:
+            for s in samples:
+                yield _evaluate(s, settings, pool, gold_cache)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        samples = iter(samples)
+        while True:
+            window_samples = list(islice(samples, window)) if window else list(samples)
+            if not window_samples:
+                return
+            yield from _evaluate_parallel(window_samples, settings, executor)
+            if not window:
+                return
+
+def shard_by_db_id(samples) -> list[list[int]]:
+    """Groups sample indices by db_id, largest shard first so long shards start early"""
+    shards = defaultdict(list)
+    for idx, s in enumerate(samples):
+        shards[s["db_id"]].append(idx)
+    return sorted(shards.values(), key=len, reverse=True)
+
+def _evaluate_shard(shard_samples, settings: ExecutionSettings):
+    """Worker entry point: evaluates all samples of one db_id over a single warm connection"""
+    # the cache file is shared with the other workers, so every insert is committed right away
+    with ConnectionPool(settings.engine, settings.pool_size) as pool, \
+            GoldResultCache(settings.gold_cache_path, settings.result_format, settings.gold_memo_size,
+                            commit_every=1) as gold_cache:
+        return [_evaluate(s, settings, pool, gold_cache) for s in shard_samples]
+
+def _evaluate_parallel(samples, settings: ExecutionSettings, executor: ProcessPoolExecutor):
+    results = [None] * len(samples)
+    futures = {}
+    for shard in shard_by_db_id(samples):
+        shard_samples = [samples[idx] for idx in shard]
+        futures[executor.submit(_evaluate_shard, shard_samples, settings)] = shard
+    for future in as_completed(futures):
+        for idx, result in zip(futures[future], future.result()):
+            results[idx] = result
+    return results
+
+def iter_dataset_samples(dataset_path: str, chunksize: int = 10000):
+    """Streams {"sample_id", "db_id", "gold", "pred"} dicts from the dataset csv, reading only the needed columns"""
+    for chunk in pd.read_csv(dataset_path, usecols=['db_id', 'query', 'pred_query'], chunksize=chunksize):
+        # chunks keep counting the dataset's row index
+        for sample_id, db_id, gold, pred in zip(chunk.index, chunk['db_id'], chunk['query'], chunk['pred_query']):
+            yield {SAMPLE_ID: int(sample_id), "db_id": db_id, "gold": gold, "pred": pred}
+
 def convert_dataset_to_dicts(dataset_path : str):
     df = pd.read_csv(dataset_path)
     results = []
     for i in range(len(df)):
         sample = df.iloc[i]
-        queries = {"db_id": sample['db_id'],
+        queries = {SAMPLE_ID: i,
+                   "db_id": sample['db_id'],
                    "gold": sample['query'],
                    "pred": sample['pred_query']
                    }
         results.append(queries)
     return results
 
+def load_model_samples(dataset_path: str, pred_columns: list[str] = None, pred_files: list[str] = None):
+    """
+    Builds evaluate_models samples from the dataset csv. Predictions come from the dataset's pred_columns
+    (model name = column) and/or from pred_files, csvs with a pred_query column aligned row by row with the
+    dataset (model name = file name without extension). Returns (model names, samples), numbered by dataset row.
+    """
+    pred_columns, pred_files = list(pred_columns or []), list(pred_files or [])
+    df = pd.read_csv(dataset_path, usecols=['db_id', 'query'] + pred_columns)
+    preds = {col: df[col] for col in pred_columns}
+    for path in pred_files:
+        model = os.path.splitext(os.path.basename(path))[0]
+        if model in preds:
+            raise ValueError(f"Duplicate model name {model}!")
+        pred_df = pd.read_csv(path, usecols=['pred_query'])
+        if len(pred_df) != len(df):
+            raise ValueError(f"{path} has {len(pred_df)} predictions for {len(df)} samples!")
+        preds[model] = pred_df['pred_query']
+    if not preds:
+        raise ValueError("No prediction columns or files given!")
+    models = list(preds)
+    samples = [{SAMPLE_ID: sample_id, "db_id": db_id, "gold": gold, "preds": dict(zip(models, row_preds))}
+               for sample_id, (db_id, gold, *row_preds) in enumerate(zip(df['db_id'], df['query'], *preds.values()))]
+    return models, samples
+
 def output_results_to_csv(output_path: str, results: list[dict]):
     df = pd.DataFrame(results)
     df.to_csv(output_path, index=False)
@@ -150,7 +382,10 @@ def main(args):
     #         "pred": "SELECT STU_FNAME, STU_LNAME FROM student WHERE PROF_NUM > 300 ORDER BY STU_LNAME DESC"
     #     }
     # ]
-    accuracy, results = evaluate_execution(samples, args.db_dir, args.engine, args.log_resultsets)
+    accuracy, results = evaluate_execution(samples, args.db_dir, args.engine, args.log_resultsets,
+                                           workers=args.workers, gold_cache_path=args.gold_cache,
+                                           timeout=args.timeout, max_rows=args.max_rows,
+                                           result_format=args.result_format)
     print(accuracy)
     output_results_to_csv(args.output_path, results)
 
@@ -166,6 +401,16 @@ if __name__ == '__main__':
                         help="Output file for accuracy results per example", required=True)
     parser.add_argument("--log_resultsets", action="store_true", 
                         help="Logs result sets")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (samples are sharded by db_id)")
+    parser.add_argument("--gold_cache", type=str,
+                        help="File to persist gold query result sets across runs")
+    parser.add_argument("--timeout", type=float,
+                        help="Per-query wall-clock limit in seconds")
+    parser.add_argument("--max_rows", type=int,
+                        help="Maximum number of rows fetched per query")
+    parser.add_argument("--result_format", type=str, default='dataframe', choices=RESULT_FORMATS,
+                        help="How result sets are materialized: pandas DataFrames, raw cursor rows or NumPy records")
     args = parser.parse_args()
     main(args)
     
\ No newline at end of file
@@ -0,0 +1,71 @@
+import hashlib
+import sqlglot
+from evaluation.pickle_store import COMMIT_EVERY, PickleStore
+from evaluation.result_cache import normalize_sql
+
+# Bump whenever the canonical representation changes so stale entries are never read back
+# (sqlglot upgrades are covered by keying on its version)
+PARSE_CACHE_VERSION = 1
+
+
+def schema_fingerprint(schema) -> str:
+    """Digest of a Schema's tables and columns (in id order), so edits to a database schema invalidate its entries"""
+    raw = repr((schema._table['table_names_original'], schema._table['column_names_original']))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ParseCache:
+    """
+    Cache of canonical parsed representations (the sql dicts of ColUnit/ValUnit/TableUnit/CondUnit) of gold queries.
+
+    Lookups are memoized in memory for the run. If cache_path is given, results are also persisted to a
+    PickleStore keyed by (sqlglot version, db_id, schema fingerprint, normalized SQL), so re-scoring a new
+    model only has to parse its predictions. Caches sharing the file with other processes should use
+    commit_every=1 (see PickleStore).
+    """
+    def __init__(self, cache_path: str = None, namespace: str = 'default', commit_every: int = COMMIT_EVERY):
+        self.cache_path = cache_path
+        # separates representations parsed with different options (e.g. strict column resolution)
+        self.namespace = namespace
+        self._memo = {}
+        self._fingerprints = {}
+        self._store = PickleStore(cache_path, 'parsed_queries', commit_every) if cache_path else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_or_parse(self, db_id: str, schema, query: str, parse, cacheable=None):
+        """Returns the cached (parsed_rep, error) for query on db_id, calling parse() to fill the cache on a miss.
+
+        Values rejected by cacheable(value) are only memoized for this run, never persisted.
+        """
+        key = self.make_key(db_id, schema, query)
+        if key in self._memo:
+            return self._memo[key]
+
+        value = self._store.load(key) if self._store is not None else None
+        if value is None:
+            value = parse()
+            if self._store is not None and (cacheable is None or cacheable(value)):
+                self._store.store(key, value)
+        self._memo[key] = value
+        return value
+
+    def make_key(self, db_id: str, schema, query: str) -> str:
+        raw = repr((PARSE_CACHE_VERSION, sqlglot.__version__, self.namespace, db_id, self._fingerprint(schema),
+                    normalize_sql(query)))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def _fingerprint(self, schema):
+        # Schemas are long-lived (see SchemaIndex), so fingerprint each one once
+        if id(schema) not in self._fingerprints:
+            self._fingerprints[id(schema)] = (schema, schema_fingerprint(schema))
+        return self._fingerprints[id(schema)][1]
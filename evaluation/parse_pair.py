@@ -2,14 +2,12 @@ from evaluation.process_query import *
 from evaluation.structural_evaluate import *
 
 def parse_sql(query: str, schemas, db_id):
-    query = query.replace('"', "'")
+    query = query.replace('"', "'").lower()
     schema, _, table = get_reformatted(schemas, db_id)
     schema = Schema(schema, table)
-    tokens = tokenize(query)
-    tables_with_alias = get_tables_with_alias(schema.schema, tokens)
-    SQLStandardizer.schema = schema
-    SQLStandardizer.tables_with_alias = tables_with_alias
-    parser = SQLStandardizer(query.lower())
+    ast = parse_query_ast(query)
+    context = build_parse_context(schema, ast)
+    parser = SQLStandardizer(query, context, ast)
     return parser.get_sql()
 
 def score_pair(gold_query: str, pred_query: str, schemas, db_id) -> dict:
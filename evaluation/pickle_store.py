@@ -0,0 +1,58 @@
+import os
+import pickle
+import sqlite3
+import zlib
+
+# Inserts batched per write transaction by a store used from a single process
+COMMIT_EVERY = 64
+
+
+class PickleStore:
+    """
+    Sqlite table of zlib-compressed pickles keyed by string, the persistent backend of GoldResultCache and ParseCache.
+
+    The file is opened in WAL mode with a busy timeout, so several processes can share it. Inserts are committed
+    every commit_every entries; stores shared with other processes should use 1, so no write transaction is held
+    open between inserts and the other writers never wait on the lock.
+    """
+    def __init__(self, path: str, table: str, commit_every: int = COMMIT_EVERY):
+        self.table = table
+        self.commit_every = commit_every
+        self._pending = 0
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, payload BLOB)")
+        self._conn.commit()
+
+    def load(self, key: str):
+        """Returns the value stored under key, or None if there is none or it can't be unpickled"""
+        row = self._conn.execute(f"SELECT payload FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(zlib.decompress(row[0]))
+        except Exception:
+            # unreadable entry (e.g. written by incompatible library versions); treat as a miss
+            return None
+
+    def store(self, key: str, value):
+        payload = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        self._conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, payload) VALUES (?, ?)", (key, payload))
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._conn.commit()
+            self._pending = 0
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._conn.in_transaction
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
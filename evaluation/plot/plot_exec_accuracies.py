@@ -1,35 +1,36 @@
-from evaluation.strat_execution_eval import generate_stratified_accuracies
+from evaluation.strat_execution_eval import generate_stratified_accuracies, accuracy_interval, DEFAULT_STRATA
+from evaluation.bootstrap import DEFAULT_RESAMPLES
 from evaluation.execution_evaluate import execution_errors
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import os
 
-def output_accuracies(base_dir, total_acc, accuracies):
+def output_accuracies(base_dir, total_acc, accuracies, total_ci=None):
     accuracies['Total Accuracy'] = pd.DataFrame({"Accuracy" : [total_acc]})
+    if total_ci is not None:
+        accuracies['Total Accuracy']['CI Low'], accuracies['Total Accuracy']['CI High'] = total_ci
     output_file = os.path.join(base_dir, "all_accuracies.xlsx")
     with pd.ExcelWriter(output_file) as writer:
         for stratified_feature, val in accuracies.items():
-            val.to_excel(writer, sheet_name=stratified_feature[:31], index=False)  
+            # stratum tables keep their levels in the index
+            val.to_excel(writer, sheet_name=stratified_feature[:31], index=stratified_feature != 'Total Accuracy')
 
-def plot(accuracy, base_dir, metadata_csv=None, accuracies_csv=None):
+def plot(accuracy, base_dir, metadata_csv=None, accuracies_csv=None, strata=None, confidence=None,
+         resamples=DEFAULT_RESAMPLES):
     out_dir = os.path.join(base_dir, 'plots')
     os.makedirs(out_dir, exist_ok=True)
-    accuracies, df = generate_stratified_accuracies(metadata_csv, accuracies_csv)
-    output_accuracies(base_dir, accuracy, accuracies)
+    strata = DEFAULT_STRATA if strata is None else strata
+    # with a confidence level every accuracy gets a bootstrap interval
+    accuracies, df = generate_stratified_accuracies(metadata_csv, accuracies_csv, strata, confidence,
+                                                    method='bootstrap', resamples=resamples)
+    total_ci = None
+    if confidence is not None:
+        total_ci = accuracy_interval(df['exec_accuracy'], confidence, resamples)
+    output_accuracies(base_dir, accuracy, accuracies, total_ci)
 
     # Features to plot
-    features_info = [
-        ("hardness", accuracies["acc_by_hardness"], "Hardness"),
-        ("num_joins", accuracies["acc_by_joins"], "Number of Joins"),
-        ("num_agg", accuracies["acc_by_aggs"], "Number of Aggregations"),
-        ("num_where_conditions", accuracies["acc_by_where"], "Number of WHERE Conditions"),
-        ("has_subquery", accuracies["acc_by_subqquery"], "Has Subquery (0=No,1=Yes)"),
-        ("query_length_bin", accuracies["acc_by_query_length"], "Query Length (tokens)"),
-        ("num_tables_bin", accuracies["acc_by_num_tables"], "Number of Tables (binned)"),
-        ("num_columns_bin", accuracies["acc_by_total_schema_cols"], "Total Schema Columns (binned)"),
-        ("num_foreign_keys", accuracies["acc_by_num_fkeys"], "Number of Foreign Keys")
-    ]
+    features_info = [(accuracies[stratum.name], stratum.label or stratum.column) for stratum in strata]
 
     # Create multi-panel figure
     n_plots = len(features_info)
@@ -38,8 +39,9 @@ def plot(accuracy, base_dir, metadata_csv=None, accuracies_csv=None):
     fig, axes = plt.subplots(n_rows, n_cols, figsize=(18, 4 * n_rows))
     axes = axes.flatten()
 
-    for i, (feature, acc_values, xlabel) in enumerate(features_info):
+    for i, (table, xlabel) in enumerate(features_info):
         ax = axes[i]
+        acc_values = table['accuracy']
 
         # Fill NaN with 0 so seaborn keeps alignment
         acc_filled = acc_values.fillna(0)
@@ -67,7 +69,7 @@ def plot(accuracy, base_dir, metadata_csv=None, accuracies_csv=None):
 
         # Counts (right y-axis)
         ax2 = ax.twinx()
-        counts = df[feature].value_counts().reindex(acc_values.index, fill_value=0)
+        counts = table['count']
         count_plot = sns.barplot(
             x=counts.index.astype(str),
             y=counts.values,
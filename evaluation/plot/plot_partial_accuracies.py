@@ -67,3 +67,8 @@ def plot(averaged_f1_scores, averaged_precision_scores, averaged_recall_scores,
     plot_metric(df_scores, "F1", output_dir)
     plot_metric(df_scores, "Precision", output_dir)
     plot_metric(df_scores, "Recall", output_dir)
+
+def plot_score_file(scores_file, output_dir):
+    """Plots the clause averages of a partial scores file written by evaluate_dataset (.parquet or .csv)"""
+    from evaluation.average_partial_accuracies import aggregate_score_file
+    plot(*aggregate_score_file(scores_file), output_dir)
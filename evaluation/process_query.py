@@ -1,10 +1,11 @@
 import json
 import pandas as pd
 import unittest
-from preprocess.tokenize_query import tokenize
-from sqlglot import parse_one, expressions as exp, ParseError
+from typing import NamedTuple
+from sqlglot import parse_one, expressions as exp, ParseError, TokenError
 from other_utils.deserialize_db_model import deserialize_db_schema_model
 from evaluation.canonical_query_representation import *
+from evaluation.parse_cache import ParseCache
 #from utils.process_sql import *
 
 class Schema:
@@ -15,6 +16,7 @@ class Schema:
         self._schema = schema
         self._table = table
         self.idMap = self._map(self._schema, self._table)
+        self.column_index = self._column_index(self._table)
 
     @property
     def schema(self):
@@ -39,24 +41,82 @@ class Schema:
 
         self.idMap = idMap
         return self.idMap
-    
-def scan_alias(toks):
-    """Scan the index of 'as' and build the map for all alias"""
-    as_idxs = [idx for idx, tok in enumerate(toks) if tok == 'as']
+
+    def _column_index(self, table):
+        """Reverse index: column name -> {table name: col_id} over the tables that contain it, in schema order"""
+        table_names = [tab.lower() for tab in table['table_names_original']]
+        column_index = {}
+        for i, (tab_id, col) in enumerate(table['column_names_original']):
+            if tab_id < 0:
+                # Spider's (-1, '*') entry belongs to no table
+                continue
+            column_index.setdefault(col.lower(), {})[table_names[tab_id]] = i
+        return column_index
+
+    def resolve_column(self, col, tables, strict=False):
+        """Returns the col_id of an unqualified column in the first of `tables` that contains it (None if none do).
+        With strict=True a column found in more than one of the tables raises AmbiguousColumnError instead."""
+        candidates = self.column_index.get(col)
+        if not candidates:
+            return None
+        matches = [table_name for table_name in dict.fromkeys(tables) if table_name in candidates]
+        if not matches:
+            return None
+        if strict and len(matches) > 1:
+            raise AmbiguousColumnError(f"Column {col} is ambiguous between tables {', '.join(matches)}")
+        return candidates[matches[0]]
+
+class AmbiguousColumnError(KeyError):
+    """Raised when an unqualified column exists in several of the tables in scope (reported as a schema linking error)"""
+
+class SchemaIndex:
+    """
+    Builds the Schema (and its idMap) of each db_id on first use and reuses it for every later
+    query against that database
+    """
+    def __init__(self, schemas):
+        self.schemas = schemas
+        self._built = {}
+
+    def __getitem__(self, db_id) -> Schema:
+        schema = self._built.get(db_id)
+        if schema is None:
+            simplified_schema, _, table = get_reformatted(self.schemas, db_id)
+            schema = self._built[db_id] = Schema(simplified_schema, table)
+        return schema
+
+def parse_query_ast(query: str):
+    try:
+        return parse_one(query)
+    except (ParseError, TokenError):
+        raise ValueError("Query is syntactically incorrect, unable to be parsed!")
+
+def scan_alias(ast):
+    """Build the map alias -> table name for every aliased table in the query, including its subqueries"""
     alias = {}
-    for idx in as_idxs:
-        alias[toks[idx+1]] = toks[idx-1]
+    for table in ast.find_all(exp.Table):
+        if table.alias:
+            alias[table.alias.lower()] = table.name.lower()
     return alias
 
-def get_tables_with_alias(schema, toks):
-    tables = scan_alias(toks)
+def get_tables_with_alias(schema, ast):
+    tables = scan_alias(ast)
     for key in schema:
         assert key not in tables, "Alias {} has the same name in table".format(key)
         tables[key] = key
     return tables
 
+class ParseContext(NamedTuple):
+    """Per-query state shared by a SQLStandardizer and the nested standardizers it creates for subqueries"""
+    schema: Schema
+    tables_with_alias: dict
+    strict_columns: bool = False     # reject unqualified columns that are ambiguous between the tables in scope
+
+def build_parse_context(schema, ast, strict_columns=False):
+    return ParseContext(schema, get_tables_with_alias(schema.schema, ast), strict_columns)
+
 def get_reformatted(schemas, db_id):
-    db_names = list(schemas.keys())
+    db_names = schemas.keys()
     schema = schemas[db_id]
     #Object representing schema with table name as key and columns as corresponding values
     simplified_schema = {}
@@ -71,12 +131,10 @@ def get_reformatted(schemas, db_id):
 
 class SQLStandardizer:
 
-    def __init__(self, query: str, ast = None): 
-        try:
-            self.ast = parse_one(query) if not ast else ast
-        except ParseError:
-            raise ValueError("Query is syntactically incorrect, unable to be parsed!")
+    def __init__(self, query: str, context: ParseContext, ast = None):
+        self.ast = parse_query_ast(query) if ast is None else ast
         self.query = query
+        self.context = context
         self.IUE_PARSED = False
         self.standardized_query = {}
         self.default_tables = []
@@ -116,8 +174,8 @@ class SQLStandardizer:
         if left_query is None or right_query is None:
             return None
         self.IUE_PARSED = True
-        left_std = SQLStandardizer(left_query.sql(), left_query).get_sql()
-        right_std = SQLStandardizer(right_query.sql(), right_query).get_sql()
+        left_std = SQLStandardizer(left_query.sql(), self.context, left_query).get_sql()
+        right_std = SQLStandardizer(right_query.sql(), self.context, right_query).get_sql()
 
         return left_std, right_std
 
@@ -167,7 +225,7 @@ class SQLStandardizer:
     def parse_table_unit(self, table_expr):
         """Returns the table id and the table name (resolved)"""
         resolved_table_name = table_expr.this.name
-        table_id = SQLStandardizer.schema.idMap[resolved_table_name]
+        table_id = self.context.schema.idMap[resolved_table_name]
         return table_id, resolved_table_name
 
     def get_column_id(self, column_expr):
@@ -177,9 +235,9 @@ class SQLStandardizer:
         table_alias = column_expr.table if col != '*' else None
 
         if col == '*':
-            return SQLStandardizer.schema.idMap['*']
+            return self.context.schema.idMap['*']
         elif table_alias:
-            alias_mapping = SQLStandardizer.tables_with_alias.get(table_alias.lower())
+            alias_mapping = self.context.tables_with_alias.get(table_alias.lower())
             if isinstance(alias_mapping, dict):
                 # subquery schema
                 if col not in alias_mapping:
@@ -187,12 +245,12 @@ class SQLStandardizer:
                 return alias_mapping[col]
             else:
                 # base table name
+                if alias_mapping is None:
+                    raise KeyError(f"Unknown table alias {table_alias}")
                 key = alias_mapping + '.' + col
-                return SQLStandardizer.schema.idMap[key]
+                return self.context.schema.idMap[key]
         else:
-            for table_name in self.default_tables:
-                if col in SQLStandardizer.schema.schema[table_name]:
-                    return SQLStandardizer.schema.idMap[table_name + '.' + col]
+            return self.context.schema.resolve_column(col, self.default_tables, self.context.strict_columns)
 
     def parse_from(self, from_clause, joins):
         """Assume in the from clause, all table units are combined with join"""
@@ -204,7 +262,7 @@ class SQLStandardizer:
             table_units.append(TableUnit(TABLE_TYPE['table_unit'], table_id, None))
             self.default_tables.append(table_name)
         elif isinstance(base_table_expr, exp.Subquery):
-            sql = SQLStandardizer(base_table_expr.this.sql(), base_table_expr.this).get_sql()
+            sql = SQLStandardizer(base_table_expr.this.sql(), self.context, base_table_expr.this).get_sql()
             alias = base_table_expr.alias_or_name.lower()
             table_units.append((TABLE_TYPE['sql'], sql, None))
             
@@ -224,7 +282,7 @@ class SQLStandardizer:
                 table_units.append(TableUnit(TABLE_TYPE['table_unit'], table_id, kind))
                 self.default_tables.append(table_name)
             elif isinstance(join_table_expr, exp.Subquery):
-                sql = SQLStandardizer(join_table_expr.this.sql(), join_table_expr.this).get_sql()
+                sql = SQLStandardizer(join_table_expr.this.sql(), self.context, join_table_expr.this).get_sql()
                 kind = str(join.args.get('kind', 'INNER')).upper()
                 table_units.append((TABLE_TYPE['sql'], sql, kind))
             
@@ -330,7 +388,7 @@ class SQLStandardizer:
         if isinstance(value_node, exp.Null):
             return "null"
         if isinstance(value_node, exp.Subquery):
-            return SQLStandardizer(value_node.this.sql(), value_node.this).get_sql()
+            return SQLStandardizer(value_node.this.sql(), self.context, value_node.this).get_sql()
         elif isinstance(value_node, exp.Boolean):
             return value_node.this.lower() == "true"
         elif isinstance(value_node, exp.Literal):
@@ -342,20 +400,21 @@ class SQLStandardizer:
             return self.parse_col_unit(value_node)
 
 
-def parse_sql_query(sql: str, schema, db_id: str):
+def parse_sql_query(sql: str, schema, db_id: str, strict_columns: bool = False):
     """Helper to parse a SQL query into its structured representation. 
-    Returns None if parsing fails, along with error type."""
+    Returns None if parsing fails, along with error type.
+    With strict_columns, an unqualified column found in several tables in scope fails as "ambiguousColumn"
+    instead of resolving to the first of them."""
     try:
-        sql = sql.replace('"', "'")
-        tokens = tokenize(sql)
-        tables_with_alias = get_tables_with_alias(schema.schema, tokens)
-
-        SQLStandardizer.schema = schema
-        SQLStandardizer.tables_with_alias = tables_with_alias
-        parser = SQLStandardizer(sql.lower())
+        sql = sql.replace('"', "'").lower()
+        ast = parse_query_ast(sql)
+        context = build_parse_context(schema, ast, strict_columns)
+        parser = SQLStandardizer(sql, context, ast)
 
         parsed_rep = parser.get_sql()
         return parsed_rep, None
+    except AmbiguousColumnError:
+        return None, AMBIGUOUS_COLUMN_ERROR
     except ValueError:
         return None, "syntacticallyIncorrect"
     except NotImplementedError:
@@ -366,33 +425,58 @@ def parse_sql_query(sql: str, schema, db_id: str):
         return None, "other"
 
 
-def run_parser_on_dataset(dataset: str, output_file: str, schemas: map):
-    """Parses both gold and predicted queries, writes them + parsed reps to output."""
+PARSE_ERROR_TYPES = ("unhandled", "schemaLinkingError", "syntacticallyIncorrect", "other")
+# Only reported when parsing with strict_columns
+AMBIGUOUS_COLUMN_ERROR = "ambiguousColumn"
+
+def new_error_counts(strict_columns: bool = False) -> dict:
+    counts = {err: 0 for err in PARSE_ERROR_TYPES}
+    if strict_columns:
+        counts[AMBIGUOUS_COLUMN_ERROR] = 0
+    return counts
+
+def load_dataset_samples(dataset: str) -> list[tuple]:
+    """Reads the dataset csv into (db_id, question, gold_query, pred_query) tuples"""
     df = pd.read_csv(dataset, quotechar='"', doublequote=True)
+    return list(zip(df['db_id'], df['question'], df['query'], df['pred_query']))
+
+def parse_cache_namespace(strict_columns: bool = False) -> str:
+    """ParseCache namespace of the representations parsed with the given options"""
+    return 'strict_columns' if strict_columns else 'default'
+
+def parse_sample_pair(schema_index: SchemaIndex, db_id: str, gold_query: str, pred_query: str,
+                      parse_cache: ParseCache = None, strict_columns: bool = False):
+    """Parses the gold and predicted query of one sample against its db schema (see parse_sql_query for
+    strict_columns). Gold representations are looked up in parse_cache first, if given; its namespace must
+    match strict_columns (see parse_cache_namespace).
+    Returns (gold_rep, gold_err, pred_rep, pred_err)."""
+    schema = schema_index[db_id]
+
+    if parse_cache is not None:
+        # "other" covers unexpected (possibly environmental) failures, which are not worth persisting
+        gold_rep, gold_err = parse_cache.get_or_parse(db_id, schema, gold_query,
+                                                      lambda: parse_sql_query(gold_query, schema, db_id, strict_columns),
+                                                      cacheable=lambda value: value[1] != "other")
+    else:
+        gold_rep, gold_err = parse_sql_query(gold_query, schema, db_id, strict_columns)
+    pred_rep, pred_err = parse_sql_query(pred_query, schema, db_id, strict_columns)
+    return gold_rep, gold_err, pred_rep, pred_err
 
+
+def run_parser_on_dataset(dataset: str, output_file: str, schemas: map):
+    """Parses both gold and predicted queries, writes them + parsed reps to output."""
     # Storage for results
     gold_queries, pred_queries = [], []
     gold_parsed, pred_parsed = [], []
     questions = []
 
     # Error counters
-    counts = {"unhandled": 0,
-              "schemaLinkingError": 0,
-              "syntacticallyIncorrect": 0,
-              "other": 0}
-
-    for _, sample in df.iterrows():
-        db_id = sample['db_id']
-        question = sample['question']
-        gold_query = sample['query']
-        pred_query = sample['pred_query']
-
-        schema, _, table = get_reformatted(schemas, db_id)
-        schema = Schema(schema, table)
+    counts = new_error_counts()
+    schema_index = SchemaIndex(schemas)
 
+    for db_id, question, gold_query, pred_query in load_dataset_samples(dataset):
         # Parse both queries
-        gold_rep, gold_err = parse_sql_query(gold_query, schema, db_id)
-        pred_rep, pred_err = parse_sql_query(pred_query, schema, db_id)
+        gold_rep, gold_err, pred_rep, pred_err = parse_sample_pair(schema_index, db_id, gold_query, pred_query)
 
         if gold_err: counts[gold_err] += 1
         if pred_err: counts[pred_err] += 1
@@ -431,14 +515,12 @@ if __name__ == '__main__':
     db_id = 'concert_singer'
     schema, db_names, table = get_reformatted(schemas, db_id)
     schema = Schema(schema, table)
-    tokens = tokenize(sql)
-    tables_with_alias = get_tables_with_alias(schema.schema, tokens)
-    SQLStandardizer.schema = schema
-    SQLStandardizer.tables_with_alias = tables_with_alias
+    ast = parse_query_ast(sql.lower())
+    context = build_parse_context(schema, ast)
     print(schema.idMap)
-    print(tables_with_alias)
+    print(context.tables_with_alias)
     
-    parser = SQLStandardizer(sql.lower())
+    parser = SQLStandardizer(sql.lower(), context, ast)
     components = parser.ast.args
     print(parser.get_sql())
     
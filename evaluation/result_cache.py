@@ -0,0 +1,89 @@
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from evaluation.pickle_store import COMMIT_EVERY, PickleStore
+
+# Bump whenever the stored payload format changes so stale entries are never read back
+CACHE_VERSION = 1
+# Gold results kept in memory per run (least recently used first out)
+DEFAULT_MEMO_SIZE = 1024
+
+
+def normalize_sql(query: str) -> str:
+    """Collapses whitespace and drops a trailing semicolon; literals are left untouched"""
+    return re.sub(r"\s+", " ", str(query)).strip().rstrip(";").strip()
+
+
+class GoldResultCache:
+    """
+    Cache of gold query results (result DataFrame, error message) shared within and across runs.
+
+    Lookups are memoized in memory, so identical gold queries on the same database execute once per run. The memo
+    keeps the memo_size most recently used results (None: unbounded, 0: no memo), so long runs don't accumulate
+    every gold result set.
+    If cache_path is given, results are also persisted to a PickleStore keyed by (database, normalized SQL,
+    database file size + mtime), so re-scoring a new set of predictions only executes gold queries whose
+    database changed. Postgres databases have no file to fingerprint, so their persisted entries are only
+    invalidated by deleting the cache file. Caches sharing the file with other processes should use
+    commit_every=1 (see PickleStore).
+    """
+    def __init__(self, cache_path: str = None, namespace: str = 'dataframe', memo_size: int = DEFAULT_MEMO_SIZE,
+                 commit_every: int = COMMIT_EVERY):
+        self.cache_path = cache_path
+        # separates entries stored in different result representations
+        self.namespace = namespace
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._fingerprints = {}
+        self._store = PickleStore(cache_path, 'gold_results', commit_every) if cache_path else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_or_execute(self, db_path, query: str, execute, cacheable=None):
+        """Returns the cached (df, error) for query on db_path, calling execute() to fill the cache on a miss.
+
+        Values rejected by cacheable(value) are only memoized for this run, never persisted.
+        """
+        key = self.make_key(db_path, query)
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            return self._memo[key]
+
+        value = self._store.load(key) if self._store is not None else None
+        if value is None:
+            value = execute()
+            if self._store is not None and (cacheable is None or cacheable(value)):
+                self._store.store(key, value)
+        self._remember(key, value)
+        return value
+
+    def make_key(self, db_path, query: str) -> str:
+        db_key = db_path if isinstance(db_path, str) else tuple(db_path)
+        raw = repr((CACHE_VERSION, self.namespace, db_key, self._fingerprint(db_key), normalize_sql(query)))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def _remember(self, key, value):
+        if self.memo_size == 0:
+            return
+        self._memo[key] = value
+        if self.memo_size is not None and len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+    def _fingerprint(self, db_key):
+        if db_key not in self._fingerprints:
+            if isinstance(db_key, str) and os.path.exists(db_key):
+                stat = os.stat(db_key)
+                self._fingerprints[db_key] = (stat.st_size, stat.st_mtime_ns)
+            else:
+                self._fingerprints[db_key] = None
+        return self._fingerprints[db_key]
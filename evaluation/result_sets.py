@@ -0,0 +1,208 @@
+import hashlib
+import numbers
+from collections import Counter, defaultdict
+import numpy as np
+import pandas as pd
+
+"""Compares query result sets column by column using per-column fingerprints"""
+
+# Shared hash for SQL NULL, whether pandas materialized it as None or NaN
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+NULL_KEY = ('null',)
+
+
+RESULT_FORMATS = ('dataframe', 'rows', 'records')
+
+
+class RowResult:
+    """Result set fetched straight from a DB-API cursor: column names and a list of row tuples"""
+    __slots__ = ('columns', 'rows')
+
+    def __init__(self, columns: list, rows: list):
+        self.columns = columns
+        self.rows = rows
+
+    @property
+    def shape(self):
+        return len(self.rows), len(self.columns)
+
+    def __eq__(self, other):
+        return isinstance(other, RowResult) and self.columns == other.columns and self.rows == other.rows
+
+    def __repr__(self):
+        return f"RowResult(columns={self.columns!r}, rows={self.rows!r})"
+
+
+def fetch_result(cursor, result_format: str, max_rows: int = None):
+    """Builds a 'rows' (RowResult) or 'records' (NumPy record array) result from an executed cursor.
+
+    Returns None if more than max_rows rows are available.
+    """
+    if cursor.description is None:
+        raise ValueError("Query did not return a result set")
+    columns = [col_desc[0] for col_desc in cursor.description]
+    rows = cursor.fetchall() if max_rows is None else cursor.fetchmany(max_rows + 1)
+    if max_rows is not None and len(rows) > max_rows:
+        return None
+    rows = [tuple(row) for row in rows]
+    if result_format == 'rows':
+        return RowResult(columns, rows)
+    if result_format == 'records':
+        return to_record_array(columns, rows)
+    raise ValueError(f"Unknown result format {result_format}!")
+
+def to_record_array(columns: list, rows: list) -> np.recarray:
+    """Builds a record array with one field per result column (field names are positional, as columns may repeat)"""
+    names = [f"f{i}" for i in range(len(columns))]
+    if not rows:
+        return np.rec.fromarrays([np.empty(0, dtype=object) for _ in names], names=names) if names \
+            else np.recarray(0, dtype=[])
+    return np.rec.fromarrays([_column_array(values) for values in zip(*rows)], names=names)
+
+def _column_array(values) -> np.ndarray:
+    """A numeric array if every value is a non-NULL number, else an object array"""
+    array = np.asarray(values, dtype=object)
+    if not any(_is_null(v) for v in values):
+        inferred = np.asarray(values)
+        if inferred.dtype.kind in 'biuf':
+            array = inferred
+    return array
+
+def result_shape(result) -> tuple:
+    if isinstance(result, np.recarray):
+        return len(result), len(result.dtype.names or ())
+    return result.shape
+
+def result_to_list(result) -> list:
+    """Result rows as lists of plain values, as written by log_resultsets"""
+    if isinstance(result, RowResult):
+        return [list(row) for row in result.rows]
+    if isinstance(result, np.recarray):
+        return [list(row) for row in result.tolist()]
+    return result.values.tolist()
+
+
+class ColumnFingerprint:
+    """
+    Hashes one result column once so columns can be bucketed by content.
+
+    Equal columns always get equal fingerprints (numbers hash by value, so 1 and 1.0 collide, as do
+    None and NaN); unequal columns may collide too, which is why a fingerprint match is always confirmed
+    with an exact comparison.
+    """
+    def __init__(self, values: np.ndarray, series: pd.Series = None):
+        self.series = series
+        self.values = values
+        self.is_numeric = self.values.dtype.kind in 'biuf'
+        if self.is_numeric:
+            floats = self.values.astype(np.float64) + 0.0  # folds -0.0 into 0.0
+            self.hashes = floats.view(np.uint64).copy()
+            self.hashes[np.isnan(floats)] = NULL_HASH
+        else:
+            self.hashes = _hash_objects(self.values)
+
+    def key(self, order_sensitive: bool) -> bytes:
+        hashes = self.hashes if order_sensitive else np.sort(self.hashes)
+        return hashlib.blake2b(hashes.tobytes(), digest_size=16).digest()
+
+    def equals(self, other: 'ColumnFingerprint', order_sensitive: bool) -> bool:
+        """Exact comparison; row-by-row (dtype-strict, as Series.equals) or as multisets of values"""
+        if order_sensitive:
+            if self.series is not None and other.series is not None:
+                return self.series.equals(other.series)
+            if self.values.dtype != other.values.dtype:
+                return False
+            if self.is_numeric:
+                return np.array_equal(self.values, other.values, equal_nan=self.values.dtype.kind == 'f')
+            return _canonical_keys(self.values) == _canonical_keys(other.values)
+        if self.is_numeric and other.is_numeric and \
+                (self.values.dtype.kind == 'f') == (other.values.dtype.kind == 'f'):
+            # same numeric family: sorting keeps the comparison vectorized (NaNs sort last and compare equal)
+            is_float = self.values.dtype.kind == 'f'
+            return np.array_equal(np.sort(self.values), np.sort(other.values), equal_nan=is_float)
+        return Counter(_canonical_keys(self.values)) == Counter(_canonical_keys(other.values))
+
+
+def _is_null(value) -> bool:
+    return value is None or (isinstance(value, float) and value != value)
+
+def _canonical_keys(values):
+    """Hashable per-value keys under Python equality, with every NULL mapped to one key"""
+    values = values.tolist() if isinstance(values, np.ndarray) else values
+    return [NULL_KEY if _is_null(v) else v for v in values]
+
+def _hash_objects(values: np.ndarray) -> np.ndarray:
+    """Hashes an object column: numbers by float value, strings with pandas' vectorized hash, NULLs to NULL_HASH"""
+    hashes = np.empty(len(values), dtype=np.uint64)
+    numbers_idx, numbers_val, others_idx, others_val = [], [], [], []
+    for i, v in enumerate(values):
+        if _is_null(v):
+            hashes[i] = NULL_HASH
+        elif isinstance(v, numbers.Number) and not isinstance(v, complex):
+            numbers_idx.append(i)
+            numbers_val.append(float(v))
+        else:
+            others_idx.append(i)
+            others_val.append(v if isinstance(v, str) else repr(v))
+    if numbers_idx:
+        floats = np.asarray(numbers_val, dtype=np.float64) + 0.0
+        floats_hashes = floats.view(np.uint64).copy()
+        floats_hashes[np.isnan(floats)] = NULL_HASH
+        hashes[numbers_idx] = floats_hashes
+    if others_idx:
+        hashes[others_idx] = pd.util.hash_array(np.asarray(others_val, dtype=object))
+    return hashes
+
+
+def _fingerprint_columns(result) -> list:
+    if isinstance(result, np.recarray):
+        return [ColumnFingerprint(np.asarray(result[name])) for name in result.dtype.names or ()]
+    return [ColumnFingerprint(result.iloc[:, pos].to_numpy(), result.iloc[:, pos]) for pos in range(result.shape[1])]
+
+def _row_column_keys(result: RowResult, order_sensitive: bool) -> list:
+    """
+    Exact, hashable per-column keys: the column's dtype (as inferred for record arrays) and values in order,
+    or the multiset of its values. Like the dtype-strict DataFrame and record array comparisons, an integer
+    and a float column holding the same numbers only match if row order is ignored.
+    """
+    columns = list(zip(*result.rows)) if result.rows else [()] * len(result.columns)
+    if order_sensitive:
+        return [(_column_array(column).dtype.str, tuple(_canonical_keys(column))) for column in columns]
+    return [frozenset(Counter(_canonical_keys(column)).items()) for column in columns]
+
+
+def _greedy_match(gold_keys: list, pred_keys: list, equal_fn=None) -> bool:
+    """Matches each gold column to the first unused pred column in the same bucket (confirmed by equal_fn)"""
+    buckets = defaultdict(list)
+    for pos, key in enumerate(pred_keys):
+        buckets[key].append(pos)
+
+    used_pred = set()
+    for gold_pos, key in enumerate(gold_keys):
+        for pred_pos in buckets.get(key, []):
+            if pred_pos not in used_pred and (equal_fn is None or equal_fn(gold_pos, pred_pos)):
+                used_pred.add(pred_pos)
+                break
+        else:
+            return False
+    return True
+
+def match_result_sets(gold_df, pred_df, order_sensitive=False):
+    """Compare two result sets ignoring column order, enforcing row order only if needed.
+
+    Results are DataFrames, RowResults or record arrays (both sides in the same format). Each gold column is
+    matched greedily to the first unused pred column with equal content. DataFrame and record array columns are
+    fingerprinted once and bucketed, so only columns with equal fingerprints are compared exactly; RowResult
+    columns are bucketed by their exact values (and dtype, if order_sensitive).
+    """
+    if result_shape(gold_df) != result_shape(pred_df):
+        return False
+
+    if isinstance(gold_df, RowResult):
+        return _greedy_match(_row_column_keys(gold_df, order_sensitive), _row_column_keys(pred_df, order_sensitive))
+
+    gold_fingerprints = _fingerprint_columns(gold_df)
+    pred_fingerprints = _fingerprint_columns(pred_df)
+    return _greedy_match([f.key(order_sensitive) for f in gold_fingerprints],
+                         [f.key(order_sensitive) for f in pred_fingerprints],
+                         lambda g, p: gold_fingerprints[g].equals(pred_fingerprints[p], order_sensitive))
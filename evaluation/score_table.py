@@ -0,0 +1,171 @@
+import json
+import numpy as np
+import pandas as pd
+from operator import itemgetter
+from typing import NamedTuple
+
+# Pairs buffered per Parquet row group
+DEFAULT_ROW_GROUP_SIZE = 10000
+SCORE_FORMATS = ('csv', 'parquet')
+
+METRICS = ('f1', 'precision', 'recall')
+# Columns identifying the scored pair: its row in the input dataset and its database
+ID_COLUMNS = ('row', 'db_id')
+
+
+class ScoredPair(NamedTuple):
+    """Scores of one parsed gold/pred pair; row is the pair's position in the input dataset"""
+    row:        int
+    db_id:      str
+    question:   str
+    scores:     dict
+
+
+# flat score key -> (clause it is counted under, path to its precision/recall/f1 dict in a scores dict)
+SCORE_COLUMNS = {
+    'from-full': ('from', ('from', 'from')),
+    'from-table_only': ('from', ('from', 'table_only')),
+    'explicit_join_conds-col_only': ('explicit_join_conds', ('explicit_join_conds', 'col_only')),
+    'explicit_join_conds-conditions': ('explicit_join_conds', ('explicit_join_conds', 'conditions')),
+    'group': ('group', ('group',)),
+    'group_by_having': ('group_by_having', ('group_by_having',)),
+    'limit': ('limit', ('limit',)),
+    'order-order_by': ('order', ('order', 'order_by')),
+    'order-expressions_no_direction': ('order', ('order', 'expressions_no_direction')),
+    **{f'select-{k}': ('select', ('select', k)) for k in ['col_no_agg', 'col_no_distinct', 'distinct', 'select']},
+    **{f'where-{k}': ('where', ('where', k)) for k in ['col_only', 'conditions']},
+}
+
+# Flat field names, in column order: '<score key>.<metric>'
+SCORE_FIELDS = [f"{key}.{metric}" for key in SCORE_COLUMNS for metric in METRICS]
+
+def score_rows(all_scores):
+    """Flattens each nested score dict into a row of floats ordered like SCORE_FIELDS (NaN where the clause is absent).
+    Set-op mismatches (all-zero score dicts) score 0 on every field. Returns (rows, set-op mismatch flags)."""
+    nan_metrics = (np.nan,) * len(METRICS)
+    zero_row = [0.0] * len(SCORE_FIELDS)
+    paths = [(path[0], path[1] if len(path) > 1 else None) for _, path in SCORE_COLUMNS.values()]
+    get_metrics = itemgetter(*METRICS)
+    rows = []
+    mismatch = []
+    for scores in all_scores:
+        # every pair has a select score dict, except set-op mismatches
+        if not scores['select'] and all(val == 0 for val in scores.values()):
+            mismatch.append(True)
+            rows.append(zero_row)
+            continue
+        mismatch.append(False)
+        row = []
+        for clause, subkey in paths:
+            metrics = scores[clause]
+            if metrics is not None and subkey is not None:
+                metrics = metrics[subkey]
+            row.extend(nan_metrics if metrics is None else get_metrics(metrics))
+        rows.append(row)
+    return rows, mismatch
+
+def _score_frame(values, mismatch, rows=None, db_ids=None) -> pd.DataFrame:
+    columns = pd.MultiIndex.from_product([SCORE_COLUMNS.keys(), METRICS])
+    flat = pd.DataFrame(np.asarray(values, dtype=float).reshape(len(mismatch), len(SCORE_FIELDS)), columns=columns)
+    flat['set_op_mismatch'] = np.array(mismatch, dtype=bool)
+    if rows is not None:
+        flat['row'] = np.asarray(rows, dtype=np.int64)
+    if db_ids is not None:
+        flat['db_id'] = pd.Series(db_ids, dtype=object).to_numpy()
+    return flat
+
+def flatten_scores(all_scores, rows=None, db_ids=None) -> pd.DataFrame:
+    """
+    Flattens the nested score dicts into one row per pair with a float column per (score key, metric).
+    Clauses absent from a pair are NaN. Set-op mismatches (all-zero score dicts) score 0 on every column,
+    so they count against every clause; they are flagged in the 'set_op_mismatch' column.
+    The pairs' input rows and db_ids, if given, are kept in 'row' and 'db_id' columns.
+    """
+    values, mismatch = score_rows(all_scores)
+    return _score_frame(values, mismatch, rows, db_ids)
+
+def flatten_scored(scored) -> pd.DataFrame:
+    """flatten_scores over ScoredPairs, keeping their rows and db_ids"""
+    scored = list(scored)
+    return flatten_scores([pair.scores for pair in scored], [pair.row for pair in scored],
+                          [pair.db_id for pair in scored])
+
+
+class ParquetScoreWriter:
+    """
+    Writes partial scores to a Parquet file with one float64 column per (score key, metric), named like
+    'select-select.f1', plus 'row', 'db_id', 'question' and 'set_op_mismatch'. Rows are flushed every
+    row_group_size pairs, so the file is built incrementally instead of from one in-memory table.
+    """
+    def __init__(self, path: str, row_group_size: int = DEFAULT_ROW_GROUP_SIZE):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self.row_group_size = row_group_size
+        self.schema = pa.schema([('row', pa.int64()), ('db_id', pa.string()), ('question', pa.string()),
+                                 ('set_op_mismatch', pa.bool_())] +
+                                [(field, pa.float64()) for field in SCORE_FIELDS])
+        self._writer = pq.ParquetWriter(path, self.schema)
+        self._pairs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, scored):
+        """Adds ScoredPairs, flushing full row groups"""
+        for pair in scored:
+            self._pairs.append(pair)
+            if len(self._pairs) >= self.row_group_size:
+                self.flush()
+
+    def flush(self):
+        if not self._pairs:
+            return
+        rows, mismatch = score_rows([pair.scores for pair in self._pairs])
+        values = np.asarray(rows, dtype=float).reshape(len(rows), len(SCORE_FIELDS))
+        pa = self._pa
+        arrays = [pa.array([pair.row for pair in self._pairs], pa.int64()),
+                  pa.array([_optional_str(pair.db_id) for pair in self._pairs], pa.string()),
+                  pa.array([_optional_str(pair.question) for pair in self._pairs], pa.string()),
+                  pa.array(mismatch, pa.bool_())]
+        arrays += [pa.array(values[:, i], pa.float64()) for i in range(len(SCORE_FIELDS))]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self._pairs = []
+
+    def close(self):
+        if self._writer is not None:
+            self.flush()
+            self._writer.close()
+            self._writer = None
+
+def _optional_str(value):
+    return None if pd.isna(value) else str(value)
+
+
+def read_score_table(path: str, keys=None) -> pd.DataFrame:
+    """
+    Loads a partial scores file into the flatten_scores layout, including the 'row' and 'db_id' columns when the
+    file has them. Parquet files are read column-wise, only loading the given score keys (all by default);
+    csv files (json score dicts) are decoded and flattened.
+    """
+    keys = list(SCORE_COLUMNS) if keys is None else list(keys)
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        fields = [f"{key}.{metric}" for key in keys for metric in METRICS]
+        ids = [col for col in ID_COLUMNS if col in pq.read_schema(path).names]
+        table = pq.read_table(path, columns=['set_op_mismatch'] + ids + fields)
+        flat = pd.DataFrame({(key, metric): table.column(f"{key}.{metric}").to_numpy(zero_copy_only=False)
+                             for key in keys for metric in METRICS})
+        flat.columns = pd.MultiIndex.from_tuples(flat.columns)
+        flat['set_op_mismatch'] = table.column('set_op_mismatch').to_numpy(zero_copy_only=False).astype(bool)
+        for col in ids:
+            flat[col] = table.column(col).to_numpy(zero_copy_only=False)
+        return flat
+    df = pd.read_csv(path, dtype={'db_id': object})
+    ids = [col for col in ID_COLUMNS if col in df.columns]
+    flat = flatten_scores([json.loads(scores) for scores in df['Scores']],
+                          df['row'] if 'row' in ids else None, df['db_id'] if 'db_id' in ids else None)
+    return flat[keys + ['set_op_mismatch'] + ids]
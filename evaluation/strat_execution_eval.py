@@ -1,53 +1,228 @@
+import argparse
+import json
+import numpy as np
 import pandas as pd
+from typing import NamedTuple
+from evaluation.bootstrap import DEFAULT_RESAMPLES, DEFAULT_SEED, bootstrap_interval, paired_bootstrap_test
+from evaluation.execution_evaluate import SAMPLE_ID
 
 """Performs a stratified evaluation of the execution accuracy results over the extracted metadata"""
-def generate_stratified_accuracies(metadata_csv, accuracies_csv):
 
-    accuracies = {}
-    # Input Dataset with NLQ, gold, pred, and query/schema features
-    df_features = pd.read_csv(metadata_csv)
+RESULT_COLUMNS = ['db_id', 'correct', 'pred_error']
+CI_METHODS = ('wilson', 'bootstrap')
+
+
+class Stratum(NamedTuple):
+    """
+    One way of splitting the samples: by the distinct values of a metadata column, by the given ordered
+    categories, or by pd.cut bins. name is the key of its table in the accuracies dict, label its axis title.
+    """
+    name:       str
+    column:     str
+    label:      str = None
+    bins:       tuple = None
+    categories: tuple = None
+
+
+DEFAULT_STRATA = [
+    Stratum('acc_by_hardness', 'hardness', 'Hardness', categories=('easy', 'medium', 'hard', 'extra')),
+    Stratum('acc_by_joins', 'num_joins', 'Number of Joins'),
+    Stratum('acc_by_aggs', 'num_agg', 'Number of Aggregations'),
+    Stratum('acc_by_where', 'num_where_conditions', 'Number of WHERE Conditions'),
+    Stratum('acc_by_subqquery', 'has_subquery', 'Has Subquery (0=No,1=Yes)'),
+    Stratum('acc_by_query_length', 'query_length', 'Query Length (tokens)', bins=(0, 10, 20, 50, 100)),
+    Stratum('acc_by_num_tables', 'num_tables', 'Number of Tables (binned)', bins=(0, 1, 2, 3, 4, 5, 10, 15)),
+    Stratum('acc_by_total_schema_cols', 'num_columns', 'Total Schema Columns (binned)', bins=(0, 5, 10, 20, 50, 100)),
+    Stratum('acc_by_num_fkeys', 'num_foreign_keys', 'Number of Foreign Keys'),
+]
 
-    # Dataset with execution results
-    df_exec = pd.read_csv(accuracies_csv)
-    df_exec = df_exec.drop('db_id', axis=1)
+def load_strata(config_path: str) -> list[Stratum]:
+    """
+    Reads strata from a json list like
+        [{"name": "acc_by_joins", "column": "num_joins", "label": "Number of Joins"},
+         {"name": "acc_by_length", "column": "query_length", "bins": [0, 10, 20, 50, 100]}]
+    """
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    strata = []
+    for entry in config:
+        unknown = set(entry) - set(Stratum._fields)
+        if unknown:
+            raise ValueError(f"Unknown stratum field(s) {sorted(unknown)} in {config_path}!")
+        strata.append(Stratum(**{key: tuple(val) if isinstance(val, list) else val for key, val in entry.items()}))
+    return strata
 
-    df = pd.concat([df_features, df_exec], axis=1)
+def load_joined_results(metadata_csv, accuracies_csv, strata=DEFAULT_STRATA) -> pd.DataFrame:
+    """
+    Reads only the columns the strata and plots need and joins each metadata row to its execution result on
+    SAMPLE_ID, written by tag_features and the execution evaluation. Both files must cover the same samples.
+    """
+    feature_cols = {SAMPLE_ID, 'db_id'} | {stratum.column for stratum in strata}
+    df_features = pd.read_csv(metadata_csv, usecols=lambda col: col in feature_cols)
+    df_exec = pd.read_csv(accuracies_csv, usecols=lambda col: col in {SAMPLE_ID, *RESULT_COLUMNS})
+
+    missing = {stratum.column for stratum in strata} - set(df_features.columns)
+    if missing:
+        raise KeyError(f"Metadata is missing stratum column(s): {', '.join(sorted(missing))}")
+    for path, df_file in ((metadata_csv, df_features), (accuracies_csv, df_exec)):
+        if SAMPLE_ID not in df_file.columns:
+            raise ValueError(f"{path} has no {SAMPLE_ID} column to join on; regenerate it with this version!")
+
+    df = df_features.merge(df_exec, on=SAMPLE_ID, how='inner', validate='one_to_one', suffixes=('', '_exec'))
+    if len(df) != len(df_features) or len(df) != len(df_exec):
+        raise ValueError("Metadata and execution results don't cover the same samples!")
+    if 'db_id_exec' in df.columns:
+        if not (df['db_id'].astype(str) == df['db_id_exec'].astype(str)).all():
+            raise ValueError("Metadata and execution results disagree on db_id; the files are misaligned!")
+        df = df.drop(columns='db_id_exec')
     df["exec_accuracy"] = df["correct"].astype(int)
+    return df
 
-    # Average acc over Hardness Level (of gold query)
-    hardness_order = ["easy", "medium", "hard", "extra"]
-    df['hardness'] = pd.Categorical(df['hardness'], categories=hardness_order, ordered=True)
-    accuracies['acc_by_hardness'] = df.groupby("hardness")["exec_accuracy"].mean()
+def stratum_codes(values: pd.Series, stratum: Stratum):
+    """Returns (integer level per sample with -1 for none, level labels) for one stratum"""
+    if stratum.bins is not None:
+        binned = pd.cut(values, bins=list(stratum.bins))
+        return binned.cat.codes.to_numpy(), binned.cat.categories
+    if stratum.categories is not None:
+        categorical = pd.Categorical(values, categories=list(stratum.categories), ordered=True)
+        return categorical.codes, pd.CategoricalIndex(categorical.categories, ordered=True)
+    if values.dtype == bool:
+        values = values.astype(int)
+    codes, levels = pd.factorize(values, sort=True)
+    return codes, pd.Index(levels)
 
-    # Average acc over Number of Joins
-    accuracies['acc_by_joins'] = df.groupby("num_joins")["exec_accuracy"].mean()
+def wilson_interval(correct: np.ndarray, count: np.ndarray, confidence: float):
+    """Vectorized Wilson score interval for correct/count (NaN where count is 0)"""
+    from statistics import NormalDist
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = correct / count
+        denom = 1 + z ** 2 / count
+        center = (p + z ** 2 / (2 * count)) / denom
+        half = z * np.sqrt(p * (1 - p) / count + z ** 2 / (4 * count ** 2)) / denom
+    return center - half, center + half
 
-    # Average acc over Number of Aggregations
-    accuracies['acc_by_aggs'] = df.groupby("num_agg")["exec_accuracy"].mean()
+def stratum_level_codes(df: pd.DataFrame, strata=DEFAULT_STRATA):
+    """
+    Numbers the levels of all strata consecutively. Returns (codes, levels): codes holds one row of level
+    numbers per stratum (-1 where a sample falls in no level) and levels lists (stratum, labels, first level).
+    """
+    levels = []
+    codes = np.full((len(strata), len(df)), -1, dtype=np.int64)
+    offset = 0
+    for row, stratum in enumerate(strata):
+        stratum_level, labels = stratum_codes(df[stratum.column], stratum)
+        codes[row] = np.where(stratum_level >= 0, stratum_level + offset, -1)
+        levels.append((stratum, labels, offset))
+        offset += len(labels)
+    return codes, levels
 
-    # Average acc over Number of Where conditions
-    accuracies['acc_by_where'] = df.groupby("num_where_conditions")["exec_accuracy"].mean()
+def stratify(df: pd.DataFrame, strata=DEFAULT_STRATA, confidence: float = None, outcome: str = 'exec_accuracy',
+             method: str = 'wilson', resamples: int = DEFAULT_RESAMPLES, seed: int = DEFAULT_SEED):
+    """
+    Computes every stratum's per-level sample count and mean outcome in one pass: the levels of all strata are
+    numbered consecutively so a single weighted bincount yields all counts and sums.
+    Returns {stratum name: DataFrame indexed by level with 'count' and 'accuracy' columns}; with a confidence
+    level (e.g. 0.95) interval bounds are added as 'ci_low'/'ci_high', either Wilson score intervals or
+    percentile bootstrap intervals (all levels resampled in one batched pass, see evaluation.bootstrap).
+    Empty levels have NaN accuracy.
+    """
+    if method not in CI_METHODS:
+        raise ValueError(f"Unknown confidence interval method {method}!")
+    codes, levels = stratum_level_codes(df, strata)
+    n_levels = sum(len(labels) for _, labels, _ in levels)
+    codes = codes.ravel()
+    outcomes = np.tile(df[outcome].to_numpy(dtype=float), len(strata))
+    keep = codes >= 0
+    counts = np.bincount(codes[keep], minlength=n_levels)
+    sums = np.bincount(codes[keep], weights=outcomes[keep], minlength=n_levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / counts
+    if confidence is not None and method == 'wilson':
+        ci_low, ci_high = wilson_interval(sums, counts, confidence)
+    elif confidence is not None:
+        ci_low, ci_high = bootstrap_interval(outcomes, codes, n_levels, confidence, resamples=resamples, seed=seed)
 
-    # Average acc over Subquery status 
-    df['has_subquery'] = df['has_subquery'].astype(int)
-    accuracies['acc_by_subqquery'] = df.groupby('has_subquery')['exec_accuracy'].mean()
+    accuracies = {}
+    for stratum, labels, start in levels:
+        span = slice(start, start + len(labels))
+        table = pd.DataFrame({'count': counts[span], 'accuracy': means[span]}, index=labels)
+        if confidence is not None:
+            table['ci_low'], table['ci_high'] = ci_low[span], ci_high[span]
+        table.index.name = stratum.column
+        accuracies[stratum.name] = table
+    return accuracies
 
-    # Average acc over different query length (in tokens) bins
-    df["query_length_bin"] = pd.cut(df["query_length"], bins=[0,10,20,50,100])
-    accuracies['acc_by_query_length'] = df.groupby('query_length_bin')['exec_accuracy'].mean()
+def accuracy_interval(correct, confidence: float = 0.95, resamples: int = DEFAULT_RESAMPLES,
+                      seed: int = DEFAULT_SEED):
+    """Percentile bootstrap interval of the overall execution accuracy; returns (low, high)"""
+    low, high = bootstrap_interval(np.asarray(correct, dtype=float), confidence=confidence,
+                                   resamples=resamples, seed=seed)
+    return float(low[0]), float(high[0])
 
-    # Average acc over different number of tables
-    df["num_tables_bin"] = pd.cut(df["num_tables"], bins=[0,1,2,3,4,5,10,15])
-    accuracies['acc_by_num_tables'] = df.groupby("num_tables_bin")["exec_accuracy"].mean()
+def compare_stratified_accuracies(metadata_csv, accuracies_csv_a, accuracies_csv_b, strata=None,
+                                  resamples: int = DEFAULT_RESAMPLES, seed: int = DEFAULT_SEED):
+    """
+    Paired bootstrap test between two execution result files over the same samples, overall and per stratum
+    level, in one batched pass. Returns {'overall' or stratum name: DataFrame with 'count', 'accuracy_a',
+    'accuracy_b', 'delta' (a - b) and 'p_value'}.
+    """
+    strata = DEFAULT_STRATA if strata is None else strata
+    df_a = load_joined_results(metadata_csv, accuracies_csv_a, strata)
+    df_b = load_joined_results(metadata_csv, accuracies_csv_b, strata)
+    outcome_b = df_a[[SAMPLE_ID]].merge(df_b[[SAMPLE_ID, 'exec_accuracy']], on=SAMPLE_ID, how='left',
+                                        validate='one_to_one')['exec_accuracy'].to_numpy(dtype=float)
 
-    # Average acc over different count of total columns in schema
-    df["num_columns_bin"] = pd.cut(df["num_columns"], bins=[0, 5, 10, 20, 50, 100])
-    accuracies['acc_by_total_schema_cols'] = df.groupby("num_columns_bin")["exec_accuracy"].mean()
+    codes, levels = stratum_level_codes(df_a, strata)
+    n_levels = sum(len(labels) for _, labels, _ in levels)
+    # the overall accuracy is one more level that every sample belongs to
+    codes = np.concatenate([codes.ravel(), np.full(len(df_a), n_levels)])
+    outcome_a = df_a['exec_accuracy'].to_numpy(dtype=float)
+    outcomes_a, outcomes_b = np.tile(outcome_a, len(strata) + 1), np.tile(outcome_b, len(strata) + 1)
+    keep = codes >= 0
+    counts = np.bincount(codes[keep], minlength=n_levels + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means_a = np.bincount(codes[keep], weights=outcomes_a[keep], minlength=n_levels + 1) / counts
+        means_b = np.bincount(codes[keep], weights=outcomes_b[keep], minlength=n_levels + 1) / counts
+    delta, p_values = paired_bootstrap_test(outcomes_a, outcomes_b, codes, n_levels + 1,
+                                            resamples=resamples, seed=seed)
 
-    # Average acc over number of foreign keys in schema
-    accuracies['acc_by_num_fkeys'] = df.groupby("num_foreign_keys")["exec_accuracy"].mean()
-    return accuracies, df
+    comparisons = {}
+    for name, labels, start in [('overall', pd.Index(['all']), n_levels)] + \
+            [(stratum.name, labels, start) for stratum, labels, start in levels]:
+        span = slice(start, start + len(labels))
+        comparisons[name] = pd.DataFrame({'count': counts[span], 'accuracy_a': means_a[span],
+                                          'accuracy_b': means_b[span], 'delta': delta[span],
+                                          'p_value': p_values[span]}, index=labels)
+    return comparisons
+
+def generate_stratified_accuracies(metadata_csv, accuracies_csv, strata=None, confidence: float = None,
+                                   method: str = 'wilson', resamples: int = DEFAULT_RESAMPLES, seed: int = DEFAULT_SEED):
+    """Joins the metadata to the execution results and stratifies them; returns (accuracies, joined df)"""
+    strata = DEFAULT_STRATA if strata is None else strata
+    df = load_joined_results(metadata_csv, accuracies_csv, strata)
+    return stratify(df, strata, confidence, method=method, resamples=resamples, seed=seed), df
 
 
 if __name__ == '__main__':
-    accuracies, df = generate_stratified_accuracies("data/spider/test_with_metadata.csv", "execution_eval_results.csv")
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metadata", type=str, required=True,
+                        help="Dataset csv with the query/schema features of every sample")
+    parser.add_argument("--results", type=str, nargs='+', required=True,
+                        help="Execution results csv; with two files they are compared with a paired bootstrap test")
+    parser.add_argument("--strata_config", type=str, help="JSON file defining the strata")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals")
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES, help="Number of bootstrap resamples")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed of the bootstrap resampling")
+    args = parser.parse_args()
+
+    strata = load_strata(args.strata_config) if args.strata_config else None
+    if len(args.results) == 2:
+        tables = compare_stratified_accuracies(args.metadata, *args.results, strata, args.resamples, args.seed)
+    elif len(args.results) == 1:
+        tables, _ = generate_stratified_accuracies(args.metadata, args.results[0], strata, args.confidence,
+                                                   'bootstrap', args.resamples, args.seed)
+    else:
+        raise ValueError("Give one results file to stratify or two to compare!")
+    for name, table in tables.items():
+        print(f"{name}\n{table}\n")
@@ -0,0 +1,121 @@
+import csv
+import json
+import os
+import argparse
+from itertools import islice
+from evaluation.connection_pool import DEFAULT_POOL_SIZE
+from evaluation.execution_evaluate import make_settings, iter_results, iter_dataset_samples
+
+"""Execution evaluation that writes each result row as soon as it is scored and can resume an interrupted run"""
+
+CHECKPOINT_EVERY = 100
+STREAM_WINDOW = 5000
+# Gold results kept in memory while streaming; repeated gold queries are usually adjacent (same db_id)
+STREAM_GOLD_MEMO_SIZE = 64
+
+
+class ResultStreamWriter:
+    """
+    Appends result dicts to a csv (same layout as output_results_to_csv) and checkpoints progress.
+
+    Every checkpoint_every rows the csv is flushed and '<output_path>.ckpt' records how many samples are done,
+    how many were correct and the csv's byte offset. Resuming truncates anything written after the last
+    checkpoint, so a crash mid-row never leaves a torn line behind.
+    """
+    def __init__(self, output_path: str, resume: bool = False, checkpoint_every: int = CHECKPOINT_EVERY):
+        self.output_path = output_path
+        self.checkpoint_path = output_path + '.ckpt'
+        self.checkpoint_every = checkpoint_every
+        self.completed = 0
+        self.correct = 0
+        self.columns = None
+
+        if resume and os.path.exists(self.checkpoint_path) and os.path.exists(output_path):
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+            self.completed = checkpoint['completed']
+            self.correct = checkpoint['correct']
+            self.columns = checkpoint['columns']
+            self._file = open(output_path, 'r+', newline='', encoding='utf-8')
+            self._file.truncate(checkpoint['offset'])
+            self._file.seek(checkpoint['offset'])
+        else:
+            self._file = open(output_path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file, lineterminator=os.linesep)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, result: dict):
+        if self.columns is None:
+            self.columns = list(result.keys())
+            self._writer.writerow(self.columns)
+        elif list(result.keys()) != self.columns:
+            raise ValueError(f"Result columns {list(result.keys())} don't match the existing output {self.columns}!")
+        self._writer.writerow(['' if result[col] is None else result[col] for col in self.columns])
+        self.completed += 1
+        if result['correct']:
+            self.correct += 1
+        if self.completed % self.checkpoint_every == 0:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        state = {"completed": self.completed, "correct": self.correct,
+                 "offset": self._file.tell(), "columns": self.columns}
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def close(self):
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
+
+
+def evaluate_execution_streaming(samples, output_path: str, db_dir, engine: str, log_resultsets: bool,
+                                 pool_size: int = DEFAULT_POOL_SIZE, workers: int = 1, gold_cache_path: str = None,
+                                 timeout: float = None, max_rows: int = None, result_format: str = 'dataframe',
+                                 resume: bool = False, window: int = STREAM_WINDOW,
+                                 gold_memo_size: int = STREAM_GOLD_MEMO_SIZE):
+    """
+    Same evaluation as evaluate_execution, but results are written to output_path as they are produced instead
+    of being returned, and at most gold_memo_size gold results are memoized, so memory stays flat regardless of
+    dataset size. samples may be any iterable (e.g. iter_dataset_samples). With resume, the first samples already recorded by the checkpoint are skipped.
+    Returns the accuracy over all samples, including the ones scored before resuming.
+    """
+    settings = make_settings(db_dir, engine, log_resultsets, pool_size, gold_cache_path, timeout, max_rows,
+                             result_format, gold_memo_size)
+    with ResultStreamWriter(output_path, resume) as writer:
+        remaining = islice(samples, writer.completed, None)
+        for result in iter_results(remaining, settings, workers, window):
+            writer.write(result)
+        return writer.correct / writer.completed if writer.completed else 0.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_dataset", type=str,
+                        help="Dataset with gold and pred queries", required=True)
+    parser.add_argument("--db_dir", type=str,
+                        help="Directory containing either sqlite database files or postgres credentials to db", required=True)
+    parser.add_argument("--engine", type=str,
+                        help="Indicates whether to use sqlite or postgres", required=True)
+    parser.add_argument("--output_path", type=str,
+                        help="Output file for accuracy results per example", required=True)
+    parser.add_argument("--log_resultsets", action="store_true",
+                        help="Logs result sets")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (samples are sharded by db_id)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue a previously interrupted run from its checkpoint")
+    args = parser.parse_args()
+    accuracy = evaluate_execution_streaming(iter_dataset_samples(args.input_dataset), args.output_path, args.db_dir,
+                                            args.engine, args.log_resultsets, workers=args.workers,
+                                            resume=args.resume)
+    print(accuracy)
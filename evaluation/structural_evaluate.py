@@ -3,6 +3,17 @@ from collections import Counter
 import pprint
 from evaluation.process_query import *
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import threading
+from evaluation.score_table import ParquetScoreWriter, ScoredPair, SCORE_FORMATS
+
+# Number of samples a worker parses and scores per task
+DEFAULT_CHUNKSIZE = 500
+# Maximum number of equality results remembered while scoring one gold/pred pair
+MEMO_MAX_ENTRIES = 4096
+# 'greedy': first-fit matching of unordered clause elements; 'optimal': maximum bipartite matching
+MATCHING_MODES = ('greedy', 'optimal')
 
 score_keys = ['explicit_join_conds', 'from', 'group', 'group_by_having', 'limit', 'order', 'select', 'where']
 
@@ -28,6 +39,57 @@ def unordered_structural_match(gold_list, pred_list, equal_fn):
                 break
     return matches, len(gold_list), len(pred_list)
 
+def optimal_structural_match(gold_list, pred_list, equal_fn):
+    """Maximum bipartite matching for unhashable elements (deterministic, independent of element order).
+    Structurally identical gold/pred elements are paired first via their hash-consed ids, then augmenting
+    paths fix up the remainder; equal_fn is called once per distinct (gold, pred) structure pair at most.
+    Returns: (matches, len(gold_list), len(pred_list))
+    """
+    memo = getattr(_pair_scope, "memo", None) or EqualityMemo()
+    gold_ids = [memo.node_id(g) for g in gold_list]
+    pred_ids = [memo.node_id(p) for p in pred_list]
+    edges = {}
+
+    def equal(gi, pj):
+        key = (gold_ids[gi], pred_ids[pj])
+        if key not in edges:
+            edges[key] = equal_fn(gold_list[gi], pred_list[pj])
+        return edges[key]
+
+    gold_match = [None] * len(gold_list)
+    pred_match = [None] * len(pred_list)
+
+    # exact matches: bucket preds by structure
+    buckets = defaultdict(list)
+    for pj in reversed(range(len(pred_list))):
+        buckets[pred_ids[pj]].append(pj)
+    for gi, gold_id in enumerate(gold_ids):
+        bucket = buckets.get(gold_id)
+        if bucket and equal(gi, bucket[-1]):
+            pj = bucket.pop()
+            gold_match[gi], pred_match[pj] = pj, gi
+
+    def augment(gi, visited):
+        for pj in range(len(pred_list)):
+            if pj not in visited and equal(gi, pj):
+                visited.add(pj)
+                if pred_match[pj] is None or augment(pred_match[pj], visited):
+                    gold_match[gi], pred_match[pj] = pj, gi
+                    return True
+        return False
+
+    for gi in range(len(gold_list)):
+        if gold_match[gi] is None:
+            augment(gi, set())
+    matches = sum(1 for pj in gold_match if pj is not None)
+    return matches, len(gold_list), len(pred_list)
+
+def structural_match(gold_list, pred_list, equal_fn):
+    """Unordered matching using the matching mode of the pair being scored (greedy outside compare_sql_components)"""
+    if getattr(_pair_scope, "matching", None) == 'optimal':
+        return optimal_structural_match(gold_list, pred_list, equal_fn)
+    return unordered_structural_match(gold_list, pred_list, equal_fn)
+
 def ordered_structural_match(gold_list, pred_list, equal_fn):
     """Match pairwise by position. gold_list and pred_list are sequences.
     Returns: (matches, len(gold_list), len(pred_list))
@@ -45,6 +107,62 @@ def ordered_structural_match(gold_list, pred_list, equal_fn):
                 matches += 1
     return matches, len(gold_list), len(pred_list)
 
+# ---------- memoized equality ----------
+class EqualityMemo:
+    """
+    Equality results remembered while scoring one gold/pred pair, so repeated comparisons of the same
+    (sub)structures - e.g. a nested subquery compared against every pred condition - are computed once.
+
+    Units are hash-consed: every distinct structure gets a small integer id built from its type and the ids
+    of its children (dicts by sorted key), so structurally identical units share an id and lookups never
+    rehash whole subtrees. Scalars are keyed with their type because operand_equal treats 1 and 1.0 as different.
+    """
+    def __init__(self, max_entries: int = MEMO_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._results = {}
+        self._node_ids = {}
+        # id(obj) -> (obj, node id); holding obj keeps its id from being reused during the pair
+        self._obj_ids = {}
+
+    def node_id(self, obj) -> int:
+        cached = self._obj_ids.get(id(obj))
+        if cached is not None:
+            return cached[1]
+        if isinstance(obj, dict):
+            key = (dict,) + tuple((k, self.node_id(v)) for k, v in sorted(obj.items()))
+        elif isinstance(obj, (tuple, list)):
+            key = (type(obj),) + tuple(self.node_id(v) for v in obj)
+        else:
+            key = (type(obj), obj)
+        node = self._node_ids.setdefault(key, len(self._node_ids))
+        self._obj_ids[id(obj)] = (obj, node)
+        return node
+
+    def get(self, key):
+        return self._results.get(key)
+
+    def put(self, key, result):
+        if len(self._results) < self.max_entries:
+            self._results[key] = result
+
+# The memo and matching mode of the pair currently being scored, per thread
+_pair_scope = threading.local()
+
+def memoized_equality(equal_fn):
+    """Memoizes equal_fn(gold, pred) in the active pair's EqualityMemo (a plain call outside compare_sql_components)"""
+    @functools.wraps(equal_fn)
+    def wrapper(gold, pred):
+        memo = getattr(_pair_scope, "memo", None)
+        if memo is None:
+            return equal_fn(gold, pred)
+        key = (equal_fn.__name__, memo.node_id(gold), memo.node_id(pred))
+        result = memo.get(key)
+        if result is None:
+            result = equal_fn(gold, pred)
+            memo.put(key, result)
+        return result
+    return wrapper
+
 # ---------- column extraction ----------
 def extract_all_col_units(unit):
     """Return list of ColUnit objects contained in unit (ColUnit or nested ValUnit)."""
@@ -84,6 +202,7 @@ def operand_equal(op1: Any, op2: Any) -> bool:
 
     return False
 
+@memoized_equality
 def equal_val_units(gold: ValUnit, pred: ValUnit):
     """Compare ValUnit structures (operator + operands); supports commutativity for add/mul."""
     g_unit_op, g_operand1, g_operand2 = gold
@@ -125,6 +244,7 @@ def opposing_comparison_signs(signs: tuple[str]):
     gold_op, pred_op = signs
     return OPPOSING_SIGNS.get(gold_op) == pred_op
 
+@memoized_equality
 def equal_atomic_conditions(gold_cond, pred_cond):
     if getattr(gold_cond, "not_op", False) != getattr(pred_cond, "not_op", False):
         return False
@@ -167,7 +287,7 @@ def get_limit_score(gold_limit, pred_limit):
     return safe_prf1(match, 1, 1)
 
 def calc_select_score(gold_select_vals: list, pred_select_vals: list):
-    full_matches, gold_len, pred_len = unordered_structural_match(gold_select_vals, pred_select_vals, equal_val_units)
+    full_matches, gold_len, pred_len = structural_match(gold_select_vals, pred_select_vals, equal_val_units)
 
     gold_col_units = [u for unit in gold_select_vals for u in extract_all_col_units(unit)]
     pred_col_units = [u for unit in pred_select_vals for u in extract_all_col_units(unit)]
@@ -187,13 +307,13 @@ def calc_select_score(gold_select_vals: list, pred_select_vals: list):
     }
 
 def calc_from_score(gold_tables: list, pred_tables: list):
-    full_matches, gold_len, pred_len = unordered_structural_match(gold_tables, pred_tables, equal_table_units)
+    full_matches, gold_len, pred_len = structural_match(gold_tables, pred_tables, equal_table_units)
 
     # Table-only ignoring join type
     def table_type_only(t): 
         return TableUnit(getattr(t, "table_type", None), getattr(t, "table", None))
     
-    table_matches, _, _ = unordered_structural_match([table_type_only(t) for t in gold_tables],
+    table_matches, _, _ = structural_match([table_type_only(t) for t in gold_tables],
                                                     [table_type_only(t) for t in pred_tables],
                                                     lambda g, p: equal_table_units(g, p, include_join=False))
     return {
@@ -220,7 +340,7 @@ def calc_order_by_score(gold_list: list, pred_list: list):
         }
     full_matches, num_gold_orders, num_pred_orders = ordered_structural_match(gold_list, pred_list, equal_val_units)
     # undirected expression match (ignore direction)
-    undirected_matches, _, _ = unordered_structural_match([v for v, _ in gold_list], [v for v, _ in pred_list], equal_val_units)
+    undirected_matches, _, _ = structural_match([v for v, _ in gold_list], [v for v, _ in pred_list], equal_val_units)
     return {
         "order_by": safe_prf1(full_matches, num_gold_orders, num_pred_orders),
         "expressions_no_direction": safe_prf1(undirected_matches, num_gold_orders, num_pred_orders),
@@ -238,7 +358,7 @@ def calc_condition_score(gold_condition: list, pred_condition: list):
     gold_atomic = [c for c in gold_condition if not isinstance(c, str)]
     pred_atomic = [c for c in pred_condition if not isinstance(c, str)]
 
-    cond_matches, num_gold_conds, num_pred_conds = unordered_structural_match(gold_atomic, pred_atomic, equal_atomic_conditions)
+    cond_matches, num_gold_conds, num_pred_conds = structural_match(gold_atomic, pred_atomic, equal_atomic_conditions)
 
     gold_cols = [cu.col_id for cond in gold_atomic for u in (cond.operand, getattr(cond, "val1", None)) for cu in extract_all_col_units(u)]
     pred_cols = [cu.col_id for cond in pred_atomic for u in (cond.operand, getattr(cond, "val1", None)) for cu in extract_all_col_units(u)]
@@ -252,6 +372,7 @@ def calc_condition_score(gold_condition: list, pred_condition: list):
     }
 
 # ---------- SQL dict equality (uses f1 only) ----------
+@memoized_equality
 def equal_sql_dict(gold_sql: dict, pred_sql: dict) -> bool:
     """Return True only if every component's F1 == 1 (or component is None)."""
     scores = compare_sql_components(gold_sql, pred_sql)
@@ -270,7 +391,24 @@ def equal_sql_dict(gold_sql: dict, pred_sql: dict) -> bool:
     return all_f1_ones(scores)
 
 # ---------- top-level SQL comparator (returns PRF dicts for each clause) ----------
-def compare_sql_components(gold_sql: dict, pred_sql: dict):
+def compare_sql_components(gold_sql: dict, pred_sql: dict, matching: str = None):
+    """Scores every clause of pred_sql against gold_sql; equality checks are memoized for the whole pair.
+    matching ('greedy' by default, or 'optimal') selects how unordered clause elements are matched."""
+    if getattr(_pair_scope, "memo", None) is not None:
+        # nested call from equal_sql_dict: share the pair's memo and matching mode
+        return _compare_sql_components(gold_sql, pred_sql)
+    matching = matching or 'greedy'
+    if matching not in MATCHING_MODES:
+        raise ValueError(f"Unknown matching mode {matching}!")
+    _pair_scope.memo = EqualityMemo()
+    _pair_scope.matching = matching
+    try:
+        return _compare_sql_components(gold_sql, pred_sql)
+    finally:
+        _pair_scope.memo = None
+        _pair_scope.matching = None
+
+def _compare_sql_components(gold_sql: dict, pred_sql: dict):
     scores = {}
     # Handle set/op constructs (INTERSECT/EXCEPT/UNION) by walking left/right.
     left_gold, left_pred = gold_sql, pred_sql
@@ -331,23 +469,106 @@ def handle_set_op_mismatch():
     """
     return {key: 0 for key in score_keys}
 
-def evaluate_dataset(dataset: str, output_file: str, parsing_errors_log_file, schemas):
+def score_samples(samples, schema_index: SchemaIndex, parse_cache_path: str = None, matching: str = 'greedy',
+                  parse_cache: ParseCache = None, first_row: int = 0, strict_columns: bool = False):
+    """Parses and scores a list of (db_id, question, gold_query, pred_query) samples, the first of which is row
+    first_row of the dataset. Returns the parse error counts and a ScoredPair for every pair that parsed, in
+    input order. Gold queries are looked up in parse_cache if given, else in a ParseCache on parse_cache_path.
+    strict_columns counts ambiguous unqualified columns as parse errors (see parse_sql_query)."""
+    if parse_cache is None:
+        with ParseCache(parse_cache_path, parse_cache_namespace(strict_columns)) as parse_cache:
+            return score_samples(samples, schema_index, matching=matching, parse_cache=parse_cache,
+                                 first_row=first_row, strict_columns=strict_columns)
+    counts = new_error_counts(strict_columns)
+    scored = []
+    for row, (db_id, question, gold_query, pred_query) in enumerate(samples, first_row):
+        gold_rep, gold_err, pred_rep, pred_err = parse_sample_pair(schema_index, db_id, gold_query, pred_query,
+                                                                   parse_cache, strict_columns)
+        if gold_err: counts[gold_err] += 1
+        if pred_err: counts[pred_err] += 1
+        if gold_err is None and pred_err is None:
+            scored.append(ScoredPair(row, db_id, question, compare_sql_components(gold_rep, pred_rep, matching)))
+    return counts, scored
+
+# Schema index of the current worker process, set once by the pool initializer so that schemas are
+# neither pickled per chunk nor rebuilt per chunk
+_worker_schema_index = None
+
+def _init_worker(schemas):
+    global _worker_schema_index
+    _worker_schema_index = SchemaIndex(schemas)
+
+def _score_chunk(samples, parse_cache_path, matching, first_row, strict_columns):
+    # the cache file is shared with the other workers, so every insert is committed right away
+    with ParseCache(parse_cache_path, parse_cache_namespace(strict_columns), commit_every=1) as parse_cache:
+        return score_samples(samples, _worker_schema_index, matching=matching, parse_cache=parse_cache,
+                             first_row=first_row, strict_columns=strict_columns)
+
+def iter_scored_chunks(samples: list, schemas, workers: int = 1, chunksize: int = DEFAULT_CHUNKSIZE,
+                       parse_cache_path: str = None, matching: str = 'greedy', strict_columns: bool = False):
+    """Yields (counts, scored) per chunk of samples, in input order; chunks are spread over a process pool if workers > 1"""
+    starts = range(0, len(samples), chunksize)
+    chunks = [samples[start:start + chunksize] for start in starts]
+    if workers <= 1:
+        schema_index = SchemaIndex(schemas)
+        with ParseCache(parse_cache_path, parse_cache_namespace(strict_columns)) as parse_cache:
+            for start, chunk in zip(starts, chunks):
+                yield score_samples(chunk, schema_index, matching=matching, parse_cache=parse_cache, first_row=start,
+                                    strict_columns=strict_columns)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(schemas,)) as executor:
+        yield from executor.map(_score_chunk, chunks, [parse_cache_path] * len(chunks), [matching] * len(chunks),
+                                starts, [strict_columns] * len(chunks))
+
+def evaluate_dataset(dataset: str, output_file: str, parsing_errors_log_file, schemas,
+                     workers: int = 1, chunksize: int = DEFAULT_CHUNKSIZE, parse_cache_path: str = None,
+                     matching: str = 'greedy', score_format: str = 'csv', strict_columns: bool = False):
+    """Parses and scores every gold/pred pair of the dataset in chunks of `chunksize`, spread across a process pool
+    if workers > 1; scores are written in the input order either way.
+    parse_cache_path persists the parsed gold queries, so later runs on the same gold set only parse predictions.
+    matching is passed on to compare_sql_components. With strict_columns, queries using an unqualified column that
+    several of their tables have fail to parse and are counted as "ambiguousColumn" errors instead of being
+    resolved to the first of those tables.
+    Every scored pair is written with its dataset row and db_id, so scores can be grouped by db_id or joined
+    to other per-sample metadata (see average_partial_accuracies.aggregate_results_by_group).
+    score_format 'csv' writes each pair's scores as a json string and returns the list of score dicts; 'parquet'
+    writes one column per clause metric (see evaluation.score_table), one row group per chunk as chunks complete,
+    without keeping the scores in memory, and returns None (read the file back with read_score_table)."""
+    if matching not in MATCHING_MODES:
+        raise ValueError(f"Unknown matching mode {matching}!")
+    if score_format not in SCORE_FORMATS:
+        raise ValueError(f"Unknown score format {score_format}!")
+    samples = load_dataset_samples(dataset)
+    counts = new_error_counts(strict_columns)
+    rows, db_ids, questions = [], [], []
     all_scores = []
-    all_scores_str = []
-    counts, questions, gold_parsed, pred_parsed = run_parser_on_dataset(dataset, '', schemas)
+    writer = ParquetScoreWriter(output_file) if score_format == 'parquet' else None
+    try:
+        for chunk_counts, scored in iter_scored_chunks(samples, schemas, workers, chunksize, parse_cache_path, matching,
+                                                       strict_columns):
+            for err, n in chunk_counts.items():
+                counts[err] += n
+            if writer is not None:
+                writer.write(scored)
+                writer.flush()
+                continue
+            for row, db_id, question, scores in scored:
+                rows.append(row)
+                db_ids.append(db_id)
+                questions.append(question)
+                all_scores.append(scores)
+    finally:
+        if writer is not None:
+            writer.close()
     with open(parsing_errors_log_file, 'w') as error_f:
         json.dump(counts, error_f)
-    i = 0
-    for g_parsed, p_parsed in zip(gold_parsed, pred_parsed):
-        scores = compare_sql_components(g_parsed, p_parsed)
-        all_scores.append(scores)
-        all_scores_str.append(json.dumps(scores))
-        #print(questions[i])
-        i += 1
-        
-    df = pd.DataFrame({'Question' : questions, 'Scores' : all_scores_str})
-    df.to_csv(output_file)
-    return all_scores
+
+    if writer is None:
+        all_scores_str = [json.dumps(scores) for scores in all_scores]
+        df = pd.DataFrame({'row' : rows, 'db_id' : db_ids, 'Question' : questions, 'Scores' : all_scores_str})
+        df.to_csv(output_file, index=False)
+        return all_scores
+    return None
 
 
 
@@ -1,6 +1,7 @@
 import os
 import sqlite3
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 def analyze_sqlite_schema(db_path):
     conn = sqlite3.connect(db_path)
@@ -31,14 +32,65 @@ def analyze_sqlite_schema(db_path):
         "num_foreign_keys": total_foreign_keys
     }
 
-def analyze_directory(base_dir, output_path):
-    results = {}
+def find_sqlite_files(base_dir):
+    """Returns (db_name, db_path) for every .sqlite file below base_dir, the folder name serving as db id"""
+    db_files = []
     for root, dirs, files in os.walk(base_dir):
         for file in files:
             if file.endswith(".sqlite"):
-                db_path = os.path.join(root, file)
-                db_name = os.path.basename(root)  # folder name as ID
-                results[db_name] = analyze_sqlite_schema(db_path)
+                db_files.append((os.path.basename(root), os.path.join(root, file)))
+    return db_files
+
+def load_stats_cache(cache_path):
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # unreadable cache: start over, it's rebuilt below
+        return {}
+
+def save_stats_cache(cache_path, cache):
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+def analyze_directory(base_dir, output_path, cache_path=None, workers=None):
+    """
+    Writes schema stats for every sqlite database below base_dir to output_path.
+
+    Databases are analyzed concurrently by a thread pool (workers threads, the executor's default if None).
+    If cache_path is given, stats are persisted there keyed by absolute file path, size and mtime, so later
+    runs only re-analyze new or changed databases.
+    """
+    db_files = find_sqlite_files(base_dir)
+    cache = load_stats_cache(cache_path)
+
+    results = {}
+    stale = []
+    for db_name, db_path in db_files:
+        stat = os.stat(db_path)
+        key = os.path.abspath(db_path)
+        entry = cache.get(key)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            results[db_name] = entry["stats"]
+        else:
+            results[db_name] = None  # placeholder keeps the directory walk order
+            stale.append((db_name, db_path, key, stat))
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            all_stats = executor.map(analyze_sqlite_schema, [db_path for _, db_path, _, _ in stale])
+            for (db_name, _, key, stat), stats in zip(stale, all_stats):
+                results[db_name] = stats
+                cache[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "stats": stats}
+        if cache_path is not None:
+            save_stats_cache(cache_path, cache)
 
     with open(output_path, "w") as f:
         json.dump(results, f, indent=4)
@@ -3,29 +3,44 @@ import pandas as pd
 
 """Adds fields to each sample/row in the given dataset csv for schema details"""
 
-def main(schema_stats_file, input_file, output_file):
-     with open(schema_stats_file, 'r') as file:
-        schema_stats = json.load(file)
-        df = pd.read_csv(input_file)
-
-        table_counts = []
-        col_counts = []
-        fkey_counts = []
-
-        for i in range(len(df)):
-            row = df.iloc[i]
-            db_id = row['db_id']
-            stats = schema_stats[db_id]
+MISSING_DB_POLICIES = ('error', 'keep', 'drop')
 
-            table_counts.append(stats['num_tables'])
-            col_counts.append(stats['num_columns'])
-            fkey_counts.append(stats['num_foreign_keys'])
-
-        df['num_tables'] = table_counts
-        df['num_columns'] = col_counts
-        df['num_foreign_keys'] = fkey_counts
-
-        df.to_csv(output_file, index=False)
+def load_schema_stats(schema_stats_file) -> pd.DataFrame:
+    """Loads the per-database stats json as a table with a db_id column plus one column per stat"""
+    with open(schema_stats_file, 'r') as file:
+        schema_stats = json.load(file)
+    stats_df = pd.DataFrame.from_dict(schema_stats, orient='index')
+    stats_df.index.name = 'db_id'
+    return stats_df.reset_index()
+
+def link_schema_stats(df: pd.DataFrame, stats_df: pd.DataFrame, on_missing: str = 'error') -> pd.DataFrame:
+    """
+    Attaches every stat column of stats_df to df with one keyed merge on db_id.
+
+    Existing columns of the same name are overwritten in place. Rows whose db_id has no stats either raise
+    a KeyError ('error'), keep NaN stats ('keep') or are removed ('drop').
+    """
+    if on_missing not in MISSING_DB_POLICIES:
+        raise ValueError(f"on_missing must be one of {MISSING_DB_POLICIES}")
+    merged = df[['db_id']].merge(stats_df, on='db_id', how='left', validate='many_to_one', indicator=True)
+    unknown = merged['_merge'] == 'left_only'
+    if unknown.any() and on_missing == 'error':
+        unknown_ids = sorted(merged.loc[unknown, 'db_id'].astype(str).unique())
+        raise KeyError(f"No schema stats for db_id(s): {', '.join(unknown_ids)}")
+
+    df = df.copy()
+    for col in stats_df.columns:
+        if col != 'db_id':
+            df[col] = merged[col].to_numpy()
+    if on_missing == 'drop':
+        df = df[~unknown.to_numpy()]
+    return df
+
+def main(schema_stats_file, input_file, output_file, on_missing='error'):
+    stats_df = load_schema_stats(schema_stats_file)
+    df = pd.read_csv(input_file)
+    df = link_schema_stats(df, stats_df, on_missing)
+    df.to_csv(output_file, index=False)
 
 if __name__ == '__main__':
 
@@ -33,4 +48,3 @@ if __name__ == '__main__':
     input_file = 'data/spider/test_with_metadata.csv'
     output_file = input_file
 
-   
\ No newline at end of file
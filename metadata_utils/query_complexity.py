@@ -4,12 +4,55 @@ from sqlglot import parse_one, expressions as exp
 from metadata_utils.hardness_level import classify
 from metadata_utils.sql_features import SQLFeatures
 from dataclasses import asdict
+from functools import lru_cache
+from typing import NamedTuple, Optional
 
 HARDNESS = {
     "component1": ('where', 'group', 'order', 'limit', 'join', 'or', 'like'),
     "component2": ('except', 'union', 'intersect')
 }
 
+# Number of distinct query texts whose parsed features are kept in memory
+QUERY_CACHE_SIZE = 4096
+
+class ASTFeatures(NamedTuple):
+    """Query features derived from a single walk over the query's sqlglot AST"""
+    num_select_cols:        int
+    num_where_conditions:   int
+    num_group_by:           int
+    num_order_attributes:   int
+    num_table_aliases:      int
+    num_tables:             int
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def analyze_query(query: str) -> Optional[ASTFeatures]:
+    """Parses the query once and collects every AST-based feature; returns None if it can't be parsed"""
+    try:
+        sql_ast = sqlglot.parse_one(query)
+    except Exception as e:
+        print(f"Failed to parse query: {e}")
+        return None
+
+    num_select_cols = num_where_conditions = num_group_by = num_order_attributes = 0
+    aliases, tables = set(), set()
+    for node in sql_ast.walk():
+        if isinstance(node, exp.Select):
+            num_select_cols += len(node.expressions)
+        elif isinstance(node, exp.Where):
+            num_where_conditions += count_conditions(node.this)
+        elif isinstance(node, exp.Group):
+            num_group_by += len(node.expressions)
+        elif isinstance(node, exp.Order):
+            num_order_attributes += len(node.expressions)
+        elif isinstance(node, exp.Table):
+            tables.add(node.name)
+            if node.alias:
+                aliases.add(node.alias)
+
+    return ASTFeatures(num_select_cols, num_where_conditions, num_group_by, num_order_attributes,
+                       len(aliases), len(tables))
+
+
 class QueryComplexity:
 
     """Takes in a dict representing the json for a query-containing sample"""
@@ -20,6 +63,11 @@ class QueryComplexity:
             raise AttributeError('query or query tokens not provided')
         self.feature_set = None
 
+    @property
+    def ast_features(self) -> Optional[ASTFeatures]:
+        """Features from the (cached) single parse of this query, None if it isn't parseable"""
+        return analyze_query(self.query)
+
     def get_hardness_level(self) -> str:
         """Classifies the query 'hardness' as defined in hardness_criteria """
         self.extract_features()
@@ -55,11 +103,16 @@ class QueryComplexity:
 
     def get_involved_tables(self):
         """Gets the number of table aliases (not just distinct table names) to account for self-joins"""
-        aliases = (Parser(self.query)).tables_aliases
-        return len(aliases)
+        features = self.ast_features
+        if features is None:
+            return len(Parser(self.query).tables_aliases)
+        return features.num_table_aliases
 
     def num_tables_used(self):
-        return len(Parser(self.query).tables)
+        features = self.ast_features
+        if features is None:
+            return len(Parser(self.query).tables)
+        return features.num_tables
 
     def get_num_joins(self):
         """Number of joins is tracked since #involved tables is not always 1:1 with #joins"""
@@ -79,56 +132,30 @@ class QueryComplexity:
         return "order" in self.tokens
 
     def count_select_columns(self):
-        try:
-            sql_ast = sqlglot.parse_one(self.query)
-            select_exprs = sql_ast.find_all(exp.Select)
-            return sum(len(expr.expressions) for expr in select_exprs)
-        except Exception as e:
-            print(f"Failed to count SELECT columns: {e}")
-            return -1
-
-    def _count_conditions_recursive(self, expr):
-        #print(f"Visiting: {expr} | type: {type(expr)}")
-        if isinstance(expr, (exp.And, exp.Or)):
-            sub_exprs = expr.flatten()
-            return sum(self._count_conditions_recursive(e) for e in sub_exprs)
-        elif is_condition_node(expr):
-            return 1
-        else:
-            return 0
+        features = self.ast_features
+        return features.num_select_cols if features is not None else -1
 
     def count_where_conditions(self):
-        try:
-            sql_ast = sqlglot.parse_one(self.query)
-            total_count = 0
-            for where_expr in sql_ast.find_all(exp.Where):
-                total_count += self._count_conditions_recursive(where_expr.this)
-            return total_count
-        except Exception as e:
-            print(f"Failed to parse or count WHERE conditions: {e}")
-            return -1
+        features = self.ast_features
+        return features.num_where_conditions if features is not None else -1
     
     def count_group_by(self):
-        try:
-            sql_ast = sqlglot.parse_one(self.query)
-            total_count = 0
-            for group_by_expr in sql_ast.find_all(exp.Group):
-                total_count += len(group_by_expr.expressions)
-            return total_count
-        except Exception as e:
-            print(f"Failed to parse or count GROUP BY conditions: {e}")
-            return -1
+        features = self.ast_features
+        return features.num_group_by if features is not None else -1
     
     def count_order_by(self):
-        try:
-            sql_ast = sqlglot.parse_one(self.query)
-            total_count = 0
-            for order_expr in sql_ast.find_all(exp.Order):
-                total_count += len(order_expr.expressions)
-            return total_count
-        except Exception as e:
-            print(f"Failed to parse or count ORDER BY conditions: {e}")
-            return -1
+        features = self.ast_features
+        return features.num_order_attributes if features is not None else -1
+
+def count_conditions(expr):
+    """Counts the atomic conditions in a (possibly AND/OR nested) condition expression"""
+    if isinstance(expr, (exp.And, exp.Or)):
+        sub_exprs = expr.flatten()
+        return sum(count_conditions(e) for e in sub_exprs)
+    elif is_condition_node(expr):
+        return 1
+    else:
+        return 0
 
 def is_condition_node(node):
     return isinstance(node, (
@@ -35,6 +35,7 @@ def main(input_dataset, output_path, convert_to_csv):
             hardness = qc.get_hardness_level()  
 
             data = {
+                "sample_id": idx,  # joins the features to the execution results of the same dataset row
                 "db_id": db_id,
                 "question": question,
                 "gold": gold_query,
@@ -1,6 +1,49 @@
-import nltk
-from nltk import word_tokenize 
-nltk.download('punkt_tab')
+import os
+import re
+
+# punkt_tab is looked up in NLTK's usual locations plus this directory, and downloaded here if missing
+NLTK_DATA_DIR = os.path.join(os.path.expanduser("~"), ".cache", "text2sql-eval", "nltk_data")
+# Set to 1 to never download NLTK data (the fallback tokenizer is used if punkt_tab isn't available locally)
+OFFLINE_ENV_VAR = "TEXT2SQL_EVAL_NLTK_OFFLINE"
+
+# Word-level split used when punkt_tab can't be loaded: like NLTK's word_tokenize on SQL, it keeps
+# dotted names and decimals (T1.name, 3.5) together and emits every other symbol as its own token
+FALLBACK_TOKEN_RE = re.compile(r"[\w.]+|[^\w\s]")
+
+_word_tokenize = None
+
+def fallback_word_tokenize(string):
+    return FALLBACK_TOKEN_RE.findall(string)
+
+def load_word_tokenizer():
+    """Returns NLTK's word_tokenize if punkt_tab is available locally (downloading it once unless offline),
+    otherwise the pure-Python fallback tokenizer"""
+    try:
+        import nltk
+    except ImportError:
+        return fallback_word_tokenize
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.append(NLTK_DATA_DIR)
+    try:
+        nltk.data.find('tokenizers/punkt_tab')
+        return nltk.word_tokenize
+    except LookupError:
+        pass
+    if os.environ.get(OFFLINE_ENV_VAR, "0") not in ("", "0"):
+        return fallback_word_tokenize
+    try:
+        if nltk.download('punkt_tab', download_dir=NLTK_DATA_DIR, quiet=True, raise_on_error=True):
+            return nltk.word_tokenize
+    except Exception:
+        pass
+    return fallback_word_tokenize
+
+def word_tokenize(string):
+    """Tokenizes with the tokenizer resolved on first use (once per process)"""
+    global _word_tokenize
+    if _word_tokenize is None:
+        _word_tokenize = load_word_tokenizer()
+    return _word_tokenize(string)
 
 def tokenize(string):
     string = str(string)
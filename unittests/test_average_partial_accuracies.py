@@ -0,0 +1,101 @@
+import math
+import os
+import tempfile
+import unittest
+import pandas as pd
+from evaluation.average_partial_accuracies import (
+    aggregate_results_by_clause, aggregate_results_by_group, flatten_scores, group_averages_to_frame,
+    load_group_metadata
+)
+from evaluation.score_table import ScoredPair
+from evaluation.structural_evaluate import handle_set_op_mismatch
+
+
+def prf(value):
+    return {"precision": value, "recall": value / 2, "f1": value / 4}
+
+
+def make_scores(select, where=None, limit=None):
+    return {
+        'select': {'select': prf(select), 'col_no_agg': prf(select), 'col_no_distinct': prf(select), 'distinct': prf(1.0)},
+        'from': {'from': prf(1.0), 'table_only': prf(1.0)},
+        'explicit_join_conds': None,
+        'where': None if where is None else {'conditions': prf(where), 'col_only': prf(where)},
+        'group': None,
+        'group_by_having': None,
+        'order': None,
+        'limit': None if limit is None else prf(limit),
+    }
+
+
+class TestAggregateResultsByClause(unittest.TestCase):
+
+    def setUp(self):
+        self.scores = [make_scores(1.0, where=0.5), make_scores(0.0, limit=1.0), handle_set_op_mismatch()]
+
+    def test_flatten_scores(self):
+        flat = flatten_scores(self.scores)
+        self.assertEqual(len(flat), 3)
+        self.assertEqual(flat[('where-conditions', 'precision')].iloc[0], 0.5)
+        self.assertTrue(math.isnan(flat[('where-conditions', 'precision')].iloc[1]))
+        self.assertEqual(flat[('group', 'f1')].iloc[2], 0.0)
+        self.assertEqual(list(flat['set_op_mismatch']), [False, False, True])
+
+    def test_clause_averages(self):
+        f1, precision, recall = aggregate_results_by_clause(self.scores)
+        # clauses are averaged over the pairs that have them, plus the set-op mismatch
+        self.assertAlmostEqual(precision['select-select'], 1.0 / 3)
+        self.assertAlmostEqual(precision['where-conditions'], 0.5 / 2)
+        self.assertAlmostEqual(recall['limit'], 0.5 / 2)
+        self.assertAlmostEqual(f1['from-full'], 0.5 / 3)
+        # clauses no pair has are left out
+        self.assertNotIn('group', f1)
+        self.assertNotIn('order-order_by', precision)
+
+    def test_group_averages(self):
+        # dataset row 1 failed to parse, so the scored pairs are rows 0, 2 and 3
+        flat = flatten_scores(self.scores, rows=[0, 2, 3], db_ids=['a', 'b', 'a'])
+        metadata = pd.DataFrame({'hardness': ['easy', 'hard', 'medium', 'easy']})
+        grouped = aggregate_results_by_group(flat, ['db_id', 'hardness'], metadata)
+        f1, precision, recall = grouped['db_id']['a']
+        self.assertAlmostEqual(precision['select-select'], 0.5)
+        self.assertAlmostEqual(precision['where-conditions'], 0.25)
+        self.assertNotIn('limit', precision)
+        self.assertEqual(grouped['db_id']['b'][1]['limit'], 1.0)
+        self.assertEqual(sorted(grouped['hardness']), ['easy', 'medium'])
+        self.assertEqual(grouped['hardness']['medium'][1]['limit'], 1.0)
+        self.assertAlmostEqual(grouped['hardness']['easy'][1]['select-select'], 0.5)
+        scored = [ScoredPair(row, db_id, "q", scores) for row, db_id, scores in zip([0, 2, 3], 'aba', self.scores)]
+        self.assertEqual(aggregate_results_by_group(scored, ['db_id']), {'db_id': grouped['db_id']})
+        frame = group_averages_to_frame(grouped['db_id'])
+        self.assertEqual(list(frame.index), ['a', 'b'])
+        self.assertAlmostEqual(frame.loc['a', 'select-select.precision'], 0.5)
+        with self.assertRaises(KeyError):
+            aggregate_results_by_group(flat, ['hardness'])
+        with self.assertRaises(ValueError):
+            aggregate_results_by_group(flatten_scores(self.scores), ['db_id'])
+
+    def test_group_metadata_alignment(self):
+        flat = flatten_scores(self.scores, rows=[0, 2, 3], db_ids=['a', 'b', 'a'])
+        metadata = pd.DataFrame({'db_id': ['a', 'a', 'b', 'a'], 'hardness': ['easy', 'hard', 'medium', 'easy']})
+        self.assertEqual(sorted(aggregate_results_by_group(flat, ['hardness'], metadata)['hardness']),
+                         ['easy', 'medium'])
+        with self.assertRaises(ValueError):
+            aggregate_results_by_group(flat, ['hardness'], metadata.iloc[::-1].reset_index(drop=True))
+        with self.assertRaises(ValueError):
+            aggregate_results_by_group(flat, ['hardness'], metadata.iloc[:3])
+
+    def test_load_group_metadata(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metadata_csv = os.path.join(tmp_dir, "metadata.csv")
+            pd.DataFrame({'db_id': ['a'], 'question': ['q'], 'hardness': ['easy']}).to_csv(metadata_csv, index=False)
+            metadata = load_group_metadata(metadata_csv, ['db_id', 'hardness'])
+            self.assertEqual(list(metadata.columns), ['db_id', 'hardness'])
+            self.assertIsNone(load_group_metadata(None, ['db_id']))
+            with self.assertRaisesRegex(KeyError, "num_joins"):
+                load_group_metadata(metadata_csv, ['hardness', 'num_joins'])
+            with self.assertRaises(KeyError):
+                load_group_metadata(None, ['hardness'])
+
+if __name__ == '__main__':
+    unittest.main()
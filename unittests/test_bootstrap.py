@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+from evaluation.bootstrap import bootstrap_interval, bootstrap_means, level_means, paired_bootstrap_test
+
+
+class TestBootstrap(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.correct = (rng.random(2000) < 0.7).astype(float)
+        self.codes = rng.integers(0, 3, 2000)
+
+    def test_seeded_and_batched(self):
+        first = bootstrap_means(self.correct, self.codes, 4, resamples=500, seed=1)
+        batched = bootstrap_means(self.correct, self.codes, 4, resamples=500, seed=1, batch_elements=20)
+        np.testing.assert_array_equal(first, bootstrap_means(self.correct, self.codes, 4, resamples=500, seed=1))
+        self.assertEqual(first.shape, (500, 4))
+        self.assertTrue(np.isnan(first[:, 3]).all())
+        # batching changes the draws but not their distribution
+        np.testing.assert_allclose(first[:, :3].mean(axis=0), batched[:, :3].mean(axis=0), atol=0.01)
+
+    def test_discrete_and_index_resampling_agree(self):
+        scores = np.random.default_rng(3).random(2000)
+        by_index = bootstrap_means(scores, self.codes, resamples=2000)
+        # few distinct values take the multinomial path
+        by_counts = bootstrap_means(np.round(scores), self.codes, resamples=2000)
+        expected = level_means(scores, self.codes)
+        np.testing.assert_allclose(by_index.mean(axis=0), expected, atol=0.005)
+        sizes = np.bincount(self.codes)
+        np.testing.assert_allclose(by_index.std(axis=0), scores.std() / np.sqrt(sizes), rtol=0.1)
+        np.testing.assert_allclose(by_counts.std(axis=0), 0.5 / np.sqrt(sizes), rtol=0.1)
+
+    def test_interval_covers_mean(self):
+        low, high = bootstrap_interval(self.correct, confidence=0.95, resamples=2000)
+        mean = self.correct.mean()
+        half_width = 1.96 * np.sqrt(mean * (1 - mean) / len(self.correct))
+        self.assertAlmostEqual(low[0], mean - half_width, delta=0.005)
+        self.assertAlmostEqual(high[0], mean + half_width, delta=0.005)
+
+    def test_paired_test(self):
+        flipped = self.correct.copy()
+        flipped[:200] = 1.0
+        delta, p_values = paired_bootstrap_test(flipped, self.correct, self.codes, resamples=2000)
+        np.testing.assert_allclose(delta, level_means(flipped - self.correct, self.codes))
+        self.assertTrue((p_values < 0.01).all())
+        delta, p_values = paired_bootstrap_test(self.correct, self.correct, resamples=100)
+        self.assertEqual((delta[0], p_values[0]), (0.0, 1.0))
+        with self.assertRaises(ValueError):
+            paired_bootstrap_test(self.correct, self.correct[:10])
+
+
+if __name__ == '__main__':
+    unittest.main()
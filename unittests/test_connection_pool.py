@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from evaluation.connection_pool import ConnectionPool
+from evaluation.execution_evaluate import execute_query
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_paths = []
+        for name in ("a", "b", "c"):
+            db_path = os.path.join(self.tmp_dir.name, f"{name}.sqlite")
+            conn = sqlite3.connect(db_path)
+            conn.execute("CREATE TABLE singer (singer_id INTEGER, name TEXT)")
+            conn.execute("INSERT INTO singer VALUES (1, 'Joe'), (2, 'Ann')")
+            conn.commit()
+            conn.close()
+            self.db_paths.append(db_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_reuses_connection_per_db(self):
+        with ConnectionPool('sqlite') as pool:
+            first = pool.acquire(self.db_paths[0])
+            second = pool.acquire(self.db_paths[0])
+            self.assertIs(first, second)
+            self.assertEqual(len(pool), 1)
+
+    def test_bounded_size_evicts_least_recently_used(self):
+        with ConnectionPool('sqlite', max_size=2) as pool:
+            oldest = pool.acquire(self.db_paths[0])
+            pool.acquire(self.db_paths[1])
+            pool.acquire(self.db_paths[2])
+            self.assertEqual(len(pool), 2)
+            with self.assertRaises(sqlite3.ProgrammingError):
+                oldest.execute("SELECT 1")
+
+    def test_unhealthy_connection_is_replaced(self):
+        with ConnectionPool('sqlite', health_check_interval=0) as pool:
+            stale = pool.acquire(self.db_paths[0])
+            stale.close()
+            fresh = pool.acquire(self.db_paths[0])
+            self.assertIsNot(stale, fresh)
+            self.assertEqual(fresh.execute("SELECT count(*) FROM singer").fetchone()[0], 2)
+
+    def test_writes_do_not_leak_between_queries(self):
+        with ConnectionPool('sqlite') as pool:
+            execute_query(self.db_paths[0], "DELETE FROM singer", 'sqlite', pool)
+            df, err = execute_query(self.db_paths[0], "SELECT * FROM singer", 'sqlite', pool)
+        self.assertIsNone(err)
+        self.assertEqual(len(df), 2)
+
+    def test_close_all(self):
+        pool = ConnectionPool('sqlite')
+        conn = pool.acquire(self.db_paths[0])
+        pool.close_all()
+        self.assertEqual(len(pool), 0)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import json
+import subprocess
+import sys
+import unittest
+from entrypoint import IMPORT_BUDGET
+
+PIPELINE_IMPORTS = {
+    'startup': ["entrypoint"],
+    'exec': ["evaluation.execution_evaluate", "evaluation.stream_execution_eval"],
+    'component': ["other_utils.deserialize_db_model", "evaluation.structural_evaluate",
+                  "evaluation.average_partial_accuracies"],
+}
+
+
+def loaded_modules(modules):
+    """Imports the modules in a fresh interpreter and returns the top-level packages it ended up loading"""
+    code = ("import json, sys\n" + "".join(f"import {m}\n" for m in modules) +
+            "print(json.dumps(sorted({name.split('.')[0] for name in sys.modules})))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return set(json.loads(output))
+
+
+class TestImportBudget(unittest.TestCase):
+
+    def test_pipelines_stay_within_budget(self):
+        for stage, modules in PIPELINE_IMPORTS.items():
+            with self.subTest(stage=stage):
+                loaded = loaded_modules(["entrypoint"] + modules)
+                self.assertEqual(loaded & set(IMPORT_BUDGET[stage]), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from evaluation import execution_evaluate
+from evaluation.execution_evaluate import (
+    evaluate_execution, evaluate_models, execute_query, categorize_error, load_model_samples, shard_by_db_id
+)
+
+
+class TestEvaluateExecution(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = self.tmp_dir.name
+        for db_id in ("concert_singer", "pets_1"):
+            os.makedirs(os.path.join(self.db_dir, db_id))
+            conn = sqlite3.connect(os.path.join(self.db_dir, db_id, f"{db_id}.sqlite"))
+            conn.execute("CREATE TABLE singer (singer_id INTEGER, name TEXT, age INTEGER)")
+            conn.execute("INSERT INTO singer VALUES (1, 'Joe', 30), (2, 'Ann', 25), (3, 'Bo', 41)")
+            conn.commit()
+            conn.close()
+        self.samples = [
+            {"db_id": "concert_singer", "gold": "SELECT count(*) FROM singer", "pred": "SELECT count(singer_id) FROM singer"},
+            {"db_id": "pets_1", "gold": "SELECT name FROM singer ORDER BY age", "pred": "SELECT name FROM singer"},
+            {"db_id": "concert_singer", "gold": "SELECT name, age FROM singer", "pred": "SELECT age, name FROM singer"},
+            {"db_id": "pets_1", "gold": "SELECT name FROM singer", "pred": "SELECT nme FROM singer"},
+        ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_serial(self):
+        accuracy, results = evaluate_execution(self.samples, self.db_dir, 'sqlite', False)
+        self.assertEqual([r["correct"] for r in results], [True, False, True, False])
+        self.assertEqual(results[3]["pred_error"], "Missing Column")
+        self.assertEqual(accuracy, 0.5)
+
+    def test_parallel_matches_serial(self):
+        serial = evaluate_execution(self.samples, self.db_dir, 'sqlite', True)
+        parallel = evaluate_execution(self.samples, self.db_dir, 'sqlite', True, workers=2)
+        self.assertEqual(serial, parallel)
+
+    def test_parallel_workers_share_gold_cache(self):
+        cache_path = os.path.join(self.tmp_dir.name, "gold.sqlite")
+        for db_id in ("flight_2", "car_1"):
+            os.makedirs(os.path.join(self.db_dir, db_id))
+            conn = sqlite3.connect(os.path.join(self.db_dir, db_id, f"{db_id}.sqlite"))
+            conn.execute("CREATE TABLE singer (singer_id INTEGER, name TEXT, age INTEGER)")
+            conn.execute("INSERT INTO singer VALUES (1, 'Joe', 30)")
+            conn.commit()
+            conn.close()
+        samples = [{"db_id": db_id, "gold": f"SELECT age + {i} FROM singer", "pred": "SELECT age FROM singer"}
+                   for db_id in ("concert_singer", "pets_1", "flight_2", "car_1") for i in range(100)]
+        expected = evaluate_execution(samples, self.db_dir, 'sqlite', False)
+        for _ in range(2):
+            self.assertEqual(evaluate_execution(samples, self.db_dir, 'sqlite', False, workers=4,
+                                                gold_cache_path=cache_path), expected)
+        conn = sqlite3.connect(cache_path)
+        self.assertEqual(conn.execute("SELECT count(*) FROM gold_results").fetchone()[0], len(samples))
+        conn.close()
+
+    def model_samples(self):
+        # model "b" fixes the ORDER BY sample and repeats "a" elsewhere
+        fixed = {1: "SELECT name FROM singer ORDER BY age"}
+        return [{"db_id": s["db_id"], "gold": s["gold"], "preds": {"a": s["pred"], "b": fixed.get(i, s["pred"])}}
+                for i, s in enumerate(self.samples)]
+
+    def test_models_match_single_runs(self):
+        samples = self.model_samples()
+        accuracies, results = evaluate_models(samples, ["a", "b"], self.db_dir, 'sqlite', False)
+        self.assertEqual(accuracies, {"a": 0.5, "b": 0.75})
+        for model in ("a", "b"):
+            single = [{"db_id": s["db_id"], "gold": s["gold"], "pred": s["preds"][model]} for s in samples]
+            _, single_results = evaluate_execution(single, self.db_dir, 'sqlite', False)
+            self.assertEqual([r[f"{model}_correct"] for r in results], [r["correct"] for r in single_results])
+            self.assertEqual([r[f"{model}_pred_error"] for r in results], [r["pred_error"] for r in single_results])
+        self.assertEqual(evaluate_models(samples, ["a", "b"], self.db_dir, 'sqlite', True, workers=2),
+                         evaluate_models(samples, ["a", "b"], self.db_dir, 'sqlite', True))
+
+    def test_models_execute_gold_once(self):
+        with mock.patch.object(execution_evaluate, "execute_query", wraps=execute_query) as execute:
+            evaluate_models(self.model_samples(), ["a", "b"], self.db_dir, 'sqlite', False)
+        # 4 gold queries and the predictions of "a"; "b" either repeats "a" or its gold query
+        self.assertEqual(execute.call_count, 8)
+
+    def test_load_model_samples(self):
+        dataset = os.path.join(self.tmp_dir.name, "dataset.csv")
+        pd.DataFrame({"db_id": [s["db_id"] for s in self.samples], "query": [s["gold"] for s in self.samples],
+                      "question": "q", "pred_query": [s["pred"] for s in self.samples]}).to_csv(dataset, index=False)
+        pred_file = os.path.join(self.tmp_dir.name, "model_b.csv")
+        pd.DataFrame({"pred_query": ["SELECT 1"] * 4}).to_csv(pred_file, index=False)
+        models, samples = load_model_samples(dataset, ["pred_query"], [pred_file])
+        self.assertEqual(models, ["pred_query", "model_b"])
+        self.assertEqual(samples[3], {"sample_id": 3, "db_id": "pets_1", "gold": "SELECT name FROM singer",
+                                      "preds": {"pred_query": "SELECT nme FROM singer", "model_b": "SELECT 1"}})
+        pd.DataFrame({"pred_query": ["SELECT 1"]}).to_csv(pred_file, index=False)
+        with self.assertRaises(ValueError):
+            load_model_samples(dataset, pred_files=[pred_file])
+
+    def test_shard_by_db_id(self):
+        self.assertEqual(sorted(shard_by_db_id(self.samples)), [[0, 2], [1, 3]])
+
+    def test_timeout(self):
+        db_path = os.path.join(self.db_dir, "pets_1", "pets_1.sqlite")
+        runaway = ("WITH RECURSIVE cnt(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM cnt) "
+                   "SELECT count(*) FROM cnt")
+        df, err = execute_query(db_path, runaway, 'sqlite', timeout=0.2)
+        self.assertIsNone(df)
+        self.assertEqual(categorize_error(err), "Timeout")
+
+    def test_row_cap(self):
+        db_path = os.path.join(self.db_dir, "pets_1", "pets_1.sqlite")
+        df, err = execute_query(db_path, "SELECT * FROM singer AS a, singer AS b", 'sqlite', max_rows=5)
+        self.assertIsNone(df)
+        self.assertEqual(categorize_error(err), "Result Too Large")
+        df, err = execute_query(db_path, "SELECT * FROM singer", 'sqlite', max_rows=3)
+        self.assertIsNone(err)
+        self.assertEqual(len(df), 3)
+
+    def test_limit_errors_flow_into_results(self):
+        samples = [{"db_id": "pets_1", "gold": "SELECT name FROM singer",
+                    "pred": "SELECT a.name FROM singer AS a, singer AS b"}]
+        _, results = evaluate_execution(samples, self.db_dir, 'sqlite', False, max_rows=3)
+        self.assertEqual(results[0]["pred_error"], "Result Too Large")
+        self.assertIsNone(results[0]["gold_error"])
+
+    def test_raw_result_formats_match_dataframe(self):
+        _, expected = evaluate_execution(self.samples, self.db_dir, 'sqlite', True)
+        for result_format in ('rows', 'records'):
+            _, results = evaluate_execution(self.samples, self.db_dir, 'sqlite', True, result_format=result_format)
+            self.assertEqual([r["correct"] for r in results], [r["correct"] for r in expected])
+            self.assertEqual([r["gold_rs"] for r in results], [r["gold_rs"] for r in expected])
+
+    def test_raw_result_format_row_cap(self):
+        db_path = os.path.join(self.db_dir, "pets_1", "pets_1.sqlite")
+        df, err = execute_query(db_path, "SELECT * FROM singer", 'sqlite', max_rows=2, result_format='rows')
+        self.assertIsNone(df)
+        self.assertEqual(categorize_error(err), "Result Too Large")
+
+
+if __name__ == '__main__':
+    unittest.main()
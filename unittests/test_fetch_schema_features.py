@@ -0,0 +1,79 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from metadata_utils import fetch_schema_features
+from metadata_utils.fetch_schema_features import analyze_directory
+
+
+def make_db(db_dir, db_id, tables):
+    os.makedirs(os.path.join(db_dir, db_id))
+    db_path = os.path.join(db_dir, db_id, f"{db_id}.sqlite")
+    conn = sqlite3.connect(db_path)
+    for table in tables:
+        conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+class TestAnalyzeDirectory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "dbs")
+        self.db_paths = [make_db(self.db_dir, f"db{i}", [f"t{j}" for j in range(i + 1)]) for i in range(4)]
+        self.output_path = os.path.join(self.tmp_dir.name, "schema_stats.json")
+        self.cache_path = os.path.join(self.tmp_dir.name, "cache", "schema_stats_cache.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def analyze(self, **kwargs):
+        """Runs analyze_directory and returns (written stats, paths of the databases that were analyzed)"""
+        with mock.patch.object(fetch_schema_features, "analyze_sqlite_schema",
+                               wraps=fetch_schema_features.analyze_sqlite_schema) as analyze:
+            analyze_directory(self.db_dir, self.output_path, **kwargs)
+        with open(self.output_path) as f:
+            return json.load(f), sorted(call.args[0] for call in analyze.call_args_list)
+
+    def test_no_cache_by_default(self):
+        stats, analyzed = self.analyze()
+        self.assertEqual(stats["db2"], {"num_tables": 3, "num_columns": 6, "num_foreign_keys": 0})
+        self.assertEqual(len(analyzed), 4)
+        _, analyzed = self.analyze()
+        self.assertEqual(len(analyzed), 4)
+        self.assertFalse(os.path.exists(self.cache_path))
+
+    def test_unchanged_files_served_from_cache(self):
+        first, _ = self.analyze(cache_path=self.cache_path)
+        second, analyzed = self.analyze(cache_path=self.cache_path)
+        self.assertEqual(analyzed, [])
+        self.assertEqual(first, second)
+
+    def test_changed_files_reanalyzed(self):
+        self.analyze(cache_path=self.cache_path)
+        touched, resized = self.db_paths[0], self.db_paths[1]
+        stat = os.stat(touched)
+        os.utime(touched, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        conn = sqlite3.connect(resized)
+        conn.execute("CREATE TABLE extra (id INTEGER, parent INTEGER REFERENCES t0(id))")
+        conn.commit()
+        conn.close()
+        stats, analyzed = self.analyze(cache_path=self.cache_path)
+        self.assertEqual(analyzed, sorted(os.path.abspath(path) for path in (touched, resized)))
+        self.assertEqual(stats["db1"], {"num_tables": 3, "num_columns": 6, "num_foreign_keys": 1})
+
+    def test_parallel_matches_serial(self):
+        self.analyze(workers=1)
+        with open(self.output_path) as f:
+            serial = f.read()
+        self.analyze(workers=4)
+        with open(self.output_path) as f:
+            self.assertEqual(f.read(), serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+import pandas as pd
+from metadata_utils import link_schema_features
+from metadata_utils.link_schema_features import link_schema_stats, load_schema_stats
+
+SCHEMA_STATS = {
+    "concert_singer": {"num_tables": 4, "num_columns": 21, "num_foreign_keys": 3, "num_indexes": 1},
+    "pets_1": {"num_tables": 3, "num_columns": 11, "num_foreign_keys": 2, "num_indexes": 0},
+    "car_1": {"num_tables": 6, "num_columns": 29, "num_foreign_keys": 6, "num_indexes": 2},
+}
+
+
+def link_per_row(df, schema_stats):
+    """The per-row iloc loop link_schema_stats replaced"""
+    table_counts, col_counts, fkey_counts = [], [], []
+    for i in range(len(df)):
+        stats = schema_stats[df.iloc[i]['db_id']]
+        table_counts.append(stats['num_tables'])
+        col_counts.append(stats['num_columns'])
+        fkey_counts.append(stats['num_foreign_keys'])
+    df = df.copy()
+    df['num_tables'] = table_counts
+    df['num_columns'] = col_counts
+    df['num_foreign_keys'] = fkey_counts
+    return df
+
+
+class TestLinkSchemaStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.stats_file = os.path.join(self.tmp_dir.name, "schema_stats.json")
+        with open(self.stats_file, 'w') as f:
+            json.dump(SCHEMA_STATS, f)
+        self.stats_df = load_schema_stats(self.stats_file)
+        # repeated and interleaved db_ids under a non-default index, so a reordering merge would show
+        self.df = pd.DataFrame({'db_id': ['pets_1', 'car_1', 'concert_singer', 'pets_1', 'car_1', 'pets_1'],
+                                'question': [f"q{i}" for i in range(6)]}, index=[5, 3, 9, 0, 1, 7])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def with_unknown(self):
+        extra = pd.DataFrame({'db_id': ['flight_2', 'pets_1', 'flight_2'], 'question': ['u0', 'u1', 'u2']})
+        return pd.concat([self.df, extra], ignore_index=True)
+
+    def test_matches_per_row_output(self):
+        linked = link_schema_stats(self.df, self.stats_df)
+        expected = link_per_row(self.df, SCHEMA_STATS)
+        pd.testing.assert_frame_equal(linked[expected.columns], expected)
+        self.assertEqual(list(linked['question']), list(self.df['question']))
+        self.assertEqual(list(linked.index), list(self.df.index))
+
+    def test_extra_stats_attached(self):
+        linked = link_schema_stats(self.df, self.stats_df)
+        self.assertEqual(list(linked.columns), ['db_id', 'question', 'num_tables', 'num_columns',
+                                                'num_foreign_keys', 'num_indexes'])
+        self.assertEqual(list(linked['num_indexes']), [0, 2, 1, 0, 2, 0])
+
+    def test_existing_columns_overwritten(self):
+        df = self.df.assign(num_tables=-1)
+        linked = link_schema_stats(df, self.stats_df)
+        self.assertEqual(list(linked.columns[:3]), ['db_id', 'question', 'num_tables'])
+        self.assertEqual(list(linked['num_tables']), [3, 6, 4, 3, 6, 3])
+
+    def test_unknown_db_error(self):
+        with self.assertRaisesRegex(KeyError, "flight_2"):
+            link_schema_stats(self.with_unknown(), self.stats_df)
+        with self.assertRaises(ValueError):
+            link_schema_stats(self.df, self.stats_df, on_missing='ignore')
+
+    def test_unknown_db_keep(self):
+        df = self.with_unknown()
+        linked = link_schema_stats(df, self.stats_df, on_missing='keep')
+        self.assertEqual(list(linked['question']), list(df['question']))
+        unknown = (linked['db_id'] == 'flight_2').to_numpy()
+        self.assertTrue(linked.loc[unknown, 'num_tables'].isna().all())
+        self.assertEqual(list(linked.loc[~unknown, 'num_tables']), [3, 6, 4, 3, 6, 3, 3])
+
+    def test_unknown_db_drop(self):
+        linked = link_schema_stats(self.with_unknown(), self.stats_df, on_missing='drop')
+        self.assertEqual(list(linked['question']), [f"q{i}" for i in range(6)] + ['u1'])
+        self.assertEqual(list(linked['num_tables']), [3, 6, 4, 3, 6, 3, 3])
+
+    def test_main_writes_csv(self):
+        input_file = os.path.join(self.tmp_dir.name, "dataset.csv")
+        output_file = os.path.join(self.tmp_dir.name, "linked.csv")
+        self.df.to_csv(input_file, index=False)
+        link_schema_features.main(self.stats_file, input_file, output_file)
+        expected = link_per_row(pd.read_csv(input_file), SCHEMA_STATS)
+        linked = pd.read_csv(output_file)
+        pd.testing.assert_frame_equal(linked[expected.columns], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
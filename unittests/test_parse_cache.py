@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from evaluation import parse_cache
+from evaluation.canonical_query_representation import ColUnit, ValUnit
+from evaluation.parse_cache import ParseCache
+from evaluation.process_query import Schema
+
+
+def make_schema(columns):
+    table = {'table_names_original': ['singer'],
+             'column_names_original': [(0, col) for col in columns]}
+    return Schema({'singer': list(columns)}, table)
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, "cache", "parsed.sqlite")
+        self.schema = make_schema(['singer_id', 'name'])
+        self.calls = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def parse(self):
+        self.calls += 1
+        return {'select': (False, [ValUnit('none', ColUnit(None, self.calls, False), None)])}, None
+
+    def test_in_run_deduplication(self):
+        with ParseCache() as cache:
+            first = cache.get_or_parse('concert_singer', self.schema, "SELECT name FROM singer", self.parse)
+            second = cache.get_or_parse('concert_singer', self.schema, "SELECT name  FROM singer;", self.parse)
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+
+    def test_persists_across_runs(self):
+        with ParseCache(self.cache_path) as cache:
+            cache.get_or_parse('concert_singer', self.schema, "SELECT name FROM singer", self.parse)
+        with ParseCache(self.cache_path) as cache:
+            rep, err = cache.get_or_parse('concert_singer', self.schema, "SELECT name FROM singer", self.parse)
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(err)
+        self.assertIsInstance(rep['select'][1][0].operand1, ColUnit)
+
+    def test_schema_change_invalidates(self):
+        with ParseCache(self.cache_path) as cache:
+            cache.get_or_parse('concert_singer', self.schema, "SELECT name FROM singer", self.parse)
+        with ParseCache(self.cache_path) as cache:
+            cache.get_or_parse('concert_singer', make_schema(['name', 'singer_id']), "SELECT name FROM singer", self.parse)
+        self.assertEqual(self.calls, 2)
+
+    def test_parser_upgrade_invalidates(self):
+        with ParseCache(self.cache_path) as cache:
+            cache.get_or_parse('concert_singer', self.schema, "SELECT name FROM singer", self.parse)
+        with mock.patch.object(parse_cache.sqlglot, "__version__", "0.0.0"), ParseCache(self.cache_path) as cache:
+            cache.get_or_parse('concert_singer', self.schema, "SELECT name FROM singer", self.parse)
+        self.assertEqual(self.calls, 2)
+
+    def test_namespaces_are_separate(self):
+        with ParseCache(self.cache_path) as cache:
+            cache.get_or_parse('concert_singer', self.schema, "SELECT name FROM singer", self.parse)
+        with ParseCache(self.cache_path, 'strict_columns') as cache:
+            cache.get_or_parse('concert_singer', self.schema, "SELECT name FROM singer", self.parse)
+        self.assertEqual(self.calls, 2)
+
+    def test_uncacheable_values_not_persisted(self):
+        with ParseCache(self.cache_path) as cache:
+            cache.get_or_parse('concert_singer', self.schema, "SELECT name FROM singer", self.parse,
+                               cacheable=lambda value: False)
+        with ParseCache(self.cache_path) as cache:
+            cache.get_or_parse('concert_singer', self.schema, "SELECT name FROM singer", self.parse)
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from evaluation.pickle_store import PickleStore
+
+
+class TestPickleStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "cache", "store.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        store = PickleStore(self.path, 'entries')
+        store.store('a', ({'x': [1.0, None]}, None))
+        self.assertEqual(store.load('a'), ({'x': [1.0, None]}, None))
+        self.assertIsNone(store.load('b'))
+        store.close()
+        store = PickleStore(self.path, 'entries')
+        self.assertEqual(store.load('a'), ({'x': [1.0, None]}, None))
+        store.close()
+
+    def test_commit_batches(self):
+        store = PickleStore(self.path, 'entries', commit_every=3)
+        for i in range(2):
+            store.store(str(i), i)
+            self.assertTrue(store.in_transaction)
+        store.store('2', 2)
+        self.assertFalse(store.in_transaction)
+        store.close()
+        store = PickleStore(self.path, 'entries', commit_every=1)
+        store.store('3', 3)
+        self.assertFalse(store.in_transaction)
+        store.close()
+
+    def test_unreadable_entry_is_a_miss(self):
+        store = PickleStore(self.path, 'entries')
+        store.close()
+        conn = sqlite3.connect(self.path)
+        conn.execute("INSERT INTO entries (key, payload) VALUES ('a', x'00')")
+        conn.commit()
+        conn.close()
+        store = PickleStore(self.path, 'entries')
+        self.assertIsNone(store.load('a'))
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from canonicalized_data_format.ddl_objects import DBSchemaModel, Table
+from evaluation.process_query import (
+    AmbiguousColumnError, Schema, SchemaIndex, SQLStandardizer, build_parse_context, parse_query_ast,
+    parse_sql_query
+)
+
+
+def make_schema():
+    schema = {'singer': ['singer_id', 'name', 'age'], 'concert': ['concert_id', 'singer_id', 'year']}
+    table = {'table_names_original': ['singer', 'concert'],
+             'column_names_original': [(0, 'singer_id'), (0, 'name'), (0, 'age'),
+                                       (1, 'concert_id'), (1, 'singer_id'), (1, 'year')]}
+    return Schema(schema, table)
+
+
+def standardize(sql, schema):
+    ast = parse_query_ast(sql.lower())
+    return SQLStandardizer(sql.lower(), build_parse_context(schema, ast), ast).get_sql()
+
+
+class TestSQLStandardizer(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = make_schema()
+
+    def test_alias_resolution(self):
+        parsed = standardize("SELECT T1.name FROM singer AS T1 JOIN concert AS T2 ON T1.singer_id = T2.singer_id", self.schema)
+        _, select = parsed['select']
+        self.assertEqual(select[0].operand1.col_id, 1)
+        cond = parsed['from']['conds'][0]
+        self.assertEqual((cond.operand.operand1.col_id, cond.val1.col_id), (0, 4))
+
+    def test_nested_subquery_shares_context(self):
+        parsed = standardize("SELECT name FROM singer WHERE singer_id IN (SELECT T2.singer_id FROM concert AS T2 WHERE year > 2010)", self.schema)
+        subquery = parsed['where'][0].val1
+        self.assertEqual(subquery['select'][1][0].operand1.col_id, 4)
+        self.assertEqual(subquery['where'][0].operand.operand1.col_id, 5)
+
+    def test_unqualified_column_resolution(self):
+        sql = "SELECT name, year FROM concert JOIN singer ON concert.singer_id = singer.singer_id WHERE singer_id > 1"
+        parsed = standardize(sql, self.schema)
+        self.assertEqual([v.operand1.col_id for v in parsed['select'][1]], [1, 5])
+        # first table in scope wins unless strict resolution is requested
+        self.assertEqual(parsed['where'][0].operand.operand1.col_id, 4)
+        ast = parse_query_ast(sql.lower())
+        context = build_parse_context(self.schema, ast, strict_columns=True)
+        with self.assertRaises(AmbiguousColumnError):
+            SQLStandardizer(sql.lower(), context, ast).get_sql()
+
+    def test_parse_sql_query_aliases_from_ast(self):
+        parsed, err = parse_sql_query('SELECT T1.name FROM singer T1 JOIN concert AS T2 ON T1.singer_id = T2.singer_id '
+                                      'WHERE T2.year = "2014"', self.schema, 'concert_singer')
+        self.assertIsNone(err)
+        self.assertEqual(parsed['select'][1][0].operand1.col_id, 1)
+        self.assertEqual(parsed['where'][0].val1, 2014.0)
+
+    def test_parse_sql_query_errors(self):
+        self.assertEqual(parse_sql_query("SELECT name FROM", self.schema, 'x'), (None, "syntacticallyIncorrect"))
+        self.assertEqual(parse_sql_query("SELECT name FROM singer WHERE name = 'a", self.schema, 'x'),
+                         (None, "syntacticallyIncorrect"))
+        self.assertEqual(parse_sql_query("SELECT T3.name FROM singer AS T1", self.schema, 'x'),
+                         (None, "schemaLinkingError"))
+        self.assertEqual(parse_sql_query("SELECT name FROM band", self.schema, 'x'), (None, "schemaLinkingError"))
+        ambiguous = "SELECT singer_id FROM singer JOIN concert ON singer.singer_id = concert.singer_id"
+        self.assertIsNone(parse_sql_query(ambiguous, self.schema, 'x')[1])
+        self.assertEqual(parse_sql_query(ambiguous, self.schema, 'x', strict_columns=True), (None, "ambiguousColumn"))
+
+    def test_no_class_level_state(self):
+        standardize("SELECT name FROM singer", self.schema)
+        self.assertFalse(hasattr(SQLStandardizer, 'schema'))
+        self.assertFalse(hasattr(SQLStandardizer, 'tables_with_alias'))
+
+    def test_concurrent_parsing(self):
+        other = Schema({'concert': ['year'], 'singer': ['age']},
+                       {'table_names_original': ['concert', 'singer'],
+                        'column_names_original': [(0, 'year'), (1, 'age')]})
+        queries = [("SELECT age FROM singer", self.schema, 2), ("SELECT age FROM singer", other, 1)] * 50
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda q: standardize(q[0], q[1]), queries))
+        for (_, _, expected), parsed in zip(queries, results):
+            self.assertEqual(parsed['select'][1][0].operand1.col_id, expected)
+
+
+class TestSchemaIndex(unittest.TestCase):
+
+    def setUp(self):
+        singer = Table('Singer')
+        singer.add_attribute('Singer_ID', 'int')
+        singer.add_attribute('Name', 'text')
+        concert = Table('concert')
+        concert.add_attribute('concert_id', 'int')
+        concert.add_attribute('Singer_ID', 'int')
+        db = DBSchemaModel()
+        db.add_table(singer)
+        db.add_table(concert)
+        self.index = SchemaIndex({'concert_singer': db})
+
+    def test_schema_built_once(self):
+        schema = self.index['concert_singer']
+        self.assertIs(self.index['concert_singer'], schema)
+        self.assertEqual(schema.idMap['concert.singer_id'], 3)
+
+    def test_column_index(self):
+        schema = self.index['concert_singer']
+        self.assertEqual(schema.column_index['singer_id'], {'singer': 0, 'concert': 3})
+        self.assertEqual(schema.column_index['name'], {'singer': 1})
+
+    def test_resolve_column(self):
+        schema = self.index['concert_singer']
+        self.assertEqual(schema.resolve_column('singer_id', ['concert', 'singer']), 3)
+        self.assertEqual(schema.resolve_column('name', ['concert', 'singer']), 1)
+        self.assertIsNone(schema.resolve_column('name', ['concert']))
+        self.assertIsNone(schema.resolve_column('missing', ['singer']))
+        self.assertEqual(schema.resolve_column('singer_id', ['singer', 'singer'], strict=True), 0)
+        with self.assertRaises(AmbiguousColumnError):
+            schema.resolve_column('singer_id', ['singer', 'concert'], strict=True)
+
+    def test_star_belongs_to_no_table(self):
+        # Spider lists '*' as column 0 with table id -1
+        table = {'table_names_original': ['singer', 'concert'],
+                 'column_names_original': [(-1, '*'), (0, 'singer_id'), (0, 'name'), (1, 'singer_id')]}
+        schema = Schema({'singer': ['singer_id', 'name'], 'concert': ['singer_id']}, table)
+        self.assertNotIn('*', schema.column_index)
+        self.assertIsNone(schema.resolve_column('*', ['concert', 'singer'], strict=True))
+        self.assertEqual(schema.column_index['singer_id'], {'singer': 1, 'concert': 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from metadata_utils.query_complexity import QueryComplexity
+from metadata_utils.query_complexity import QueryComplexity, analyze_query
 
 class TestQueryComplexity(unittest.TestCase):
 
@@ -21,6 +21,18 @@ class TestQueryComplexity(unittest.TestCase):
         qc = QueryComplexity({'query': aliases_query, 'query_toks': tokens})
         self.assertEqual(qc.get_involved_tables(), 2)
 
+        unaliased_query = "SELECT count(*) FROM head WHERE age > 56"
+        qc = QueryComplexity({'query': unaliased_query, 'query_toks': unaliased_query.split()})
+        self.assertEqual(qc.get_involved_tables(), 0)
+
+    def test_query_parsed_once(self):
+        query = "SELECT name, age FROM users WHERE age > 3 ORDER BY age"
+        analyze_query.cache_clear()
+        for _ in range(3):
+            QueryComplexity({'query': query, 'query_toks': query.split()}).get_hardness_level()
+        info = analyze_query.cache_info()
+        self.assertEqual((info.misses, info.currsize), (1, 1))
+
     def test_get_num_joins(self):
         query = "SELECT * FROM A JOIN B ON A.id = B.id JOIN C ON B.id = C.id"
         tokens = query.split()
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from evaluation.result_cache import GoldResultCache, normalize_sql
+
+
+class TestGoldResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "db.sqlite")
+        self.cache_path = os.path.join(self.tmp_dir.name, "cache", "gold.sqlite")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE singer (singer_id INTEGER)")
+        conn.execute("INSERT INTO singer VALUES (1), (2)")
+        conn.commit()
+        conn.close()
+        self.calls = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def execute(self):
+        self.calls += 1
+        return self.calls, None
+
+    def test_normalize_sql(self):
+        self.assertEqual(normalize_sql("SELECT  count(*)\n FROM singer ;"), "SELECT count(*) FROM singer")
+
+    def test_in_run_deduplication(self):
+        with GoldResultCache() as cache:
+            first = cache.get_or_execute(self.db_path, "SELECT count(*) FROM singer", self.execute)
+            second = cache.get_or_execute(self.db_path, "SELECT count(*)  FROM singer", self.execute)
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+
+    def test_memo_is_bounded(self):
+        with GoldResultCache(memo_size=3) as cache:
+            for i in range(10):
+                cache.get_or_execute(self.db_path, f"SELECT {i}", self.execute)
+                self.assertLessEqual(len(cache._memo), 3)
+            # the most recently used results are kept
+            cache.get_or_execute(self.db_path, "SELECT 9", self.execute)
+            self.assertEqual(self.calls, 10)
+            cache.get_or_execute(self.db_path, "SELECT 0", self.execute)
+            self.assertEqual(self.calls, 11)
+        with GoldResultCache(memo_size=0) as cache:
+            cache.get_or_execute(self.db_path, "SELECT 1", self.execute)
+            self.assertEqual(len(cache._memo), 0)
+
+    def test_persists_across_runs(self):
+        with GoldResultCache(self.cache_path) as cache:
+            cache.get_or_execute(self.db_path, "SELECT count(*) FROM singer", self.execute)
+        with GoldResultCache(self.cache_path) as cache:
+            value = cache.get_or_execute(self.db_path, "SELECT count(*) FROM singer", self.execute)
+        self.assertEqual(value, (1, None))
+        self.assertEqual(self.calls, 1)
+
+    def test_shared_cache_commits_each_insert(self):
+        with GoldResultCache(self.cache_path, commit_every=1) as writer, GoldResultCache(self.cache_path) as reader:
+            writer.get_or_execute(self.db_path, "SELECT count(*) FROM singer", self.execute)
+            # no write transaction is left open to block other processes
+            self.assertFalse(writer._store.in_transaction)
+            value = reader.get_or_execute(self.db_path, "SELECT count(*) FROM singer", self.execute)
+        self.assertEqual(value, (1, None))
+        self.assertEqual(self.calls, 1)
+
+    def test_database_change_invalidates(self):
+        with GoldResultCache(self.cache_path) as cache:
+            cache.get_or_execute(self.db_path, "SELECT count(*) FROM singer", self.execute)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO singer VALUES (3)")
+        conn.commit()
+        conn.close()
+        with GoldResultCache(self.cache_path) as cache:
+            value = cache.get_or_execute(self.db_path, "SELECT count(*) FROM singer", self.execute)
+        self.assertEqual(value, (2, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import itertools
+import sqlite3
+import unittest
+import numpy as np
+import pandas as pd
+from evaluation.result_sets import fetch_result, match_result_sets, to_record_array, RowResult
+
+
+class TestMatchResultSets(unittest.TestCase):
+
+    def test_unordered_ignores_row_and_column_order(self):
+        gold = pd.DataFrame({"name": ["Joe", "Ann", "Bo"], "cnt": [1, 2, 2]})
+        pred = pd.DataFrame({"c": [2, 1, 2], "n": ["Ann", "Joe", "Bo"]})
+        self.assertTrue(match_result_sets(gold, pred))
+
+    def test_unordered_respects_multiplicity(self):
+        gold = pd.DataFrame({"a": [1, 1, 2]})
+        pred = pd.DataFrame({"a": [1, 2, 2]})
+        self.assertFalse(match_result_sets(gold, pred))
+
+    def test_unordered_numeric_types(self):
+        gold = pd.DataFrame({"a": [1, 2]})
+        pred = pd.DataFrame({"a": [2.0, 1.0]})
+        self.assertTrue(match_result_sets(gold, pred))
+
+    def test_nulls_compare_equal(self):
+        gold = pd.DataFrame({"a": ["x", None]})
+        pred = pd.DataFrame({"a": [None, "x"]})
+        self.assertTrue(match_result_sets(gold, pred))
+        self.assertTrue(match_result_sets(pd.DataFrame({"a": [np.nan, 1.0]}), pd.DataFrame({"a": [1.0, np.nan]})))
+
+    def test_order_sensitive(self):
+        gold = pd.DataFrame({"a": [1, 2], "b": ["x", "y"]})
+        self.assertTrue(match_result_sets(gold, pd.DataFrame({"b": ["x", "y"], "a": [1, 2]}), order_sensitive=True))
+        self.assertFalse(match_result_sets(gold, pd.DataFrame({"a": [2, 1], "b": ["y", "x"]}), order_sensitive=True))
+
+    def test_duplicate_column_names(self):
+        gold = pd.DataFrame([[1, 2], [3, 4]], columns=["a", "a"])
+        pred = pd.DataFrame([[2, 1], [4, 3]], columns=["x", "y"])
+        self.assertTrue(match_result_sets(gold, pred))
+
+    def test_shape_mismatch(self):
+        self.assertFalse(match_result_sets(pd.DataFrame({"a": [1]}), pd.DataFrame({"a": [1], "b": [2]})))
+
+    def test_row_results(self):
+        gold = RowResult(["name", "cnt"], [("Joe", 1), ("Ann", 2), (None, 2)])
+        self.assertTrue(match_result_sets(gold, RowResult(["c", "n"], [(2, None), (1, "Joe"), (2.0, "Ann")])))
+        self.assertFalse(match_result_sets(gold, RowResult(["c", "n"], [(2, None), (1, "Joe"), (1, "Ann")])))
+        self.assertFalse(match_result_sets(gold, RowResult(["n", "c"], [("Ann", 2), ("Joe", 1), (None, 2)]),
+                                           order_sensitive=True))
+
+    def test_record_arrays(self):
+        gold = to_record_array(["name", "cnt"], [("Joe", 1), ("Ann", 2)])
+        pred = to_record_array(["c", "n"], [(2, "Ann"), (1, "Joe")])
+        self.assertTrue(match_result_sets(gold, pred))
+        self.assertFalse(match_result_sets(gold, pred, order_sensitive=True))
+
+    def test_result_formats_agree(self):
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        values = ['1', '1.0', '1.5', 'NULL', "'1'"]
+
+        def fetch(column):
+            query = " UNION ALL ".join(f"SELECT {value} AS x" for value in column)
+            results = {'dataframe': pd.read_sql_query(query, conn)}
+            for result_format in ('rows', 'records'):
+                cursor = conn.execute(query)
+                results[result_format] = fetch_result(cursor, result_format)
+            return results
+
+        results = [fetch(column) for column in itertools.product(values, repeat=2)]
+        for gold, pred in itertools.product(results, repeat=2):
+            for order_sensitive in (False, True):
+                matches = {match_result_sets(gold[f], pred[f], order_sensitive) for f in gold}
+                self.assertEqual(len(matches), 1, (gold['rows'], pred['rows'], order_sensitive))
+        # integer and float columns with equal values only match when row order is ignored
+        ints, floats = fetch(('1', '2')), fetch(('1.0', '2.0'))
+        self.assertTrue(match_result_sets(ints['rows'], floats['rows']))
+        self.assertFalse(match_result_sets(ints['rows'], floats['rows'], order_sensitive=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from evaluation.score_table import ParquetScoreWriter, ScoredPair, flatten_scored, read_score_table
+from evaluation.structural_evaluate import handle_set_op_mismatch
+from unittests.test_average_partial_accuracies import make_scores
+
+
+class TestScoreTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.scores = [make_scores(i / 10, where=0.5 if i % 2 else None, limit=1.0 if i % 3 else None)
+                       for i in range(10)] + [handle_set_op_mismatch()]
+        self.scored = [ScoredPair(2 * i, f"db{i % 3}", f"q{i}", scores) for i, scores in enumerate(self.scores)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_parquet(self, row_group_size):
+        path = os.path.join(self.tmp_dir.name, "scores.parquet")
+        with ParquetScoreWriter(path, row_group_size=row_group_size) as writer:
+            writer.write(self.scored[:4])
+            writer.write(self.scored[4:])
+        return path
+
+    def test_parquet_round_trip(self):
+        import pyarrow.parquet as pq
+        path = self.write_parquet(row_group_size=3)
+        self.assertEqual(pq.ParquetFile(path).num_row_groups, 4)
+        flat = read_score_table(path)
+        pd.testing.assert_frame_equal(flat, flatten_scored(self.scored))
+        self.assertEqual(list(flat['row']), list(range(0, 22, 2)))
+        self.assertEqual(flat['db_id'].iloc[4], "db1")
+
+    def test_parquet_reads_selected_keys(self):
+        flat = read_score_table(self.write_parquet(row_group_size=100), keys=['where-conditions'])
+        self.assertEqual(list(flat.columns.get_level_values(0).unique()),
+                         ['where-conditions', 'set_op_mismatch', 'row', 'db_id'])
+        self.assertTrue(np.isnan(flat[('where-conditions', 'f1')].iloc[0]))
+        self.assertEqual(flat[('where-conditions', 'precision')].iloc[1], 0.5)
+
+    def test_csv_matches_parquet(self):
+        path = os.path.join(self.tmp_dir.name, "scores.csv")
+        pd.DataFrame({'row': [pair.row for pair in self.scored], 'db_id': [pair.db_id for pair in self.scored],
+                      'Question': [pair.question for pair in self.scored],
+                      'Scores': [json.dumps(pair.scores) for pair in self.scored]}).to_csv(path, index=False)
+        pd.testing.assert_frame_equal(read_score_table(path),
+                                      read_score_table(self.write_parquet(row_group_size=100)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import unittest
+from itertools import islice
+from unittest import mock
+import pandas as pd
+from evaluation.execution_evaluate import (
+    convert_dataset_to_dicts, evaluate_execution, evaluate_models, iter_dataset_samples, load_model_samples,
+    output_results_to_csv
+)
+from evaluation.stream_execution_eval import evaluate_execution_streaming
+from evaluation.strat_execution_eval import (
+    DEFAULT_STRATA, SAMPLE_ID, Stratum, compare_stratified_accuracies, generate_stratified_accuracies,
+    load_joined_results, load_strata, stratify
+)
+from metadata_utils import tag_features
+from preprocess.tokenize_query import OFFLINE_ENV_VAR
+
+
+def make_metadata(n=8):
+    return pd.DataFrame({
+        SAMPLE_ID: range(n),
+        'db_id': ['a', 'b'] * (n // 2),
+        'question': [f"q{i}" for i in range(n)],
+        'hardness': ['easy', 'hard', 'medium', 'easy'] * (n // 4),
+        'num_joins': [0, 1, 0, 2] * (n // 4),
+        'num_agg': [0] * n,
+        'num_where_conditions': [1, 0] * (n // 2),
+        'has_subquery': [False, True] * (n // 2),
+        'query_length': [5, 15, 25, 12] * (n // 4),
+        'num_tables': [1, 2] * (n // 2),
+        'num_columns': [8, 30] * (n // 2),
+        'num_foreign_keys': [1, 3] * (n // 2),
+    })
+
+
+class TestStratifiedAccuracies(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.metadata_csv = os.path.join(self.tmp_dir.name, "metadata.csv")
+        self.results_csv = os.path.join(self.tmp_dir.name, "results.csv")
+        self.metadata = make_metadata()
+        self.results = pd.DataFrame({SAMPLE_ID: self.metadata[SAMPLE_ID], 'db_id': self.metadata['db_id'],
+                                     'correct': [True, False, True, True, False, False, True, False],
+                                     'gold_error': None, 'pred_error': None})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, metadata, results):
+        metadata.to_csv(self.metadata_csv, index=False)
+        results.to_csv(self.results_csv, index=False)
+
+    def test_matches_groupby(self):
+        self.write(self.metadata, self.results)
+        accuracies, df = generate_stratified_accuracies(self.metadata_csv, self.results_csv)
+        self.assertEqual(set(accuracies), {stratum.name for stratum in DEFAULT_STRATA})
+        self.assertNotIn('question', df.columns)
+        for stratum in DEFAULT_STRATA:
+            if stratum.bins is not None or stratum.categories is not None:
+                continue
+            expected = df.groupby(stratum.column)['exec_accuracy'].agg(['size', 'mean'])
+            table = accuracies[stratum.name]
+            self.assertEqual(list(table['count']), list(expected['size']))
+            self.assertEqual(list(table['accuracy']), list(expected['mean']))
+        hardness = accuracies['acc_by_hardness']
+        self.assertEqual(list(hardness.index), ['easy', 'medium', 'hard', 'extra'])
+        self.assertEqual(list(hardness['count']), [4, 2, 2, 0])
+        self.assertTrue(math.isnan(hardness.loc['extra', 'accuracy']))
+        self.assertEqual(list(accuracies['acc_by_subqquery'].index), [0, 1])
+        length = accuracies['acc_by_query_length']
+        self.assertEqual(list(length['count']), [2, 4, 2, 0])
+
+    def test_joins_on_sample_id(self):
+        self.write(self.metadata, self.results.iloc[::-1])
+        shuffled, _ = generate_stratified_accuracies(self.metadata_csv, self.results_csv)
+        self.write(self.metadata, self.results)
+        aligned, _ = generate_stratified_accuracies(self.metadata_csv, self.results_csv)
+        for name, table in aligned.items():
+            pd.testing.assert_frame_equal(shuffled[name], table)
+        # files without sample ids are never joined on row position
+        self.write(self.metadata, self.results.drop(columns=SAMPLE_ID))
+        with self.assertRaisesRegex(ValueError, SAMPLE_ID):
+            load_joined_results(self.metadata_csv, self.results_csv)
+
+    def test_misaligned_files_raise(self):
+        self.write(self.metadata, self.results.iloc[:-1])
+        with self.assertRaises(ValueError):
+            load_joined_results(self.metadata_csv, self.results_csv)
+        self.write(self.metadata, self.results.assign(**{SAMPLE_ID: self.results[SAMPLE_ID] + 1}))
+        with self.assertRaises(ValueError):
+            load_joined_results(self.metadata_csv, self.results_csv)
+        self.write(self.metadata, self.results.assign(db_id=self.results['db_id'][::-1].to_numpy()))
+        with self.assertRaises(ValueError):
+            load_joined_results(self.metadata_csv, self.results_csv)
+
+    def test_configured_strata_and_intervals(self):
+        config_path = os.path.join(self.tmp_dir.name, "strata.json")
+        with open(config_path, 'w') as f:
+            json.dump([{"name": "by_length", "column": "query_length", "bins": [0, 20, 100]},
+                       {"name": "by_db", "column": "db_id"}], f)
+        strata = load_strata(config_path)
+        self.assertEqual(strata[0], Stratum('by_length', 'query_length', bins=(0, 20, 100)))
+        self.write(self.metadata, self.results)
+        df = load_joined_results(self.metadata_csv, self.results_csv, strata)
+        accuracies = stratify(df, strata, confidence=0.95)
+        by_db = accuracies['by_db']
+        self.assertEqual(list(by_db['count']), [4, 4])
+        self.assertEqual(list(by_db['accuracy']), [0.75, 0.25])
+        self.assertTrue((by_db['ci_low'] < by_db['accuracy']).all() and (by_db['accuracy'] < by_db['ci_high']).all())
+        with open(config_path, 'w') as f:
+            json.dump([{"name": "by_db", "column": "db_id", "bins": [0, 1], "buckets": 3}], f)
+        with self.assertRaises(ValueError):
+            load_strata(config_path)
+
+    def test_bootstrap_intervals(self):
+        self.write(self.metadata, self.results)
+        first, df = generate_stratified_accuracies(self.metadata_csv, self.results_csv, confidence=0.9,
+                                                   method='bootstrap', resamples=200, seed=3)
+        again, _ = generate_stratified_accuracies(self.metadata_csv, self.results_csv, confidence=0.9,
+                                                  method='bootstrap', resamples=200, seed=3)
+        for name, table in first.items():
+            pd.testing.assert_frame_equal(table, again[name])
+            scored = table['count'] > 0
+            self.assertTrue((table['ci_low'][scored] <= table['accuracy'][scored]).all())
+            self.assertTrue((table['accuracy'][scored] <= table['ci_high'][scored]).all())
+            self.assertTrue(table['ci_low'][~scored].isna().all())
+        with self.assertRaises(ValueError):
+            stratify(df, confidence=0.9, method='jackknife')
+
+    def test_compare_results(self):
+        self.write(self.metadata, self.results)
+        other_csv = os.path.join(self.tmp_dir.name, "other.csv")
+        self.results.assign(correct=True).to_csv(other_csv, index=False)
+        comparisons = compare_stratified_accuracies(self.metadata_csv, self.results_csv, other_csv, resamples=200)
+        overall = comparisons['overall']
+        self.assertEqual(list(overall['count']), [8])
+        self.assertEqual(list(overall['accuracy_b']), [1.0])
+        self.assertAlmostEqual(overall['delta'].iloc[0], -0.5)
+        self.assertLess(overall['p_value'].iloc[0], 0.05)
+        by_db = compare_stratified_accuracies(self.metadata_csv, self.results_csv, other_csv,
+                                              [Stratum('by_db', 'db_id')], resamples=200)['by_db']
+        self.assertEqual(list(by_db['delta']), [-0.25, -0.75])
+
+
+
+class TestProducedSampleIds(unittest.TestCase):
+    """The tagged metadata and every execution result writer carry the dataset row as sample_id"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "dbs")
+        for db_id in ("concert_singer", "pets_1"):
+            os.makedirs(os.path.join(self.db_dir, db_id))
+            conn = sqlite3.connect(os.path.join(self.db_dir, db_id, f"{db_id}.sqlite"))
+            conn.execute("CREATE TABLE singer (singer_id INTEGER, name TEXT, age INTEGER)")
+            conn.execute("INSERT INTO singer VALUES (1, 'Joe', 30), (2, 'Ann', 25)")
+            conn.commit()
+            conn.close()
+        self.dataset = os.path.join(self.tmp_dir.name, "dataset.csv")
+        pd.DataFrame({
+            'db_id': ['concert_singer', 'pets_1', 'pets_1', 'concert_singer', 'pets_1'],
+            'question': [f"q{i}" for i in range(5)],
+            'query': ["SELECT name FROM singer", "SELECT count(*) FROM singer",
+                      "SELECT T1.name FROM singer AS T1 JOIN singer AS T2 ON T1.singer_id = T2.singer_id",
+                      "SELECT name FROM singer ORDER BY age", "SELECT age FROM singer WHERE age > 26"],
+            'pred_query': ["SELECT name FROM singer", "SELECT count(name) FROM singer", "SELECT nme FROM singer",
+                           "SELECT name FROM singer ORDER BY age DESC", "SELECT age FROM singer"],
+        }).to_csv(self.dataset, index=False)
+        self.metadata_csv = os.path.join(self.tmp_dir.name, "dataset_with_metadata.csv")
+        with mock.patch.dict(os.environ, {OFFLINE_ENV_VAR: "1"}):
+            tag_features.main(self.dataset, self.metadata_csv, True)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assert_joins_when_shuffled(self, results_csv):
+        strata = [Stratum('by_hardness', 'hardness')]
+        expected = load_joined_results(self.metadata_csv, results_csv, strata)
+        self.assertEqual(list(expected[SAMPLE_ID]), list(range(5)))
+        pd.read_csv(results_csv).sample(frac=1, random_state=0).to_csv(results_csv, index=False)
+        joined = load_joined_results(self.metadata_csv, results_csv, strata)
+        pd.testing.assert_frame_equal(joined.sort_values(SAMPLE_ID, ignore_index=True), expected)
+
+    def test_batch_results(self):
+        results_csv = os.path.join(self.tmp_dir.name, "batch.csv")
+        _, results = evaluate_execution(convert_dataset_to_dicts(self.dataset), self.db_dir, 'sqlite', False)
+        output_results_to_csv(results_csv, results)
+        self.assertEqual(list(pd.read_csv(self.metadata_csv)[SAMPLE_ID]), list(range(5)))
+        self.assert_joins_when_shuffled(results_csv)
+
+    def test_resumed_stream_results(self):
+        results_csv = os.path.join(self.tmp_dir.name, "stream.csv")
+        evaluate_execution_streaming(islice(iter_dataset_samples(self.dataset, chunksize=2), 3), results_csv,
+                                     self.db_dir, 'sqlite', False)
+        evaluate_execution_streaming(iter_dataset_samples(self.dataset, chunksize=2), results_csv, self.db_dir,
+                                     'sqlite', False, workers=2, resume=True)
+        self.assert_joins_when_shuffled(results_csv)
+
+    def test_model_results(self):
+        models, samples = load_model_samples(self.dataset, ['pred_query', 'query'])
+        _, results = evaluate_models(samples, models, self.db_dir, 'sqlite', False)
+        self.assertEqual([result[SAMPLE_ID] for result in results], list(range(5)))
+        # each model's column stratifies like a single-model results file
+        results_csv = os.path.join(self.tmp_dir.name, "models.csv")
+        pd.DataFrame(results).rename(columns={'query_correct': 'correct', 'query_pred_error': 'pred_error'}) \
+            .to_csv(results_csv, index=False)
+        self.assert_joins_when_shuffled(results_csv)
+
+
+if __name__ == '__main__':
+    unittest.main()
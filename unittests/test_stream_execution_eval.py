@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from evaluation import execution_evaluate
+from evaluation.execution_evaluate import evaluate_execution, output_results_to_csv
+from evaluation.result_cache import GoldResultCache
+from evaluation.stream_execution_eval import evaluate_execution_streaming, ResultStreamWriter
+
+
+class TestStreamingExecution(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = self.tmp_dir.name
+        os.makedirs(os.path.join(self.db_dir, "concert_singer"))
+        conn = sqlite3.connect(os.path.join(self.db_dir, "concert_singer", "concert_singer.sqlite"))
+        conn.execute("CREATE TABLE singer (singer_id INTEGER, name TEXT, age INTEGER)")
+        conn.execute("INSERT INTO singer VALUES (1, 'Joe', 30), (2, 'Ann', 25)")
+        conn.commit()
+        conn.close()
+        self.samples = [
+            {"db_id": "concert_singer", "gold": "SELECT count(*) FROM singer", "pred": "SELECT count(name) FROM singer"},
+            {"db_id": "concert_singer", "gold": "SELECT name FROM singer", "pred": "SELECT nme FROM singer"},
+            {"db_id": "concert_singer", "gold": "SELECT age FROM singer", "pred": "SELECT age FROM singer"},
+        ]
+        self.output_path = os.path.join(self.tmp_dir.name, "results.csv")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def expected_csv(self, log_resultsets):
+        expected_path = os.path.join(self.tmp_dir.name, "expected.csv")
+        _, results = evaluate_execution(self.samples, self.db_dir, 'sqlite', log_resultsets)
+        output_results_to_csv(expected_path, results)
+        with open(expected_path) as f:
+            return f.read()
+
+    def test_matches_in_memory_output(self):
+        for log_resultsets in (False, True):
+            accuracy = evaluate_execution_streaming(self.samples, self.output_path, self.db_dir, 'sqlite', log_resultsets)
+            self.assertAlmostEqual(accuracy, 2 / 3)
+            with open(self.output_path) as f:
+                self.assertEqual(f.read(), self.expected_csv(log_resultsets))
+
+    def test_gold_memo_stays_bounded(self):
+        caches = []
+
+        def make_cache(*args):
+            caches.append(GoldResultCache(*args))
+            return caches[-1]
+
+        samples = [{"db_id": "concert_singer", "gold": f"SELECT {i} FROM singer", "pred": f"SELECT {i}"}
+                   for i in range(20)]
+        with mock.patch.object(execution_evaluate, "GoldResultCache", side_effect=make_cache):
+            evaluate_execution_streaming(samples, self.output_path, self.db_dir, 'sqlite', False, gold_memo_size=4)
+        self.assertEqual(len(caches), 1)
+        self.assertEqual(caches[0].memo_size, 4)
+        self.assertLessEqual(len(caches[0]._memo), 4)
+
+    def test_resume_after_interruption(self):
+        evaluate_execution_streaming(self.samples[:2], self.output_path, self.db_dir, 'sqlite', True)
+        with open(self.output_path, 'a') as f:
+            f.write("concert_singer,Tr")  # torn row written after the last checkpoint
+        accuracy = evaluate_execution_streaming(self.samples, self.output_path, self.db_dir, 'sqlite', True,
+                                                resume=True)
+        self.assertAlmostEqual(accuracy, 2 / 3)
+        with open(self.output_path) as f:
+            self.assertEqual(f.read(), self.expected_csv(True))
+
+    def test_resume_rejects_different_columns(self):
+        evaluate_execution_streaming(self.samples[:1], self.output_path, self.db_dir, 'sqlite', False)
+        with self.assertRaises(ValueError):
+            evaluate_execution_streaming(self.samples, self.output_path, self.db_dir, 'sqlite', True, resume=True)
+
+    def test_writer_checkpoints(self):
+        writer = ResultStreamWriter(self.output_path, checkpoint_every=2)
+        for correct in (True, False, True):
+            writer.write({"db_id": "x", "correct": correct})
+        # never closed: only the first two rows are covered by the checkpoint
+        resumed = ResultStreamWriter(self.output_path, resume=True)
+        self.assertEqual((resumed.completed, resumed.correct), (2, 1))
+        resumed.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
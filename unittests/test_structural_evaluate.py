@@ -0,0 +1,188 @@
+import json
+import math
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from canonicalized_data_format.ddl_objects import DBSchemaModel, Table
+from evaluation.average_partial_accuracies import aggregate_score_file_by_group
+from evaluation.canonical_query_representation import ColUnit, ValUnit
+from evaluation.process_query import SchemaIndex, parse_sql_query
+from evaluation.score_table import flatten_scores, read_score_table
+from evaluation.structural_evaluate import (
+    EqualityMemo, _compare_sql_components, compare_sql_components, evaluate_dataset, optimal_structural_match,
+    unordered_structural_match
+)
+from metadata_utils import tag_features
+from preprocess.tokenize_query import OFFLINE_ENV_VAR
+
+
+def make_schemas():
+    singer = Table('singer')
+    for col in ('singer_id', 'name', 'age'):
+        singer.add_attribute(col, 'int')
+    concert = Table('concert')
+    for col in ('concert_id', 'singer_id', 'year'):
+        concert.add_attribute(col, 'int')
+    schema = DBSchemaModel()
+    schema.add_table(singer)
+    schema.add_table(concert)
+    return {'concert_singer': schema}
+
+
+def parse(sql):
+    parsed, err = parse_sql_query(sql, SchemaIndex(make_schemas())['concert_singer'], 'concert_singer')
+    assert err is None, err
+    return parsed
+
+
+PAIRS = [
+    ("SELECT name FROM singer", "SELECT name FROM singer"),
+    ("SELECT count(*) FROM singer WHERE age > 30", "SELECT count(singer_id) FROM singer WHERE age > 30"),
+    ("SELECT name FROM singer ORDER BY age DESC LIMIT 1", "SELECT name FROM singer ORDER BY age LIMIT 1"),
+    ("SELECT name FROM singer", "SELEC name FROM"),
+    ("SELECT T1.name FROM singer AS T1 JOIN concert AS T2 ON T1.singer_id = T2.singer_id",
+     "SELECT name FROM singer WHERE singer_id IN (SELECT singer_id FROM concert)"),
+]
+
+
+class TestEvaluateDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dataset = os.path.join(self.tmp_dir.name, "dataset.csv")
+        rows = [{'db_id': 'concert_singer', 'question': f"q{i}", 'query': gold, 'pred_query': pred}
+                for i, (gold, pred) in enumerate(PAIRS * 3)]
+        pd.DataFrame(rows).to_csv(self.dataset, index=False)
+        self.schemas = make_schemas()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_eval(self, name, **kwargs):
+        scores_file = os.path.join(self.tmp_dir.name, f"{name}_scores.csv")
+        errors_file = os.path.join(self.tmp_dir.name, f"{name}_errors.json")
+        scores = evaluate_dataset(self.dataset, scores_file, errors_file, self.schemas, **kwargs)
+        with open(errors_file) as f:
+            counts = json.load(f)
+        with open(scores_file) as f:
+            return scores, counts, f.read()
+
+    def test_parallel_matches_serial(self):
+        serial = self.run_eval("serial")
+        parallel = self.run_eval("parallel", workers=2, chunksize=4)
+        self.assertEqual(serial, parallel)
+        scores, counts, _ = serial
+        self.assertEqual(len(scores), 12)
+        self.assertEqual(counts, {"unhandled": 0, "schemaLinkingError": 0, "syntacticallyIncorrect": 3, "other": 0})
+        self.assertEqual(scores[0]['select']['select']['f1'], 1.0)
+
+    def test_scores_keep_input_order(self):
+        self.run_eval("parallel", workers=2, chunksize=2)
+        df = pd.read_csv(os.path.join(self.tmp_dir.name, "parallel_scores.csv"))
+        order = [int(q[1:]) for q in df['Question']]
+        self.assertEqual(order, sorted(order))
+        # rows are the pairs' positions in the dataset, skipping the ones that failed to parse
+        self.assertEqual(list(df['row']), order)
+
+    def test_strict_columns(self):
+        ambiguous = "SELECT singer_id FROM singer JOIN concert ON singer.singer_id = concert.singer_id"
+        pd.DataFrame([{'db_id': 'concert_singer', 'question': 'q0', 'query': ambiguous, 'pred_query': ambiguous},
+                      {'db_id': 'concert_singer', 'question': 'q1', 'query': PAIRS[0][0], 'pred_query': ambiguous}]
+                     ).to_csv(self.dataset, index=False)
+        cache_path = os.path.join(self.tmp_dir.name, "parsed.sqlite")
+        scores, counts, _ = self.run_eval("lenient", parse_cache_path=cache_path)
+        self.assertEqual(len(scores), 2)
+        # the error type is only reported with strict_columns
+        self.assertNotIn("ambiguousColumn", counts)
+        # the gold representations cached by the lenient run are not reused by the strict one
+        for workers in (1, 2):
+            scores, counts, _ = self.run_eval(f"strict_{workers}", parse_cache_path=cache_path, strict_columns=True,
+                                              workers=workers, chunksize=1)
+            self.assertEqual(scores, [])
+            self.assertEqual(counts["ambiguousColumn"], 3)
+
+    def test_group_by_tagged_features(self):
+        metadata_file = os.path.join(self.tmp_dir.name, "dataset_with_metadata.csv")
+        with mock.patch.dict(os.environ, {OFFLINE_ENV_VAR: "1"}):
+            tag_features.main(self.dataset, metadata_file, True)
+        hardness = pd.read_csv(metadata_file)['hardness']
+        self.run_eval("grouped")
+        scores_file = os.path.join(self.tmp_dir.name, "grouped_scores.csv")
+        grouped = aggregate_score_file_by_group(scores_file, ['hardness'], metadata_file)
+        # the unparsable pairs are skipped, so each label must come from the pair's own row
+        scored_rows = pd.read_csv(scores_file)['row']
+        self.assertEqual(sorted(grouped['hardness']), sorted(set(hardness[scored_rows])))
+        with self.assertRaises(KeyError):
+            aggregate_score_file_by_group(scores_file, ['hardness'], self.dataset)
+
+    def test_parquet_scores_match_csv(self):
+        import pyarrow.parquet as pq
+        scores, _, _ = self.run_eval("csv")
+        csv_flat = read_score_table(os.path.join(self.tmp_dir.name, "csv_scores.csv"))
+        pd.testing.assert_frame_equal(csv_flat.drop(columns=['row', 'db_id'], level=0), flatten_scores(scores))
+        for workers in (1, 2):
+            parquet_file = os.path.join(self.tmp_dir.name, f"scores_{workers}.parquet")
+            returned = evaluate_dataset(self.dataset, parquet_file, os.path.join(self.tmp_dir.name, "errors.json"),
+                                        self.schemas, workers=workers, chunksize=4, score_format='parquet')
+            self.assertIsNone(returned)
+            # one row group per chunk, also when scoring serially
+            self.assertEqual(pq.ParquetFile(parquet_file).num_row_groups, math.ceil(len(PAIRS) * 3 / 4))
+            pd.testing.assert_frame_equal(read_score_table(parquet_file), csv_flat)
+        with self.assertRaises(ValueError):
+            self.run_eval("json", score_format='json')
+
+
+class TestMemoizedEquality(unittest.TestCase):
+
+    def test_node_ids_are_structural(self):
+        memo = EqualityMemo()
+        a = ValUnit('none', ColUnit('count', 3, False), None)
+        b = ValUnit('none', ColUnit('count', 3, False), None)
+        self.assertEqual(memo.node_id(a), memo.node_id(b))
+        self.assertEqual(memo.node_id({'x': [1.0], 'y': None}), memo.node_id({'y': None, 'x': [1.0]}))
+        self.assertNotEqual(memo.node_id(ValUnit('none', 1, None)), memo.node_id(ValUnit('none', 1.0, None)))
+        self.assertNotEqual(memo.node_id(a), memo.node_id(tuple(a)))
+
+    def test_memoized_scores_match_unmemoized(self):
+        nested = ("SELECT name FROM singer WHERE singer_id IN (SELECT singer_id FROM concert WHERE year IN "
+                  "(SELECT year FROM concert WHERE concert_id > 1)) AND age IN (SELECT age FROM singer WHERE age > 2)")
+        pairs = [
+            (nested, nested),
+            (nested, nested.replace("concert_id > 1", "concert_id > 2")),
+            ("SELECT name FROM singer WHERE age > 3 OR age < 1", "SELECT name FROM singer WHERE 1 > age OR age > 3"),
+            ("SELECT name FROM singer INTERSECT SELECT name FROM singer WHERE age > 1",
+             "SELECT name FROM singer INTERSECT SELECT name FROM singer WHERE age > 1"),
+        ]
+        for gold_sql, pred_sql in pairs:
+            gold, pred = parse(gold_sql), parse(pred_sql)
+            self.assertEqual(compare_sql_components(gold, pred), _compare_sql_components(gold, pred))
+
+
+class TestOptimalMatching(unittest.TestCase):
+
+    # 'ab' matches both 'a' and 'b'; greedy pairs it with 'a' first and leaves gold 'a' unmatched
+    EQUAL = staticmethod(lambda gold, pred: pred in gold)
+
+    def test_optimal_beats_greedy(self):
+        gold, pred = ['ab', 'a'], ['a', 'b']
+        self.assertEqual(unordered_structural_match(gold, pred, self.EQUAL), (1, 2, 2))
+        self.assertEqual(optimal_structural_match(gold, pred, self.EQUAL), (2, 2, 2))
+
+    def test_optimal_is_order_independent(self):
+        gold, pred = ['ab', 'a', 'c', 'c'], ['c', 'b', 'a', 'd']
+        expected = optimal_structural_match(gold, pred, self.EQUAL)
+        self.assertEqual(expected, (3, 4, 4))
+        self.assertEqual(optimal_structural_match(gold[::-1], pred[::-1], self.EQUAL), expected)
+
+    def test_compare_sql_components_matching_flag(self):
+        gold = parse("SELECT name, age FROM singer WHERE age > 3 AND name = 'x'")
+        pred = parse("SELECT age, name FROM singer WHERE name = 'x' AND 3 < age")
+        self.assertEqual(compare_sql_components(gold, pred, 'optimal'), compare_sql_components(gold, pred))
+        with self.assertRaises(ValueError):
+            compare_sql_components(gold, pred, 'fuzzy')
+
+
+if __name__ == '__main__':
+    unittest.main()
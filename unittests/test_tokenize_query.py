@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+import nltk
+from preprocess import tokenize_query
+from preprocess.tokenize_query import fallback_word_tokenize, load_word_tokenizer, tokenize
+
+
+class TestTokenizeQuery(unittest.TestCase):
+
+    def tearDown(self):
+        tokenize_query._word_tokenize = None
+
+    def test_fallback_word_tokenize(self):
+        self.assertEqual(fallback_word_tokenize("SELECT count(*) FROM singer AS T1 WHERE T1.age >= 3.5"),
+                         ['SELECT', 'count', '(', '*', ')', 'FROM', 'singer', 'AS', 'T1', 'WHERE', 'T1.age',
+                          '>', '=', '3.5'])
+
+    def test_tokenize_with_fallback(self):
+        tokenize_query._word_tokenize = fallback_word_tokenize
+        tokens = tokenize("SELECT name FROM singer WHERE country != 'France' AND age >= 20")
+        self.assertEqual(tokens, ['select', 'name', 'from', 'singer', 'where', 'country', '!=', '"France"',
+                                  'and', 'age', '>=', '20'])
+
+    def test_import_has_no_side_effects(self):
+        code = "import sys, preprocess.tokenize_query; print('nltk' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "False")
+
+    def test_offline_mode_never_downloads(self):
+        with mock.patch.dict(os.environ, {tokenize_query.OFFLINE_ENV_VAR: "1"}), \
+                mock.patch.object(nltk, "download") as download, \
+                mock.patch.object(nltk.data, "find", side_effect=LookupError):
+            self.assertIs(load_word_tokenizer(), fallback_word_tokenize)
+        download.assert_not_called()
+
+    def test_failed_download_falls_back(self):
+        with mock.patch.dict(os.environ, {tokenize_query.OFFLINE_ENV_VAR: "0"}), \
+                mock.patch.object(nltk, "download", side_effect=OSError("no network")), \
+                mock.patch.object(nltk.data, "find", side_effect=LookupError):
+            self.assertIs(load_word_tokenizer(), fallback_word_tokenize)
+
+
+if __name__ == '__main__':
+    unittest.main()